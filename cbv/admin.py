@@ -11,3 +11,4 @@ admin.site.register(models.KlassAttribute)
 admin.site.register(models.ModuleAttribute)
 admin.site.register(models.Method)
 admin.site.register(models.Function)
+admin.site.register(models.Source)
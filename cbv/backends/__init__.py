@@ -0,0 +1,5 @@
+"""
+Database backends that keep their connections open between requests; see
+cbv.backends.pool. Named after the Django backends they wrap, which is what
+Django and South go by.
+"""
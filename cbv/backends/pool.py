@@ -0,0 +1,195 @@
+"""
+Database connections kept open from one request to the next.
+
+Django 1.5 connects to the database for every request, and closes the
+connection when the request finishes. The backends in cbv.backends wrap
+Django's own. When one of their connections is closed, they roll back
+whatever it left open and keep it in a pool for their process. The next
+cursor, in whatever thread, picks the connection up from the pool rather
+than connecting again.
+
+A database's POOL settings are a dict of:
+
+    SIZE         How many idle connections a process keeps (default 1). A
+                 gunicorn sync worker serves one request at a time, so it
+                 needs one; a threaded one needs one per thread.
+    MAX_AGE      Seconds a connection is used for before it's closed rather
+                 than kept (default 600), so none outlives a database restart
+                 or a change of settings for long.
+    CHECK_AFTER  A connection idle for longer than this many seconds is checked
+                 with SELECT 1 before it's used again (default 10); one that
+                 fails is closed, and the next one tried.
+
+A connection that can't be rolled back is closed rather than kept. So is a
+connection opened before a fork, which the parent might still use. SQLite
+databases in memory, such as the test database, aren't pooled.
+"""
+import os
+import threading
+import time
+
+
+DEFAULTS = {
+    'SIZE': 1,
+    'MAX_AGE': 600,
+    'CHECK_AFTER': 10,
+}
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class PooledConnection(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.released = time.time()
+
+
+class ConnectionPool(object):
+    """ The idle connections to a database, for every thread of a process """
+
+    def __init__(self, size, max_age, check_after):
+        self.size = size
+        self.max_age = max_age
+        self.check_after = check_after
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.idle = []
+        # Connections of the process this one was forked from; kept, but
+        # never used or closed, as closing them would close them for it too.
+        self.inherited = []
+        self.counts = dict.fromkeys(('created', 'reused', 'expired', 'failed', 'overflowed'), 0)
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def forked(self):
+        """ Whether this is a new process; call with the lock held """
+        if self.pid == os.getpid():
+            return False
+        self.inherited += self.idle
+        self.idle = []
+        self.pid = os.getpid()
+        return True
+
+    def get(self, check):
+        """ The latest idle connection that's young enough and passes `check`, or None """
+        while True:
+            with self.lock:
+                self.forked()
+                if not self.idle:
+                    return None
+                pooled = self.idle.pop()
+            now = time.time()
+            if now - pooled.created >= self.max_age:
+                self.count('expired')
+                close_quietly(pooled.connection)
+            elif now - pooled.released >= self.check_after and not check(pooled.connection):
+                self.count('failed')
+                close_quietly(pooled.connection)
+            else:
+                self.count('reused')
+                return pooled
+
+    def put(self, pooled):
+        """ Keep a connection that's done with, if there's room for it """
+        pooled.released = time.time()
+        with self.lock:
+            if not self.forked() and len(self.idle) < self.size and pooled.released - pooled.created < self.max_age:
+                self.idle.append(pooled)
+                return
+            outcome = 'expired' if pooled.released - pooled.created >= self.max_age else 'overflowed'
+            self.counts[outcome] += 1
+        close_quietly(pooled.connection)
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            close_quietly(pooled.connection)
+
+    def as_dict(self):
+        with self.lock:
+            return dict(self.counts, size=self.size, idle=len(self.idle))
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """ The pool for a database's settings, or None if it's not to be pooled """
+    options = dict(DEFAULTS, **settings_dict.get('POOL', {}))
+    if not options['SIZE'] or settings_dict['NAME'] == ':memory:':
+        return None
+    key = alias, settings_dict['NAME'], settings_dict.get('HOST'), settings_dict.get('PORT'), settings_dict.get('USER')
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is None:
+            pool = pools[key] = ConnectionPool(options['SIZE'], options['MAX_AGE'], options['CHECK_AFTER'])
+        return pool
+
+
+def get_stats():
+    """ The counts of every pool of this process, by database alias """
+    with pools_lock:
+        items = pools.items()
+    return dict((key[0], pool.as_dict()) for key, pool in items)
+
+
+class PooledDatabaseWrapperMixin(object):
+    """ For a backend's DatabaseWrapper, to take its connections from a pool """
+    pooled = None
+
+    def get_pool(self):
+        # Not kept: the test runner renames the database after connecting.
+        return get_pool(self.alias, self.settings_dict)
+
+    def is_usable(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def reuse_connection(self):
+        """ Bring a connection from the pool in line with this wrapper """
+
+    def _cursor(self):
+        pool = self.get_pool()
+        if self.connection is None and pool is not None:
+            self.pooled = pool.get(self.is_usable)
+            if self.pooled is not None:
+                self.connection = self.pooled.connection
+                self.reuse_connection()
+        cursor = super(PooledDatabaseWrapperMixin, self)._cursor()
+        if self.pooled is None and pool is not None:
+            pool.count('created')
+            self.pooled = PooledConnection(self.connection)
+        return cursor
+
+    def close(self):
+        pool = self.get_pool()
+        if pool is None or self.pooled is None:
+            return super(PooledDatabaseWrapperMixin, self).close()
+        self.validate_thread_sharing()
+        pooled, self.pooled, self.connection = self.pooled, None, None
+        try:
+            pooled.connection.rollback()
+        except Exception:
+            pool.count('failed')
+            close_quietly(pooled.connection)
+        else:
+            pool.put(pooled)
+        # Either way, nothing is left to commit, as Django's own close would
+        # leave it; set_clean complains outside transaction management.
+        if self._dirty is not None:
+            self.set_clean()
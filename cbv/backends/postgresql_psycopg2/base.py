@@ -0,0 +1,9 @@
+from django.db.backends.postgresql_psycopg2 import base
+
+from cbv.backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def reuse_connection(self):
+        # Transaction management may have left another isolation level set.
+        self.connection.set_isolation_level(self.isolation_level)
@@ -0,0 +1,184 @@
+"""
+Timing the Klass methods the class page is built from, on made-up class
+hierarchies of any size.
+
+Each shape is built with the factories under a version of its own:
+
+    chain       `size` classes, each the only parent of the next
+    fanout      a root with `size` children, and a leaf inheriting from all of them
+    diamonds    `size` diamonds stacked one on another
+    members     a chain of five classes with `size` methods and `size / 2`
+                attributes between them, every name defined in each class
+
+Every operation is timed on a fresh instance (they cache on the instance),
+so each run starts cold, and its queries are counted.
+
+Mind the depth: `get_methods` and `get_attributes` OR together the querysets
+of every ancestor, each of which has done the same, so the query grows
+exponentially with the length of the MRO. A chain of 10 takes a third of a
+second; one of 11 takes minutes. An operation the database gives up on (as
+SQLite does on four stacked diamonds) is reported with its error.
+"""
+import time
+
+from django.db import DatabaseError, transaction
+from django.db.models import Count
+
+from cbv import instrumentation
+from cbv.factories import (InheritanceFactory, KlassAttributeFactory, KlassFactory,
+    MethodFactory, ModuleFactory, ProjectVersionFactory)
+from cbv.models import Klass
+from cbv.templatetags.cbv_tags import namesake_methods
+
+
+# Every class in every shape gets a few members, with names shared along the MRO.
+METHODS_PER_KLASS = 3
+ATTRIBUTES_PER_KLASS = 2
+MEMBERS_CHAIN = 5
+
+
+def add_members(klass, methods=METHODS_PER_KLASS, attributes=ATTRIBUTES_PER_KLASS):
+    for i in xrange(methods):
+        MethodFactory.create(klass=klass, name='method{0}'.format(i), line_number=i + 1)
+    for i in xrange(attributes):
+        KlassAttributeFactory.create(klass=klass, name='attribute{0}'.format(i), value=repr(klass.name))
+
+
+def inherit(child, *parents):
+    for order, parent in enumerate(parents):
+        InheritanceFactory.create(child=child, parent=parent, order=order)
+
+
+def build_chain(module, size):
+    """ (the class to time ancestors and members on, the one to time children on) """
+    klasses = []
+    for i in xrange(size):
+        klass = KlassFactory.create(module=module)
+        add_members(klass)
+        if klasses:
+            inherit(klass, klasses[-1])
+        klasses.append(klass)
+    return klasses[-1], klasses[0]
+
+
+def build_fanout(module, size):
+    root = KlassFactory.create(module=module)
+    add_members(root)
+    children = []
+    for i in xrange(size):
+        child = KlassFactory.create(module=module)
+        add_members(child)
+        inherit(child, root)
+        children.append(child)
+    leaf = KlassFactory.create(module=module)
+    add_members(leaf)
+    inherit(leaf, *children)
+    return leaf, root
+
+
+def build_diamonds(module, size):
+    top = bottom = KlassFactory.create(module=module)
+    add_members(top)
+    for i in xrange(size):
+        left = KlassFactory.create(module=module)
+        right = KlassFactory.create(module=module)
+        add_members(left)
+        add_members(right)
+        inherit(left, bottom)
+        inherit(right, bottom)
+        bottom = KlassFactory.create(module=module)
+        add_members(bottom)
+        inherit(bottom, left, right)
+    return bottom, top
+
+
+def build_members(module, size):
+    methods = max(size // MEMBERS_CHAIN, 1)
+    klasses = []
+    for i in xrange(MEMBERS_CHAIN):
+        klass = KlassFactory.create(module=module)
+        add_members(klass, methods=methods, attributes=max(methods // 2, 1))
+        if klasses:
+            inherit(klass, klasses[-1])
+        klasses.append(klass)
+    return klasses[-1], klasses[0]
+
+
+SHAPES = {
+    'chain': build_chain,
+    'fanout': build_fanout,
+    'diamonds': build_diamonds,
+    'members': build_members,
+}
+
+
+def all_namesakes(klass):
+    names = sorted(set(method.name for method in klass.get_methods()))
+    return [namesake_methods(klass, name) for name in names]
+
+
+# (name, which class it's timed on, what to time).
+OPERATIONS = (
+    ('get_all_ancestors', 'leaf', lambda klass: klass.get_all_ancestors()),
+    ('get_all_children', 'root', lambda klass: list(klass.get_all_children())),
+    ('get_methods', 'leaf', lambda klass: list(klass.get_methods())),
+    ('get_prepared_attributes', 'leaf', lambda klass: list(klass.get_prepared_attributes())),
+    ('basic_yuml_data', 'leaf', lambda klass: klass.basic_yuml_data(first=True)),
+    ('namesake_methods', 'leaf', all_namesakes),
+)
+
+
+def time_operation(operation, pk, repeat):
+    """ The query count and times in ms of `repeat` cold runs """
+    times = []
+    queries = None
+    for i in xrange(repeat):
+        klass = Klass.objects.select_related('module__project_version__project').get(pk=pk)
+        savepoint = transaction.savepoint()
+        with instrumentation.recording() as recorder:
+            start = time.time()
+            try:
+                operation(klass)
+            except DatabaseError as e:
+                transaction.savepoint_rollback(savepoint)
+                return {'queries': recorder.queries, 'error': unicode(e)}
+            times.append((time.time() - start) * 1000)
+        transaction.savepoint_commit(savepoint)
+        queries = recorder.queries
+    times.sort()
+    return {
+        'queries': queries,
+        'min_ms': times[0],
+        'median_ms': times[len(times) // 2],
+    }
+
+
+def run(shape, size, repeat=3, operations=None):
+    """
+    Build a shape and time the operations on it. Run inside a transaction
+    that gets rolled back, unless the classes are wanted afterwards.
+    """
+    start = time.time()
+    module = ModuleFactory.create(
+        project_version=ProjectVersionFactory.create(version_number='benchmark-{0}-{1}'.format(shape, size)),
+    )
+    leaf, root = SHAPES[shape](module, size)
+    built = time.time() - start
+    targets = {'leaf': leaf.pk, 'root': root.pk}
+
+    counts = Klass.objects.filter(module=module).aggregate(
+        methods=Count('method', distinct=True), attributes=Count('attribute_set', distinct=True))
+    result = {
+        'shape': shape,
+        'size': size,
+        'klasses': Klass.objects.filter(module=module).count(),
+        'methods': counts['methods'],
+        'attributes': counts['attributes'],
+        'build_seconds': built,
+        'operations': {},
+    }
+    for name, target, operation in OPERATIONS:
+        if operations and name not in operations:
+            continue
+        result['operations'][name] = time_operation(operation, targets[target], repeat)
+    return result
@@ -0,0 +1,135 @@
+"""
+A gzipped JSON file per version, holding every module and class, with each
+class's MRO, method signatures and attributes.
+
+Bundles are named after the sha1 of their contents, so a bundle's URL never
+serves anything else and can be cached forever. There is one bundle per
+version on disk; writing a new one removes the old.
+"""
+import collections
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+from cbv.models import Inheritance, Klass, KlassAttribute, Method, Module
+from cbv.resolution import get_mro
+
+
+FILENAME_RE = re.compile(r'^[\w.-]+-[0-9a-f]{16}\.json\.gz$')
+HASH_RE = re.compile(r'^[0-9a-f]{16}\.json\.gz$')
+
+
+def get_root():
+    return settings.CBV_BUNDLE_ROOT
+
+
+def get_prefix(project_version):
+    return '{0}-{1}-'.format(project_version.project.name, project_version.version_number)
+
+
+def build_bundle(project_version):
+    """ The contents of a version's bundle, from five queries """
+    klasses = collections.OrderedDict(
+        (klass['pk'], klass) for klass in Klass.objects.filter(
+            module__project_version=project_version,
+        ).order_by('module__name', 'name').values(
+            'pk', 'name', 'module', 'docstring', 'import_path', 'line_number', 'docs_url')
+    )
+    modules = collections.OrderedDict(
+        (module['pk'], module) for module in Module.objects.filter(
+            project_version=project_version,
+        ).order_by('name').values('pk', 'name', 'docstring', 'filename')
+    )
+    parents = collections.defaultdict(list)
+    for child, parent in Inheritance.objects.filter(
+            child__module__project_version=project_version,
+    ).order_by('order').values_list('child', 'parent'):
+        parents[child].append(parent)
+    methods = collections.defaultdict(list)
+    for method in Method.objects.filter(
+            klass__module__project_version=project_version,
+    ).order_by('name').values('klass', 'name', 'kwargs', 'docstring', 'line_number'):
+        methods[method.pop('klass')].append(method)
+    attributes = collections.defaultdict(list)
+    for attribute in KlassAttribute.objects.filter(
+            klass__module__project_version=project_version,
+    ).order_by('name').values('klass', 'name', 'value', 'line_number'):
+        attributes[attribute.pop('klass')].append(attribute)
+
+    qualified_names = dict(
+        (pk, modules[klass['module']]['name'] + '.' + klass['name']) for pk, klass in klasses.items())
+
+    for module in modules.values():
+        module['classes'] = []
+    for pk, klass in klasses.items():
+        module = modules[klass.pop('module')]
+        klass.update({
+            'url': reverse('klass-detail', kwargs={
+                'package': project_version.project.name,
+                'version': project_version.version_number,
+                'module': module['name'],
+                'klass': klass['name'],
+            }),
+            'parents': [qualified_names[parent] for parent in parents[pk]],
+            'mro': [qualified_names[ancestor] for ancestor in get_mro(pk, parents)],
+            'methods': methods[pk],
+            'attributes': attributes[pk],
+        })
+        del klass['pk']
+        module['classes'].append(klass)
+    for module in modules.values():
+        del module['pk']
+
+    return {
+        'project': project_version.project.name,
+        'version': project_version.version_number,
+        'modules': modules.values(),
+    }
+
+
+def write_bundle(project_version):
+    """ Write a version's bundle, remove any older one, and return its path """
+    root = get_root()
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    data = json.dumps(build_bundle(project_version), sort_keys=True)
+    prefix = get_prefix(project_version)
+    filename = os.path.join(root, prefix + hashlib.sha1(data).hexdigest()[:16] + '.json.gz')
+
+    if not os.path.exists(filename):
+        handle, partial = tempfile.mkstemp(dir=root, suffix='.part')
+        with os.fdopen(handle, 'wb') as f:
+            # No timestamp in the header, so the same data gives the same bytes.
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0) as compressed:
+                compressed.write(data)
+        os.chmod(partial, 0644)
+        os.rename(partial, filename)
+    for old in get_bundles(project_version):
+        if old != filename:
+            os.remove(old)
+    return filename
+
+
+def get_bundles(project_version):
+    root = get_root()
+    if not os.path.isdir(root):
+        return []
+    prefix = get_prefix(project_version)
+    return [
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith(prefix) and HASH_RE.match(name[len(prefix):])
+    ]
+
+
+def get_bundle(project_version):
+    """ The path of a version's bundle, written first if there isn't one """
+    bundles = get_bundles(project_version)
+    if bundles:
+        return bundles[0]
+    return write_bundle(project_version)
@@ -0,0 +1,103 @@
+"""
+What changed in a class between two versions.
+
+The methods and attributes a class ends up with (its own, or the first found
+along its MRO) are compared by content hash (for a method, the key of its
+Source), so only the bodies of methods that did change are ever read.
+"""
+import difflib
+
+from cbv.models import KlassAttribute, Method, Source
+from cbv.resolution import get_graph, get_mro
+
+
+def get_members(klass):
+    """
+    The MRO (as class names) and the effective methods and attributes of a
+    class, each {name: row}, where the row says which class defines it.
+    """
+    klasses, parents, children = get_graph(klass.module.project_version)
+    mro = get_mro(klass.pk, parents)
+    position = dict((pk, i) for i, pk in enumerate([klass.pk] + mro))
+
+    def effective(rows):
+        members = {}
+        for row in sorted(rows, key=lambda row: position[row['klass']]):
+            if row['name'] not in members:
+                row['klass'] = klasses[row.pop('klass')]['name']
+                members[row['name']] = row
+        return members
+
+    methods = list(Method.objects.filter(klass__in=list(position)).values(
+        'name', 'kwargs', 'line_number', 'source', 'klass'))
+    for method in methods:
+        method['content_hash'] = method.pop('source')
+    methods = effective(methods)
+    attributes = effective(KlassAttribute.objects.filter(klass__in=list(position)).values(
+        'name', 'value', 'content_hash', 'klass'))
+    return [klasses[pk]['name'] for pk in mro], methods, attributes
+
+
+def compare(old, new, fields):
+    """ Added, removed and changed members, and how many stayed the same """
+    def pick(row):
+        return dict((field, row[field]) for field in fields)
+
+    changed = []
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name], new[name]
+        if before['content_hash'] != after['content_hash'] or before['klass'] != after['klass']:
+            changed.append({
+                'name': name,
+                'old': pick(before),
+                'new': pick(after),
+                'content_changed': before['content_hash'] != after['content_hash'],
+            })
+    return {
+        'added': [pick(new[name]) for name in sorted(set(new) - set(old))],
+        'removed': [pick(old[name]) for name in sorted(set(old) - set(new))],
+        'changed': changed,
+        'unchanged': len(set(old) & set(new)) - len(changed),
+    }
+
+
+def diff_klasses(old, new):
+    """ How a class differs between two versions, as plain data """
+    old_mro, old_methods, old_attributes = get_members(old)
+    new_mro, new_methods, new_attributes = get_members(new)
+
+    methods = compare(old_methods, new_methods, ('name', 'klass', 'kwargs', 'line_number'))
+    # Only the methods whose code changed are read, to show how.
+    changed = [m for m in methods['changed'] if m['content_changed']]
+    hashes = [old_methods[m['name']]['content_hash'] for m in changed] + [
+        new_methods[m['name']]['content_hash'] for m in changed]
+    code = dict(Source.objects.filter(pk__in=hashes).values_list('pk', 'code'))
+    for method in changed:
+        method['diff'] = ''.join(difflib.unified_diff(
+            code[old_methods[method['name']]['content_hash']].splitlines(True),
+            code[new_methods[method['name']]['content_hash']].splitlines(True),
+            '{0} {1}'.format(old.module.project_version.version_number, method['old']['klass']),
+            '{0} {1}'.format(new.module.project_version.version_number, method['new']['klass']),
+        ))
+
+    return {
+        'name': new.name,
+        'old': version_data(old),
+        'new': version_data(new),
+        'mro': {
+            'old': old_mro,
+            'new': new_mro,
+            'added': [name for name in new_mro if name not in old_mro],
+            'removed': [name for name in old_mro if name not in new_mro],
+        },
+        'methods': methods,
+        'attributes': compare(old_attributes, new_attributes, ('name', 'klass', 'value')),
+    }
+
+
+def version_data(klass):
+    return {
+        'version': klass.module.project_version.version_number,
+        'module': klass.module.name,
+        'url': klass.get_absolute_url(),
+    }
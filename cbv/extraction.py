@@ -0,0 +1,966 @@
+"""
+Static extraction of CBV data from python source trees.
+
+Unlike `populate_cbv`, which imports `django.views.generic` and walks it with
+`inspect`, the `SourceExtractor` here only ever reads and parses `.py` files
+with `ast`. That means any Django release can be ingested from an unpacked
+source tree, whatever version happens to be installed.
+
+Both paths (and the fixtures) can be turned into an `Extraction`, a plain
+collection of records keyed by natural keys, so their output can be compared
+with `compare_extractions`.
+"""
+import __builtin__
+import __future__
+import ast
+import collections
+import inspect
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import time
+from contextlib import closing
+
+
+ModuleRecord = collections.namedtuple('ModuleRecord', 'name docstring filename')
+KlassRecord = collections.namedtuple(
+    'KlassRecord', 'module name docstring line_number import_path')
+MethodRecord = collections.namedtuple(
+    'MethodRecord', 'module klass name docstring code kwargs line_number')
+FunctionRecord = collections.namedtuple(
+    'FunctionRecord', 'module name docstring code kwargs line_number')
+KlassAttributeRecord = collections.namedtuple(
+    'KlassAttributeRecord', 'module klass name value line_number')
+ModuleAttributeRecord = collections.namedtuple(
+    'ModuleAttributeRecord', 'module name value line_number')
+InheritanceRecord = collections.namedtuple(
+    'InheritanceRecord', 'parent_module parent child_module child order')
+
+# Stands in for values that only exist at runtime (eg. `logging.getLogger()`).
+UNKNOWN_VALUE = '<unknown>'
+
+BANNED_ATTR_NAMES = (
+    '__all__',
+    '__builtins__',
+    '__class__',
+    '__dict__',
+    '__doc__',
+    '__file__',
+    '__module__',
+    '__name__',
+    '__package__',
+    '__path__',
+    '__weakref__',
+)
+
+
+class Extraction(object):
+    """ The records describing a single version of a project """
+
+    def __init__(self, version_number=None):
+        self.version_number = version_number
+        self.modules = []
+        self.klasses = []
+        self.methods = []
+        self.functions = []
+        self.klass_attributes = []
+        self.module_attributes = []
+        self.inheritance = []
+
+    @classmethod
+    def from_project_version(cls, project_version):
+        from cbv import models
+
+        extraction = cls(project_version.version_number)
+        modules = models.Module.objects.filter(project_version=project_version)
+        for module in modules:
+            extraction.modules.append(ModuleRecord(
+                module.name, module.docstring, module.filename))
+        klasses = models.Klass.objects.filter(
+            module__project_version=project_version).select_related('module')
+        for klass in klasses:
+            extraction.klasses.append(KlassRecord(
+                klass.module.name, klass.name, klass.docstring,
+                klass.line_number, klass.import_path))
+        methods = models.Method.objects.filter(
+            klass__module__project_version=project_version,
+        ).select_related('klass__module', 'source')
+        for method in methods:
+            extraction.methods.append(MethodRecord(
+                method.klass.module.name, method.klass.name, method.name,
+                method.docstring, method.code, method.kwargs,
+                method.line_number))
+        functions = models.Function.objects.filter(
+            module__project_version=project_version).select_related('module', 'source')
+        for function in functions:
+            extraction.functions.append(FunctionRecord(
+                function.module.name, function.name, function.docstring,
+                function.code, function.kwargs, function.line_number))
+        attributes = models.KlassAttribute.objects.filter(
+            klass__module__project_version=project_version,
+        ).select_related('klass__module')
+        for attr in attributes:
+            extraction.klass_attributes.append(KlassAttributeRecord(
+                attr.klass.module.name, attr.klass.name, attr.name,
+                attr.value, attr.line_number))
+        attributes = models.ModuleAttribute.objects.filter(
+            module__project_version=project_version).select_related('module')
+        for attr in attributes:
+            extraction.module_attributes.append(ModuleAttributeRecord(
+                attr.module.name, attr.name, attr.value, attr.line_number))
+        inheritance = models.Inheritance.objects.filter(
+            child__module__project_version=project_version,
+        ).select_related('parent__module', 'child__module')
+        for relation in inheritance:
+            extraction.inheritance.append(InheritanceRecord(
+                relation.parent.module.name, relation.parent.name,
+                relation.child.module.name, relation.child.name,
+                relation.order))
+        return extraction
+
+    @classmethod
+    def from_fixture(cls, fixture):
+        """ Read the records back out of a `cbv_dumpversion` fixture file """
+        with open(fixture) as f:
+            objects = json.load(f)
+        sources = read_fixture_sources(fixture)
+
+        extraction = cls()
+        for obj in objects:
+            model, fields = obj['model'], obj['fields']
+            if model == 'cbv.projectversion':
+                extraction.version_number = fields['version_number']
+            elif model == 'cbv.module':
+                extraction.modules.append(ModuleRecord(
+                    fields['name'], fields['docstring'], fields['filename']))
+            elif model == 'cbv.klass':
+                extraction.klasses.append(KlassRecord(
+                    fields['module'][0], fields['name'], fields['docstring'],
+                    fields['line_number'], fields['import_path']))
+            elif model == 'cbv.method':
+                extraction.methods.append(MethodRecord(
+                    fields['klass'][1], fields['klass'][0], fields['name'],
+                    fields['docstring'], get_fixture_code(fields, sources), fields['kwargs'],
+                    fields['line_number']))
+            elif model == 'cbv.function':
+                extraction.functions.append(FunctionRecord(
+                    fields['module'][0], fields['name'], fields['docstring'],
+                    get_fixture_code(fields, sources), fields['kwargs'], fields['line_number']))
+            elif model == 'cbv.klassattribute':
+                extraction.klass_attributes.append(KlassAttributeRecord(
+                    fields['klass'][1], fields['klass'][0], fields['name'],
+                    fields['value'], fields['line_number']))
+            elif model == 'cbv.moduleattribute':
+                extraction.module_attributes.append(ModuleAttributeRecord(
+                    fields['module'][0], fields['name'], fields['value'],
+                    fields['line_number']))
+            elif model == 'cbv.inheritance':
+                extraction.inheritance.append(InheritanceRecord(
+                    fields['parent'][1], fields['parent'][0],
+                    fields['child'][1], fields['child'][0], fields['order']))
+        return extraction
+
+    def save(self, project_version):
+        """ Create the model instances for these records under project_version """
+        from cbv import models
+
+        modules = {}
+        for record in self.modules:
+            modules[record.name] = models.Module.objects.create(
+                project_version=project_version,
+                name=record.name,
+                docstring=record.docstring,
+                filename=record.filename,
+            )
+        klasses = {}
+        for record in self.klasses:
+            klasses[record.module, record.name] = models.Klass.objects.create(
+                module=modules[record.module],
+                name=record.name,
+                docstring=record.docstring,
+                line_number=record.line_number,
+                import_path=record.import_path,
+            )
+        sources = models.Source.objects.add(
+            [record.code for record in self.methods] + [record.code for record in self.functions])
+        models.Method.objects.bulk_create([
+            models.Method(
+                klass=klasses[record.module, record.klass],
+                name=record.name,
+                docstring=record.docstring,
+                source_id=sources[record.code],
+                kwargs=record.kwargs,
+                line_number=record.line_number,
+            ) for record in self.methods
+        ])
+        models.Function.objects.bulk_create([
+            models.Function(
+                module=modules[record.module],
+                name=record.name,
+                docstring=record.docstring,
+                source_id=sources[record.code],
+                kwargs=record.kwargs,
+                line_number=record.line_number,
+            ) for record in self.functions
+        ])
+        models.KlassAttribute.objects.bulk_create([
+            models.KlassAttribute(
+                klass=klasses[record.module, record.klass],
+                name=record.name,
+                value=record.value,
+                line_number=record.line_number,
+                content_hash=models.get_content_hash(record.value),
+            ) for record in self.klass_attributes
+        ])
+        models.ModuleAttribute.objects.bulk_create([
+            models.ModuleAttribute(
+                module=modules[record.module],
+                name=record.name,
+                value=record.value,
+                line_number=record.line_number,
+            ) for record in self.module_attributes
+        ])
+        models.Inheritance.objects.bulk_create([
+            models.Inheritance(
+                parent=klasses[record.parent_module, record.parent],
+                child=klasses[record.child_module, record.child],
+                order=record.order,
+            ) for record in self.inheritance
+        ])
+
+
+def _normalise_value(value):
+    # Runtime reprs contain memory addresses, which never match.
+    return re.sub(r' at 0x[0-9a-fA-F]+', '', value)
+
+
+def _values_match(expected, actual):
+    if UNKNOWN_VALUE in (expected, actual):
+        return True
+    return _normalise_value(expected) == _normalise_value(actual)
+
+
+def compare_extractions(expected, actual):
+    """
+    Return a list of human readable differences between two extractions.
+
+    Attribute values that can only be known at runtime are matched on name.
+    """
+    record_types = (
+        ('module', 'modules', ('name',)),
+        ('class', 'klasses', ('module', 'name')),
+        ('method', 'methods', ('module', 'klass', 'name')),
+        ('function', 'functions', ('module', 'name')),
+        ('class attribute', 'klass_attributes', ('module', 'klass', 'name')),
+        ('module attribute', 'module_attributes', ('module', 'name')),
+        ('inheritance', 'inheritance', ('child_module', 'child', 'order')),
+    )
+    differences = []
+    for label, attr, key_fields in record_types:
+        def _key(record):
+            return tuple(getattr(record, field) for field in key_fields)
+        expected_records = dict((_key(r), r) for r in getattr(expected, attr))
+        actual_records = dict((_key(r), r) for r in getattr(actual, attr))
+
+        for key in sorted(set(expected_records) | set(actual_records)):
+            name = '.'.join(str(k) for k in key)
+            if key not in actual_records:
+                differences.append('missing {0} {1}'.format(label, name))
+                continue
+            if key not in expected_records:
+                differences.append('unexpected {0} {1}'.format(label, name))
+                continue
+            expected_record, actual_record = expected_records[key], actual_records[key]
+            for field in expected_record._fields:
+                if field in key_fields:
+                    continue
+                expected_value = getattr(expected_record, field)
+                actual_value = getattr(actual_record, field)
+                if field == 'value':
+                    if _values_match(expected_value, actual_value):
+                        continue
+                elif expected_value == actual_value:
+                    continue
+                differences.append('{0} {1}: {2} {3!r} != {4!r}'.format(
+                    label, name, field, expected_value, actual_value))
+    return differences
+
+
+# The code of the methods and functions of the fixtures beside it, which
+# refer to it by content hash.
+FIXTURE_SOURCES = 'sources.json'
+
+
+def get_fixture_source(fields):
+    """
+    The content hash of the Source a fixture method or function refers to,
+    or None if its code is inline, as in older dumps and snapshots.
+    """
+    source = fields.get('source')
+    if isinstance(source, basestring):
+        return source
+    return None
+
+
+def get_fixture_code(fields, sources=None):
+    """
+    The code of a fixture method or function: inline, as a Source's natural
+    key or (dumped before Source) as its own field, or looked up by content
+    hash in `sources`, a dict of hash to code.
+    """
+    content_hash = get_fixture_source(fields)
+    if content_hash is not None:
+        return sources[content_hash]
+    if 'source' in fields:
+        return fields['source'][0]
+    return fields['code']
+
+
+def read_fixture_sources(filename):
+    """ {content hash: code} of the sources file beside a fixture, if there is one """
+    path = os.path.join(os.path.dirname(os.path.abspath(filename)), FIXTURE_SOURCES)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return dict((obj['pk'], obj['fields']['code']) for obj in json.load(f))
+
+
+def in_module(name, module_name):
+    """ Whether `name` is module_name or inside it: a.b.c is in a.b, a.bc isn't """
+    return name == module_name or name.startswith(module_name + '.')
+
+
+def reset_project_version(version_number, project_name='Django'):
+    """ Delete any existing data for a version, and create it afresh """
+    from cbv.models import Inheritance, Project, ProjectVersion, Source
+
+    # Delete ALL of the things.
+    ProjectVersion.objects.filter(
+        project__name__iexact=project_name,
+        version_number=version_number,
+    ).delete()
+    Inheritance.objects.filter(
+        parent__module__project_version__project__name__iexact=project_name,
+        parent__module__project_version__version_number=version_number,
+    ).delete()
+    Source.objects.delete_unused()
+
+    return ProjectVersion.objects.create(
+        project=Project.objects.get_or_create(name=project_name)[0],
+        version_number=version_number,
+    )
+
+
+def find_source_root(path, package='django'):
+    """
+    Find the directory `package` lives in, given either that directory, the
+    package itself, or something above it (eg. where an sdist was unpacked).
+    """
+    path = os.path.abspath(path)
+    if os.path.basename(path) == package and os.path.isfile(os.path.join(path, '__init__.py')):
+        return os.path.dirname(path)
+    for dirpath, dirnames, filenames in os.walk(path):
+        if os.path.isfile(os.path.join(dirpath, package, '__init__.py')):
+            return dirpath
+        dirnames.sort()
+    raise ValueError('No {0} package found in {1}'.format(package, path))
+
+
+def extract_source(path, target='django.views.generic', short_version=False):
+    """
+    Extract the records from a source tree or a source tarball (sdist).
+
+    Touches neither the database nor the installed package, so it is safe to
+    run in a worker process.
+    """
+    targets = (target,) if isinstance(target, basestring) else target
+    package = targets[0].split('.')[0]
+    if os.path.isdir(path):
+        root = find_source_root(path, package)
+        return SourceExtractor(root, target).extract(get_source_version(root, package, short_version))
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with closing(tarfile.open(path)) as tar:
+            members = [
+                m for m in tar.getmembers()
+                if m.isfile() and m.name.endswith('.py') and
+                not os.path.isabs(m.name) and '..' not in m.name.split('/')
+            ]
+            tar.extractall(tmp, members)
+        return extract_source(tmp, target, short_version)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def get_source_version(root, package='django', short=False):
+    """
+    Work out the version number of the package without importing it.
+
+    With `short`, only major.minor is returned, as used by the fixtures.
+    """
+    tree = _parse(os.path.join(root, package, '__init__.py'))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and _assigned_names(node) == ['VERSION']:
+            version = ast.literal_eval(node.value)
+            break
+    else:
+        raise ValueError('No VERSION found in {0}'.format(package))
+
+    if short:
+        return '{0}.{1}'.format(*version[:2])
+    parts = 2 if version[2] == 0 else 3
+    main = '.'.join(str(x) for x in version[:parts])
+    if version[3] in ('final', 'alpha') and version[4] == 0:
+        return main
+    mapping = {'alpha': 'a', 'beta': 'b', 'rc': 'c'}
+    return main + mapping.get(version[3], version[3]) + str(version[4])
+
+
+def _parse(filename):
+    with open(filename, 'rU') as f:
+        source = f.read()
+    return ast.parse(source, filename)
+
+
+def _assigned_names(node):
+    return [t.id for t in node.targets if isinstance(t, ast.Name)]
+
+
+def _dotted_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted_name(node.value)
+        if base is not None:
+            return base + '.' + node.attr
+    return None
+
+
+def _to_unicode(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    if isinstance(value, list):
+        return [_to_unicode(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_to_unicode(v) for v in value)
+    if isinstance(value, dict):
+        return dict((_to_unicode(k), _to_unicode(v)) for k, v in value.items())
+    return value
+
+
+class SourceModule(object):
+    """ A parsed source file and the names it binds at module level """
+
+    def __init__(self, name, filename):
+        self.name = name
+        self.filename = filename
+        with open(filename, 'rU') as f:
+            self.lines = f.readlines()
+        self.tree = ast.parse(''.join(self.lines), filename)
+        self.unicode_literals = False
+        # name -> node that (last) binds it at module level.
+        self.bindings = collections.OrderedDict()
+        self._collect(self.tree.body)
+
+    def _collect(self, body):
+        for node in body:
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
+                self.bindings[node.name] = node
+            elif isinstance(node, ast.Assign):
+                for name in _assigned_names(node):
+                    self.bindings[name] = node
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                if isinstance(node, ast.ImportFrom) and node.module == '__future__':
+                    if any(a.name == 'unicode_literals' for a in node.names):
+                        self.unicode_literals = True
+                for alias in node.names:
+                    if alias.name == '*':
+                        continue
+                    name = alias.asname or alias.name.split('.')[0]
+                    self.bindings[name] = (node, alias)
+            elif isinstance(node, ast.If):
+                self._collect(node.body)
+                self._collect(node.orelse)
+            elif isinstance(node, ast.TryExcept):
+                self._collect(node.body)
+                self._collect(node.orelse)
+            elif isinstance(node, ast.TryFinally):
+                self._collect(node.body)
+
+    def literal(self, node):
+        value = ast.literal_eval(node)
+        if self.unicode_literals:
+            value = _to_unicode(value)
+        return value
+
+    def klass_line_number(self, node):
+        # Matches inspect.findsource, which looks for the `class` line itself.
+        pattern = re.compile(r'^(\s*)class\s*' + node.name + r'\b')
+        for i in range(node.lineno - 1, len(self.lines)):
+            if pattern.match(self.lines[i]):
+                return i + 1
+        return node.lineno
+
+    def source_lines(self, node):
+        """ The lines of a class or def and its first line, as getsourcelines sees them """
+        if isinstance(node, ast.ClassDef):
+            start = self.klass_line_number(node)
+        else:
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        return inspect.getblock(self.lines[start - 1:]), start
+
+    def block(self, node):
+        """ The dedented source and first line of a def """
+        lines, start = self.source_lines(node)
+        whitespace = len(lines[0]) - len(lines[0].lstrip())
+        return ''.join(line[whitespace:] for line in lines), start
+
+    def index(self):
+        """
+        Map the qualified names of classes, methods and functions defined at
+        the top of this file to `(start, end, lines)`.
+        """
+        index = collections.OrderedDict()
+        for node in self.tree.body:
+            if not isinstance(node, (ast.ClassDef, ast.FunctionDef)):
+                continue
+            lines, start = self.source_lines(node)
+            # Like inspect, the first class of a name wins.
+            index.setdefault(node.name, (start, start + len(lines) - 1, lines))
+            if not isinstance(node, ast.ClassDef):
+                continue
+            for child in node.body:
+                if isinstance(child, ast.FunctionDef):
+                    lines, start = self.source_lines(child)
+                    name = node.name + '.' + child.name
+                    index[name] = (start, start + len(lines) - 1, lines)
+        return index
+
+
+class SourceExtractor(object):
+    """
+    Extracts the records for a package from a source tree using `ast`.
+
+    `root` is the directory the top level package lives in (ie. the one that
+    would be on `sys.path`), and `target` the dotted name of the package to
+    extract, eg. `django.views.generic`, or a sequence of them.
+    """
+
+    def __init__(self, root, target='django.views.generic'):
+        self.root = os.path.abspath(root)
+        self.targets = (target,) if isinstance(target, basestring) else tuple(target)
+        self._source_modules = {}
+
+    def get_target(self, module_name):
+        """ The target module_name is in, if any """
+        for target in self.targets:
+            if in_module(module_name, target):
+                return target
+        return None
+
+    def module_filename(self, module_name):
+        path = os.path.join(self.root, *module_name.split('.'))
+        if os.path.isfile(os.path.join(path, '__init__.py')):
+            return os.path.join(path, '__init__.py')
+        if os.path.isfile(path + '.py'):
+            return path + '.py'
+        return None
+
+    def get_source_module(self, module_name):
+        if module_name not in self._source_modules:
+            filename = self.module_filename(module_name)
+            module = SourceModule(module_name, filename) if filename else None
+            self._source_modules[module_name] = module
+        return self._source_modules[module_name]
+
+    def resolve(self, module, name, seen=None):
+        """
+        Find what `name` is bound to in `module`, following imports.
+
+        Returns a `(kind, source_module, node)` tuple where kind is one of
+        'class', 'function', 'module', 'other', or None if the name can't be
+        found in the source tree.
+        """
+        seen = seen or set()
+        if (module.name, name) in seen:
+            return None, None, None
+        seen.add((module.name, name))
+
+        node = module.bindings.get(name)
+        if node is None:
+            # Could be a submodule of a package.
+            if module.filename.endswith('__init__.py'):
+                submodule = self.get_source_module(module.name + '.' + name)
+                if submodule is not None:
+                    return 'module', submodule, None
+            return None, None, None
+        if isinstance(node, ast.ClassDef):
+            return 'class', module, node
+        if isinstance(node, ast.FunctionDef):
+            return 'function', module, node
+        if isinstance(node, ast.Assign):
+            if isinstance(node.value, ast.Name):
+                kind, source, value_node = self.resolve(module, node.value.id, seen)
+                if kind != 'other':
+                    return kind, source, value_node
+            elif isinstance(node.value, ast.Attribute):
+                # An alias of something elsewhere, most likely a function.
+                return None, None, None
+            return 'other', module, node
+
+        import_node, alias = node
+        if isinstance(import_node, ast.Import):
+            return 'module', self.get_source_module(alias.name), None
+        if import_node.module == '__future__':
+            return 'other', module, import_node
+        source_name = self._absolute_module(module, import_node)
+        submodule = self.get_source_module(source_name + '.' + alias.name)
+        if submodule is not None:
+            return 'module', submodule, None
+        source = self.get_source_module(source_name)
+        if source is None:
+            return None, None, None
+        return self.resolve(source, alias.name, seen)
+
+    def _absolute_module(self, module, import_node):
+        if not import_node.level:
+            return import_node.module
+        package = module.name.split('.')
+        if not module.filename.endswith('__init__.py'):
+            package = package[:-1]
+        if import_node.level > 1:
+            package = package[:-(import_node.level - 1)]
+        if import_node.module:
+            package.append(import_node.module)
+        return '.'.join(package)
+
+    def get_filename(self, module):
+        return module.filename[len(self.root):]
+
+    def get_docstring(self, node):
+        return ast.get_docstring(node) or ''
+
+    def get_arguments(self, module, node):
+        """ Rebuild the signature the way inspect.formatargspec would """
+        args = node.args
+        defaults = [self.get_default(module, d) for d in args.defaults]
+        specs = []
+        first_default = len(args.args) - len(defaults)
+        for i, arg in enumerate(args.args):
+            spec = self._arg_name(arg)
+            if i >= first_default:
+                spec += '=' + defaults[i - first_default]
+            specs.append(spec)
+        if args.vararg:
+            specs.append('*' + args.vararg)
+        if args.kwarg:
+            specs.append('**' + args.kwarg)
+        return ', '.join(specs)
+
+    def _arg_name(self, arg):
+        if isinstance(arg, ast.Tuple):
+            return '(' + ', '.join(self._arg_name(a) for a in arg.elts) + ')'
+        return arg.id
+
+    def get_default(self, module, node):
+        try:
+            return repr(module.literal(node))
+        except ValueError:
+            return _dotted_name(node) or UNKNOWN_VALUE
+
+    def get_value(self, module, node):
+        """ Returns a `(value, line_number)` pair for an assigned value node """
+        try:
+            value = module.literal(node)
+        except ValueError:
+            pass
+        else:
+            if isinstance(value, basestring):
+                return u"'{0}'".format(value), -1
+            return unicode(value), -1
+
+        if isinstance(node, ast.Name):
+            kind, source, value_node = self.resolve(module, node.id)
+            if kind == 'class':
+                value = u"<class '{0}.{1}'>".format(source.name, value_node.name)
+                return value, source.klass_line_number(value_node)
+            if kind == 'function':
+                value = u'<function {0}>'.format(value_node.name)
+                return value, source.block(value_node)[1]
+        return UNKNOWN_VALUE, -1
+
+    def get_descriptor_value(self, module, node):
+        """
+        The value of a decorated method that isn't a method any more (eg. a
+        property), or None when the decorated function is still a method.
+        """
+        for decorator in node.decorator_list:
+            if isinstance(decorator, ast.Attribute) and decorator.attr in ('setter', 'getter', 'deleter'):
+                return u'<property object>'
+            name = _dotted_name(decorator)
+            if name == 'property':
+                return u'<property object>'
+            if name is None or not name.endswith('property'):
+                continue
+            kind, source, value_node = self.resolve(module, name.split('.')[0])
+            if kind == 'class' and '.' not in name:
+                return u'<{0}.{1} object>'.format(source.name, value_node.name)
+            return UNKNOWN_VALUE
+        return None
+
+    def target_module_names(self):
+        """
+        The modules under the target packages that importing them would load,
+        in the order they are reached. Deprecated modules nobody imports
+        (eg. `django.views.generic.simple`) are left out, as with `inspect`.
+        """
+        names = [t for t in self.targets if self.module_filename(t)]
+        for name in names:
+            module = self.get_source_module(name)
+            for node in ast.walk(module.tree):
+                if isinstance(node, ast.ImportFrom):
+                    imported = [self._absolute_module(module, node)]
+                    imported += [imported[0] + '.' + a.name for a in node.names]
+                elif isinstance(node, ast.Import):
+                    imported = [a.name for a in node.names]
+                else:
+                    continue
+                for imported_name in imported:
+                    target = self.get_target(imported_name)
+                    if target is None:
+                        continue
+                    # Importing a.b.c also imports a.b
+                    parts = imported_name.split('.')
+                    for i in range(len(target.split('.')) + 1, len(parts) + 1):
+                        parent = '.'.join(parts[:i])
+                        if parent not in names and self.module_filename(parent):
+                            names.append(parent)
+        return names
+
+    def extract(self, version_number=None):
+        extraction = Extraction(version_number)
+        modules = [self.get_source_module(n) for n in self.target_module_names()]
+
+        # Classes are keyed on (module name, class name).
+        class_nodes = collections.OrderedDict()
+        import_paths = {}
+        for module in modules:
+            extraction.modules.append(ModuleRecord(
+                module.name, self.get_docstring(module.tree), self.get_filename(module)))
+            for name, node in module.bindings.items():
+                if name in BANNED_ATTR_NAMES:
+                    continue
+                if isinstance(node, ast.ClassDef):
+                    class_nodes[module.name, name] = (module, node)
+                    import_paths.setdefault((module.name, name), module.name)
+                elif isinstance(node, ast.FunctionDef):
+                    code, start_line = module.block(node)
+                    extraction.functions.append(FunctionRecord(
+                        module.name, name, self.get_docstring(node), code,
+                        self.get_arguments(module, node), start_line))
+                else:
+                    self._extract_module_member(extraction, module, name, import_paths)
+
+        for (module_name, name), (module, node) in class_nodes.items():
+            extraction.klasses.append(KlassRecord(
+                module_name, name, self.get_docstring(node),
+                module.klass_line_number(node), import_paths[module_name, name]))
+            self._extract_klass_body(extraction, module, node)
+            for order, base in enumerate(node.bases):
+                base_name = _dotted_name(base)
+                if base_name is None or '.' in base_name:
+                    continue
+                kind, source, base_node = self.resolve(module, base_name)
+                if kind is None:
+                    self._extract_builtin_base(extraction, module, node, base_name)
+                if kind == 'class' and (source.name, base_node.name) in class_nodes:
+                    extraction.inheritance.append(InheritanceRecord(
+                        source.name, base_node.name, module_name, name, order))
+
+        extraction.klass_attributes = self._prune_inherited_attributes(
+            extraction.klass_attributes, extraction.inheritance)
+        return extraction
+
+    def _extract_module_member(self, extraction, module, name, import_paths):
+        kind, source, node = self.resolve(module, name)
+        if kind == 'class':
+            # Track re-exports from parent packages to find the shortest import.
+            key = (source.name, node.name)
+            if in_module(source.name, module.name) and self.get_target(source.name):
+                current = import_paths.get(key, source.name)
+                if len(module.name.split('.')) < len(current.split('.')):
+                    import_paths[key] = module.name
+                else:
+                    import_paths.setdefault(key, current)
+            return
+        if kind != 'other':
+            # Functions, modules, and anything from outside the source tree.
+            return
+
+        if isinstance(node, ast.ImportFrom):
+            # `from __future__ import ...`
+            value = unicode(getattr(__future__, name))
+        elif source is module:
+            value = self.get_value(module, node.value)[0]
+        else:
+            value = UNKNOWN_VALUE
+        extraction.module_attributes.append(ModuleAttributeRecord(
+            module.name, name, value, -1))
+
+    def _extract_klass_body(self, extraction, module, klass_node):
+        methods = {}
+        for node in klass_node.body:
+            if isinstance(node, ast.FunctionDef):
+                value = self.get_descriptor_value(module, node)
+                if value is not None:
+                    extraction.klass_attributes.append(KlassAttributeRecord(
+                        module.name, klass_node.name, node.name, value, -1))
+                    continue
+                methods[node.name] = node
+            elif isinstance(node, ast.Assign):
+                for name in _assigned_names(node):
+                    if name in BANNED_ATTR_NAMES:
+                        continue
+                    if isinstance(node.value, ast.Name) and node.value.id in methods:
+                        # An alias of a method defined in the class body.
+                        methods[name] = methods[node.value.id]
+                        continue
+                    value, line_number = self.get_value(module, node.value)
+                    extraction.klass_attributes.append(KlassAttributeRecord(
+                        module.name, klass_node.name, name, value, line_number))
+
+        for name, node in methods.items():
+            code, start_line = module.block(node)
+            extraction.methods.append(MethodRecord(
+                module.name, klass_node.name, name, self.get_docstring(node),
+                code, self.get_arguments(module, node), start_line))
+
+    def _extract_builtin_base(self, extraction, module, klass_node, base_name):
+        """
+        Attributes inherited from builtin bases (eg. Exception) only exist at
+        runtime, but those come from the interpreter rather than the target.
+        """
+        base = getattr(__builtin__, base_name, None)
+        if not inspect.isclass(base) or base is object:
+            return
+        defined = set(n for n in module.bindings)
+        for name, member in inspect.getmembers(base):
+            if name in BANNED_ATTR_NAMES or name in defined:
+                continue
+            if inspect.isbuiltin(member) or inspect.ismethod(member):
+                continue
+            if member in object.__dict__.values():
+                continue
+            extraction.klass_attributes.append(KlassAttributeRecord(
+                module.name, klass_node.name, name, unicode(member), -1))
+
+    def _prune_inherited_attributes(self, attributes, inheritance):
+        """
+        Mirror populate_cbv.create_attributes: an attribute redefined with the
+        same value on a descendant is only recorded on the ancestor.
+        """
+        children = collections.defaultdict(set)
+        for relation in inheritance:
+            children[relation.parent_module, relation.parent].add(
+                (relation.child_module, relation.child))
+
+        def descendants(klass):
+            found = set()
+            stack = [klass]
+            while stack:
+                for child in children[stack.pop()]:
+                    if child not in found:
+                        found.add(child)
+                        stack.append(child)
+            return found
+
+        by_value = collections.defaultdict(list)
+        for attr in attributes:
+            by_value[attr.name, attr.value].append(attr)
+        remaining = []
+        for attr in attributes:
+            klasses = set((a.module, a.klass) for a in by_value[attr.name, attr.value])
+            if not any((attr.module, attr.klass) in descendants(k) for k in klasses):
+                remaining.append(attr)
+        return remaining
+
+
+class SourceLookup(object):
+    """
+    `inspect.getsourcefile` and `inspect.getsourcelines`, keeping count of
+    how long they take.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.lookups = 0
+
+    def getsourcefile(self, obj):
+        return self._timed(self._getsourcefile, obj)
+
+    def getsourcelines(self, obj):
+        return self._timed(self._getsourcelines, obj)
+
+    def _timed(self, lookup, obj):
+        start = time.time()
+        try:
+            return lookup(obj)
+        finally:
+            self.elapsed += time.time() - start
+            self.lookups += 1
+
+    def _getsourcefile(self, obj):
+        return inspect.getsourcefile(obj)
+
+    def _getsourcelines(self, obj):
+        return inspect.getsourcelines(obj)
+
+
+class SourceIndex(SourceLookup):
+    """
+    A `SourceLookup` that parses each file once, rather than tokenizing it
+    again for every class and method looked up.
+
+    Anything the index can't find (eg. a lambda) falls back to `inspect`.
+    """
+
+    def __init__(self):
+        super(SourceIndex, self).__init__()
+        self.files = {}
+        self._filenames = {}
+
+    def file_index(self, filename):
+        """ `(index by qualified name, index by first line)` for a file """
+        if filename not in self.files:
+            by_name = SourceModule(None, filename).index()
+            by_line = dict((entry[0], entry) for entry in by_name.values())
+            self.files[filename] = (by_name, by_line)
+        return self.files[filename]
+
+    def _getsourcefile(self, obj):
+        key = getattr(obj, 'im_func', obj)
+        try:
+            return self._filenames[key]
+        except KeyError:
+            filename = self._filenames[key] = inspect.getsourcefile(obj)
+            return filename
+
+    def _getsourcelines(self, obj):
+        entry = None
+        if inspect.isclass(obj):
+            filename = self._getsourcefile(obj)
+            if filename:
+                entry = self.file_index(filename)[0].get(obj.__name__)
+        elif inspect.ismethod(obj) or inspect.isfunction(obj):
+            filename = self._getsourcefile(obj)
+            code = getattr(obj, 'im_func', obj).func_code
+            if filename:
+                entry = self.file_index(filename)[1].get(code.co_firstlineno)
+        if entry is None:
+            return inspect.getsourcelines(obj)
+        start, end, lines = entry
+        return list(lines), start
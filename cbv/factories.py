@@ -1,6 +1,6 @@
 import factory
 
-from .models import Inheritance, Klass, Module, Project, ProjectVersion
+from .models import Inheritance, Klass, KlassAttribute, Method, Module, Project, ProjectVersion, Source
 
 
 class ProjectFactory(factory.DjangoModelFactory):
@@ -37,3 +37,22 @@ class InheritanceFactory(factory.DjangoModelFactory):
     parent = factory.SubFactory(KlassFactory)
     child = factory.SubFactory(KlassFactory)
     order = 1
+
+
+class MethodFactory(factory.DjangoModelFactory):
+    FACTORY_FOR = Method
+    FACTORY_HIDDEN_ARGS = ('code',)
+    klass = factory.SubFactory(KlassFactory)
+    name = factory.Sequence(lambda n: 'method{0}'.format(n))
+    code = factory.LazyAttribute(lambda a: 'def {0}(self):\n    pass\n'.format(a.name))
+    source = factory.LazyAttribute(lambda a: Source.objects.for_code(a.code))
+    kwargs = 'self'
+    line_number = 1
+
+
+class KlassAttributeFactory(factory.DjangoModelFactory):
+    FACTORY_FOR = KlassAttribute
+    klass = factory.SubFactory(KlassFactory)
+    name = factory.Sequence(lambda n: 'attribute{0}'.format(n))
+    value = 'None'
+    line_number = 1
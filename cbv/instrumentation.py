@@ -0,0 +1,224 @@
+"""
+Counts the SQL each view runs: queries, time spent in the database, and
+statements run more than once, aggregated in process by URL name.
+
+Django 1.5 only logs queries with DEBUG on, so instead each connection's
+`cursor()` is wrapped to hand out cursors that time their statements while a
+request is being recorded. Nothing is kept per query beyond a count of its
+SQL; the totals of a request are added to the view's in one locked update.
+
+Turned on by CBV_SQL_INSTRUMENTATION. With CBV_SQL_HEADERS, each response
+also carries its own numbers in X-SQL-* headers. Staff can read the totals
+of this process at /stats/sql.json.
+"""
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+# How many of the most repeated statements to report for each view.
+TOP_STATEMENTS = 5
+# How many distinct statements each view keeps counts of. Past that, only the
+# most run are kept, so the counts of a long-lived process stay bounded (and
+# a statement that's dropped starts again from nothing if it comes back).
+MAX_STATEMENTS = 100
+
+_local = threading.local()
+
+
+class QueryRecorder(object):
+    """ The queries of one request, also counted by any recording around it """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.queries = 0
+        self.time = 0.0
+        self.statements = collections.Counter()
+        self.calls = collections.Counter()
+
+    def record(self, sql, params, elapsed):
+        self.queries += 1
+        self.time += elapsed
+        self.statements[sql] += 1
+        try:
+            self.calls[sql, tuple(params or ())] += 1
+        except TypeError:
+            # Unhashable parameters; count the call as distinct.
+            pass
+        if self.parent is not None:
+            self.parent.record(sql, params, elapsed)
+
+    @property
+    def duplicates(self):
+        """ Queries that ran earlier in the request with the same parameters """
+        return sum(count - 1 for count in self.calls.itervalues())
+
+    @property
+    def repeats(self):
+        """ Queries whose SQL ran earlier in the request, as an N+1 loop does """
+        return sum(count - 1 for count in self.statements.itervalues())
+
+
+class InstrumentedCursor(object):
+    """ Times each statement run through a cursor """
+
+    def __init__(self, cursor, recorder):
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.recorder.record(sql, params, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.recorder.record(sql, None, time.time() - start)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def instrument(connection):
+    """ Make a connection's cursors report to the current recorder, if any """
+    if getattr(connection, '_cbv_instrumented', False):
+        return
+    make_cursor = connection.cursor
+
+    def cursor():
+        cursor = make_cursor()
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None:
+            return cursor
+        return InstrumentedCursor(cursor, recorder)
+
+    connection.cursor = cursor
+    connection._cbv_instrumented = True
+
+
+@contextmanager
+def recording():
+    """ Record the queries run in a block, outside of any request too """
+    for connection in connections.all():
+        instrument(connection)
+    recorder = _local.recorder = QueryRecorder(getattr(_local, 'recorder', None))
+    try:
+        yield recorder
+    finally:
+        _local.recorder = recorder.parent
+
+
+class ViewStats(object):
+    """ The totals of every recorded request, by view """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = datetime.utcnow()
+            self.views = {}
+
+    def add(self, name, recorder):
+        with self.lock:
+            view = self.views.get(name)
+            if view is None:
+                view = self.views[name] = {
+                    'requests': 0,
+                    'queries': 0,
+                    'max_queries': 0,
+                    'time': 0.0,
+                    'duplicates': 0,
+                    'repeats': 0,
+                    'statements': collections.Counter(),
+                }
+            view['requests'] += 1
+            view['queries'] += recorder.queries
+            view['max_queries'] = max(view['max_queries'], recorder.queries)
+            view['time'] += recorder.time
+            view['duplicates'] += recorder.duplicates
+            view['repeats'] += recorder.repeats
+            view['statements'].update(recorder.statements)
+            if len(view['statements']) > MAX_STATEMENTS:
+                view['statements'] = collections.Counter(dict(view['statements'].most_common(MAX_STATEMENTS)))
+
+    def as_dict(self):
+        with self.lock:
+            views = {}
+            for name, view in self.views.iteritems():
+                requests = view['requests']
+                views[name] = {
+                    'requests': requests,
+                    'queries': view['queries'],
+                    'mean_queries': float(view['queries']) / requests,
+                    'max_queries': view['max_queries'],
+                    'sql_ms': view['time'] * 1000,
+                    'mean_sql_ms': view['time'] * 1000 / requests,
+                    'duplicates': view['duplicates'],
+                    'repeats': view['repeats'],
+                    'top_statements': [
+                        {'sql': sql, 'count': count}
+                        for sql, count in view['statements'].most_common(TOP_STATEMENTS)
+                    ],
+                }
+            return {
+                'pid': os.getpid(),
+                'since': self.since.isoformat(),
+                'views': views,
+            }
+
+
+stats = ViewStats()
+
+
+def get_match_name(match):
+    """ The URL name of a resolved view, or where the view lives if it has none """
+    if match is None:
+        return '<unresolved>'
+    return match.url_name or match.func.__module__ + '.' + match.func.__name__
+
+
+def get_view_name(request):
+    return get_match_name(getattr(request, 'resolver_match', None))
+
+
+class SQLInstrumentationMiddleware(object):
+    def __init__(self):
+        if not getattr(settings, 'CBV_SQL_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.headers = getattr(settings, 'CBV_SQL_HEADERS', False)
+
+    def process_request(self, request):
+        # Connections are per thread, so each is wrapped the first time here.
+        for connection in connections.all():
+            instrument(connection)
+        _local.recorder = QueryRecorder(getattr(_local, 'recorder', None))
+
+    def process_response(self, request, response):
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None:
+            return response
+        _local.recorder = recorder.parent
+        stats.add(get_view_name(request), recorder)
+        if self.headers:
+            response['X-SQL-Queries'] = str(recorder.queries)
+            response['X-SQL-Time'] = '{0:.1f}ms'.format(recorder.time * 1000)
+            response['X-SQL-Duplicates'] = str(recorder.duplicates)
+            response['X-SQL-Repeats'] = str(recorder.repeats)
+        return response
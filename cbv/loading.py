@@ -0,0 +1,196 @@
+"""
+Bulk loading of the cbv fixtures.
+
+`loaddata` resolves every natural key through the chained `get_by_natural_key`
+managers (four queries for a Method) and saves each object on its own. Here
+natural keys are resolved against dictionaries held in memory, primary keys
+are allocated up front, and each model is inserted with one `bulk_create`.
+The code of methods and functions goes into Source, once for all versions;
+fixtures refer to it by content hash, and the cbv.source objects of a
+sources.json (or the database) hold the code.
+"""
+import collections
+import gzip
+import json
+import time
+from contextlib import closing
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Max
+
+from cbv.extraction import FIXTURE_SOURCES, get_fixture_code, get_fixture_source
+from cbv.models import (Function, Inheritance, Klass, KlassAttribute, Method,
+    Module, ModuleAttribute, Project, ProjectVersion, Source)
+from cbv.snapshot import Snapshot
+
+
+# In the order they have to be inserted.
+MODELS = (
+    Project,
+    ProjectVersion,
+    Module,
+    ModuleAttribute,
+    Function,
+    Klass,
+    KlassAttribute,
+    Method,
+    Inheritance,
+)
+
+# How to build the natural key of a fixture object from its fields, for the
+# models that other models refer to.
+NATURAL_KEYS = {
+    Project: lambda fields: (fields['name'],),
+    ProjectVersion: lambda fields: tuple(fields['project']) + (fields['version_number'],),
+    Module: lambda fields: (fields['name'],) + tuple(fields['project_version']),
+    Klass: lambda fields: (fields['name'],) + tuple(fields['module']),
+}
+
+# The same keys, read out of the database.
+NATURAL_KEY_LOOKUPS = {
+    Project: ('name',),
+    ProjectVersion: ('project__name', 'version_number'),
+    Module: ('name', 'project_version__project__name', 'project_version__version_number'),
+    Klass: (
+        'name',
+        'module__name',
+        'module__project_version__project__name',
+        'module__project_version__version_number',
+    ),
+}
+
+
+def read_fixture(filename):
+    """ The objects in a JSON fixture, which may be gzipped, or a snapshot """
+    if filename.endswith('.ccbv'):
+        return list(Snapshot.load(filename).fixture_objects())
+    opener = gzip.open if filename.endswith('.gz') else open
+    with closing(opener(filename, 'rb')) as f:
+        return json.load(f)
+
+
+class BulkLoader(object):
+    """
+    Loads fixture objects (as dicts, the way they are serialized) in bulk.
+
+    Versions already in the database are replaced. Projects are shared
+    between versions, so those that exist are left alone.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.keys = {}
+        self.versions = []
+        # {code: content hash} of the code added, and the hashes that methods
+        # and functions use.
+        self.codes = {}
+        self.sources = set()
+        self.known_sources = set()
+        self.counts = collections.OrderedDict((model, 0) for model in MODELS)
+        self.timings = collections.OrderedDict((model, 0.0) for model in MODELS)
+
+    def load(self, objects):
+        """ Insert all of the objects. Run this inside a transaction. """
+        by_model = collections.defaultdict(list)
+        labels = dict((model._meta.app_label + '.' + model._meta.object_name.lower(), model)
+                      for model in MODELS + (Source,))
+        for obj in objects:
+            by_model[labels[obj['model']]].append(obj['fields'])
+
+        # Taken before deleting, so no deleted version's ids are reused.
+        next_pks = dict((model, self.get_next_pk(model)) for model in MODELS)
+        self.versions = [NATURAL_KEYS[ProjectVersion](f) for f in by_model[ProjectVersion]]
+        self.delete_versions(self.versions)
+        for model in NATURAL_KEYS:
+            self.keys[model] = self.get_existing_keys(model)
+        uses = by_model[Function] + by_model[Method]
+        self.codes = Source.objects.db_manager(self.using).add(
+            [fields['code'] for fields in by_model[Source]] +
+            [get_fixture_code(fields) for fields in uses if get_fixture_source(fields) is None])
+        referred = set(get_fixture_source(fields) for fields in uses) - set([None])
+        self.known_sources = set(self.codes.values())
+        self.known_sources |= Source.objects.db_manager(self.using).get_existing(referred - self.known_sources)
+
+        for model in MODELS:
+            start = time.time()
+            instances = self.build(model, by_model[model], next_pks[model])
+            model.objects.using(self.using).bulk_create(instances)
+            self.timings[model] = time.time() - start
+            self.counts[model] = len(instances)
+        # After inserting, so the code the new versions share with the old is kept.
+        Source.objects.db_manager(self.using).delete_unused()
+        self.reset_sequences()
+
+    def delete_versions(self, version_keys):
+        for project_name, version_number in version_keys:
+            # Inheritance first, as in populate_cbv.
+            Inheritance.objects.using(self.using).filter(
+                parent__module__project_version__project__name=project_name,
+                parent__module__project_version__version_number=version_number,
+            ).delete()
+            ProjectVersion.objects.using(self.using).filter(
+                project__name=project_name,
+                version_number=version_number,
+            ).delete()
+
+    def get_existing_keys(self, model):
+        lookups = NATURAL_KEY_LOOKUPS[model]
+        rows = model.objects.using(self.using).values_list(*(lookups + ('pk',)))
+        return dict((tuple(row[:-1]), row[-1]) for row in rows)
+
+    def get_next_pk(self, model):
+        return (model.objects.using(self.using).aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+    def build(self, model, objects, next_pk):
+        """ Unsaved instances, with their primary and foreign keys filled in """
+        natural_key = NATURAL_KEYS.get(model)
+        fields = [f for f in model._meta.fields if not f.primary_key]
+        instances = []
+        for obj in objects:
+            if natural_key is not None:
+                key = natural_key(obj)
+                if key in self.keys[model]:
+                    # Only projects can be here already; versions were deleted.
+                    continue
+                self.keys[model][key] = next_pk
+            kwargs = {}
+            for field in fields:
+                if field.rel is not None and field.rel.to is Source:
+                    kwargs[field.attname] = self.get_source(model, obj)
+                    continue
+                if field.name not in obj:
+                    continue
+                value = obj[field.name]
+                if field.rel is None:
+                    kwargs[field.attname] = value
+                else:
+                    try:
+                        kwargs[field.attname] = self.keys[field.rel.to][tuple(value)]
+                    except KeyError:
+                        raise ValueError('{0} {1} refers to a missing {2}: {3}'.format(
+                            model.__name__, obj.get('name', ''), field.rel.to.__name__, value))
+            instance = model(pk=next_pk, **kwargs)
+            if hasattr(instance, 'set_content_hash'):
+                instance.set_content_hash()
+            instances.append(instance)
+            next_pk += 1
+        return instances
+
+    def get_source(self, model, obj):
+        """ The content hash of a method or function's code """
+        content_hash = get_fixture_source(obj)
+        if content_hash is None:
+            content_hash = self.codes[get_fixture_code(obj)]
+        elif content_hash not in self.known_sources:
+            raise ValueError('{0} {1} refers to a missing Source: {2} (load {3} too)'.format(
+                model.__name__, obj.get('name', ''), content_hash, FIXTURE_SOURCES))
+        self.sources.add(content_hash)
+        return content_hash
+
+    def reset_sequences(self):
+        """ Move the database's id sequences past the ids we picked """
+        connection = connections[self.using]
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), MODELS):
+            cursor.execute(sql)
@@ -0,0 +1,105 @@
+import json
+import sys
+from datetime import datetime
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from blessings import Terminal
+from cbv.benchmarks import OPERATIONS, SHAPES, run
+
+t = Terminal()
+
+DEFAULT_RUNS = ('chain=5,10', 'fanout=10,100', 'diamonds=2,3', 'members=200,2000')
+
+
+class Command(BaseCommand):
+    args = '[<shape>=<size>[,<size>...] ...]'
+    help = ('Times the Klass methods behind the class page on made-up '
+            'hierarchies (shapes: {0}) and writes the results as JSON. Nothing '
+            'is left in the database.').format(', '.join(sorted(SHAPES)))
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat',
+            type='int',
+            dest='repeat',
+            default=3,
+            help='How many times to run each operation; the minimum and median are kept.'),
+        make_option('--operation',
+            action='append',
+            dest='operations',
+            default=[],
+            help='Only time this operation. May be given more than once.'),
+        make_option('-o', '--output',
+            dest='output',
+            default=None,
+            help='Write the JSON results to this file rather than stdout.'),
+        make_option('--compare',
+            dest='compare',
+            default=None,
+            help='Print how these results differ from an earlier results file.'),
+    )
+
+    def handle(self, *specs, **options):
+        names = [name for name, target, operation in OPERATIONS]
+        for name in options['operations']:
+            if name not in names:
+                raise CommandError('No such operation: {0}. Choose from {1}.'.format(name, ', '.join(names)))
+
+        runs = []
+        for spec in specs or DEFAULT_RUNS:
+            shape, sep, sizes = spec.partition('=')
+            if shape not in SHAPES or not sep:
+                raise CommandError('Runs look like chain=10,50; shapes are {0}.'.format(', '.join(sorted(SHAPES))))
+            try:
+                runs += [(shape, int(size)) for size in sizes.split(',')]
+            except ValueError:
+                raise CommandError('Sizes should be whole numbers: ' + spec)
+
+        results = []
+        with transaction.commit_manually():
+            try:
+                for shape, size in runs:
+                    print >> sys.stderr, t.blue('{0}={1}'.format(shape, size))
+                    results.append(run(shape, size, options['repeat'], options['operations']))
+            finally:
+                transaction.rollback()
+
+        data = {
+            'created': datetime.utcnow().isoformat(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        output = json.dumps(data, indent=1, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), data)
+
+    def print_comparison(self, before, after):
+        old = dict(((r['shape'], r['size']), r['operations']) for r in before['results'])
+        for result in after['results']:
+            key = result['shape'], result['size']
+            if key not in old:
+                continue
+            print >> sys.stderr, t.blue('{0}={1}'.format(*key))
+            for name, timing in sorted(result['operations'].items()):
+                if name not in old[key]:
+                    continue
+                was = old[key][name]
+                if 'error' in was or 'error' in timing:
+                    print >> sys.stderr, t.yellow('    {0}: {1} -> {2}'.format(
+                        name, was.get('error', 'ok'), timing.get('error', 'ok')))
+                    continue
+                speedup = was['median_ms'] / timing['median_ms'] if timing['median_ms'] else float('inf')
+                line = '    {0}: {1} -> {2} queries, {3:.2f} -> {4:.2f}ms ({5:.1f}x)'.format(
+                    name, was['queries'], timing['queries'], was['median_ms'], timing['median_ms'], speedup)
+                print >> sys.stderr, (t.green if speedup >= 1 else t.red)(line)
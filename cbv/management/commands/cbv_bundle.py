@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blessings import Terminal
+from cbv.bundles import write_bundle
+from cbv.models import ProjectVersion
+
+t = Terminal()
+
+
+class Command(BaseCommand):
+    args = '[<version> <version> ...]'
+    help = ('Writes the downloadable bundle of each version (or of the given '
+            'ones) to CBV_BUNDLE_ROOT.')
+
+    def handle(self, *versions, **options):
+        project_versions = ProjectVersion.objects.select_related('project')
+        if versions:
+            project_versions = project_versions.filter(version_number__in=versions)
+            missing = set(versions) - set(pv.version_number for pv in project_versions)
+            if missing:
+                raise CommandError('No such version: ' + ', '.join(sorted(missing)))
+        for project_version in project_versions:
+            filename = write_bundle(project_version)
+            print t.blue(unicode(project_version) + ': ') + t.green(filename)
@@ -1,31 +1,152 @@
+import glob
+import gzip
+import itertools
 import json
+import os
+from contextlib import closing
+from optparse import make_option
 
-from django.db.models.query import QuerySet
-from django.core.management import call_command
-from django.core.management.base import LabelCommand
+from django.core.management.base import CommandError, LabelCommand
 from django.core import serializers
 from cbv import models
+from cbv.extraction import FIXTURE_SOURCES, get_fixture_source, read_fixture_sources
+
+
+# Each model, the lookup that filters it to a version, and the relations its
+# natural key needs. Methods and functions refer to their Source by content
+# hash, and the code goes in sources.json (see --sources).
+VERSION_MODELS = (
+    (models.ProjectVersion, 'version_number', ('project',)),
+    (models.Module, 'project_version__version_number', ('project_version__project',)),
+    (models.ModuleAttribute, 'module__project_version__version_number', ('module__project_version__project',)),
+    (models.Function, 'module__project_version__version_number', ('module__project_version__project',)),
+    (models.Klass, 'module__project_version__version_number', ('module__project_version__project',)),
+    (models.KlassAttribute, 'klass__module__project_version__version_number', ('klass__module__project_version__project',)),
+    (models.Method, 'klass__module__project_version__version_number', ('klass__module__project_version__project',)),
+    (models.Inheritance, 'parent__module__project_version__version_number', (
+        'parent__module__project_version__project',
+        'child__module__project_version__project',
+    )),
+)
+
+
+def read_content_hashes(filename):
+    """
+    The content hashes of the sources a fixture, gzipped or not, refers to;
+    none if it isn't a fixture.
+    """
+    with open(filename, 'rb') as f:
+        compressed = f.read(2) == '\x1f\x8b'
+    opener = gzip.open if compressed else open
+    try:
+        with closing(opener(filename, 'rb')) as f:
+            objects = json.load(f)
+        return set(get_fixture_source(obj['fields']) for obj in objects if 'fields' in obj) - set([None])
+    except (IOError, ValueError, TypeError, AttributeError):
+        return set()
+
+
+class StdoutStream(object):
+    """ Lets the serializer write to the command's stdout in pieces """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def write(self, data):
+        self.stdout.write(data, ending='')
+
+    def flush(self):
+        self.stdout.flush()
+
+    def close(self):
+        pass
 
 
 class Command(LabelCommand):
-    """Dump the django cbv app data for a specific version."""
+    """Dump the django cbv app data for one or more versions."""
+    args = '<version version ...>'
+    label = 'version'
+    option_list = LabelCommand.option_list + (
+        make_option('-o', '--output',
+            dest='output',
+            default=None,
+            help='Write to this file rather than stdout. Compressed if it ends in .gz.'),
+        make_option('--gzip',
+            action='store_true',
+            dest='gzip',
+            default=False,
+            help='Compress the output with gzip.'),
+        make_option('--sources',
+            action='store_true',
+            dest='sources',
+            default=False,
+            help='Also write the code the versions use to sources.json beside the output, '
+                 'keeping the code the other fixtures there use.'),
+    )
+
+    def handle(self, *labels, **options):
+        """
+        Objects are fetched one model at a time and written out as they are
+        serialized, so memory use doesn't grow with the size of the versions.
+        """
+        if not labels:
+            return super(Command, self).handle(*labels, **options)
+
+        output = options.get('output')
+        if options.get('sources') and not output:
+            raise CommandError('--sources needs --output')
+        out = open(output, 'wb') if output else StdoutStream(self.stdout)
+        stream = out
+        if options.get('gzip') or (output or '').endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=out, mode='wb')
+
+        self.content_hashes = set()
+        objects = itertools.chain.from_iterable(
+            self.handle_label(label, **options) for label in labels)
+        # Fields that aren't editable (content hashes) are worked out on load.
+        fields = set(f.name for model, version_arg, related in VERSION_MODELS
+                     for f in model._meta.fields if f.editable)
+        try:
+            serializers.serialize(
+                'json', objects, indent=1, use_natural_keys=True, stream=stream, fields=fields)
+        finally:
+            if stream is not out:
+                stream.close()
+            out.close()
+        if options.get('sources'):
+            output = os.path.abspath(output)
+            self.write_sources(os.path.join(os.path.dirname(output), FIXTURE_SOURCES), output)
+
+    def write_sources(self, filename, output):
+        """
+        Write the code of the versions just dumped to `output`, and of the
+        other fixtures beside it, to `filename`, once, as the Source objects
+        they refer to. Code the database no longer has is kept from the file
+        as it was.
+        """
+        content_hashes = set(self.content_hashes)
+        for fixture in glob.glob(os.path.join(os.path.dirname(filename), '*.json*')):
+            if fixture not in (filename, output):
+                content_hashes.update(read_content_hashes(fixture))
+
+        codes = read_fixture_sources(filename)
+        keys = sorted(content_hashes)
+        for start in xrange(0, len(keys), 500):
+            codes.update(models.Source.objects.filter(pk__in=keys[start:start + 500]).values_list('pk', 'code'))
+        missing = content_hashes - set(codes)
+        if missing:
+            raise CommandError('No code for {0} sources, such as {1}'.format(len(missing), min(missing)))
+        sources = [models.Source(pk=content_hash, code=codes[content_hash]) for content_hash in keys]
+        with open(filename, 'wb') as f:
+            serializers.serialize('json', sources, indent=1, stream=f, fields=('code',))
+
     def handle_label(self, label, **options):
-        filtered_models = (
-            (models.ProjectVersion, 'version_number'),
-            (models.Module, 'project_version__version_number'),
-            (models.ModuleAttribute, 'module__project_version__version_number'),
-            (models.Function, 'module__project_version__version_number'),
-            (models.Klass, 'module__project_version__version_number'),
-            (models.KlassAttribute, 'klass__module__project_version__version_number'),
-            (models.Method, 'klass__module__project_version__version_number'),
-            (models.Inheritance, 'parent__module__project_version__version_number'),
-        )
-        objects = []
-        for model, version_arg in filtered_models:
+        """ Yield every object of a version, without its primary key """
+        for model, version_arg, related in VERSION_MODELS:
             filter_kwargs = {version_arg: label}
-            result = model.objects.filter(**filter_kwargs)
-            objects = objects + list(result)
-        for obj in objects:
-            obj.pk = None
-        dump = serializers.serialize('json', objects, indent=1, use_natural_keys=True)
-        self.stdout.write(dump)
+            result = model.objects.filter(**filter_kwargs).select_related(*related)
+            for obj in result.iterator():
+                obj.pk = None
+                if model in (models.Method, models.Function):
+                    self.content_hashes.add(obj.source_id)
+                yield obj
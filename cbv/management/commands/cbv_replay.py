@@ -0,0 +1,164 @@
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from blessings import Terminal
+from cbv.backends.pool import get_stats as get_pool_stats
+from cbv.replay import PERCENTILES, close_connections, log_urls, replay, sitemap_urls
+
+t = Terminal()
+
+
+class Command(BaseCommand):
+    args = '[<access log> ...]'
+    help = ('Replays the pages of the sitemap, or the GET requests of access '
+            'logs, against the WSGI application in process, and reports '
+            'latency percentiles, throughput, errors and queries by URL name.')
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+            type='int',
+            dest='workers',
+            default=4,
+            help='How many requests to make at the same time.'),
+        make_option('--processes',
+            action='store_true',
+            dest='processes',
+            default=False,
+            help='Make requests from a pool of processes rather than threads.'),
+        make_option('--requests',
+            type='int',
+            dest='requests',
+            default=None,
+            help='How many requests to make, going round the URLs again as needed. Defaults to each URL once.'),
+        make_option('--shuffle',
+            action='store_true',
+            dest='shuffle',
+            default=False,
+            help='Request the URLs in a random order rather than the order given.'),
+        make_option('--seed',
+            type='int',
+            dest='seed',
+            default=None,
+            help='Seed the shuffle, to replay the same order again.'),
+        make_option('--warmup',
+            action='store_true',
+            dest='warmup',
+            default=False,
+            help='Request each URL once, untimed, before starting.'),
+        make_option('--host',
+            dest='host',
+            default='localhost',
+            help='The Host header to send.'),
+        make_option('-o', '--output',
+            dest='output',
+            default=None,
+            help='Also write the results as JSON to this file.'),
+        make_option('--compare',
+            dest='compare',
+            default=None,
+            help='Print how the latency differs from an earlier results file, eg. one without connection pooling.'),
+    )
+
+    def handle(self, *logs, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        if logs:
+            urls = []
+            for filename in logs:
+                try:
+                    with open(filename) as f:
+                        urls += log_urls(f)
+                except IOError as e:
+                    raise CommandError(str(e))
+        else:
+            urls = sitemap_urls(host=options['host'])
+        if not urls:
+            raise CommandError('No URLs to replay. Load some versions (load_cbv_fixtures) or give an access log.')
+
+        if options['shuffle']:
+            random.Random(options['seed']).shuffle(urls)
+        if options['requests']:
+            urls = list(itertools.islice(itertools.cycle(urls), options['requests']))
+
+        if options['processes']:
+            # Forked workers open connections of their own.
+            close_connections()
+            pool = multiprocessing.Pool(options['workers'])
+        else:
+            pool = ThreadPool(options['workers'])
+        try:
+            if options['warmup']:
+                print >> sys.stderr, t.blue('Warming up on {0} URLs'.format(len(set(urls))))
+                replay(sorted(set(urls)), pool, options['host'])
+            print >> sys.stderr, t.blue('Replaying {0} requests from {1} {2}'.format(
+                len(urls), options['workers'], 'processes' if options['processes'] else 'threads'))
+            results = replay(urls, pool, options['host'], progress=self.progress(len(urls)))
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self.print_results(results)
+        data = {
+            'created': datetime.utcnow().isoformat(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'pool': connection.settings_dict.get('POOL'),
+            # Only this process's; with --processes, each worker has its own.
+            'pools': get_pool_stats(),
+            'workers': options['workers'],
+            'processes': options['processes'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), data)
+
+    def progress(self, total):
+        step = max(total // 10, 1)
+
+        def progress(done):
+            if done % step == 0 or done == total:
+                print >> sys.stderr, t.blue('  {0}/{1}'.format(done, total))
+        return progress
+
+    def print_results(self, results):
+        header = '{0:<28} {1:>8} {2:>7} {3:>8} ' + ' '.join('{%d:>8}' % (i + 4) for i in range(len(PERCENTILES)))
+        line = '{0:<28} {1:>8} {2:>7.1%} {3:>8.1f} ' + ' '.join('{%d:>8.1f}' % (i + 4) for i in range(len(PERCENTILES)))
+        print t.bold(header.format('URL name', 'requests', 'errors', 'queries',
+                                   *['p{0} ms'.format(percent) for percent in PERCENTILES]))
+        rows = sorted(results['views'].items()) + [('total', results['total'])]
+        for name, view in rows:
+            text = line.format(name[:28], view['requests'], view['error_rate'], view['mean_queries'],
+                               *[view['p{0}_ms'.format(percent)] for percent in PERCENTILES])
+            print (t.red if view['errors'] else t.green)(text)
+            for message, count in sorted(view.get('error_messages', {}).items()):
+                print t.red('    {0} x {1}'.format(count, message))
+        total = results['total']
+        print t.blue('{0} requests in {1:.2f}s: {2:.1f} a second'.format(
+            total['requests'], total['seconds'], total['requests_per_second'] or 0))
+
+    def print_comparison(self, before, after):
+        print t.blue('Against {0} (pool: {1}), this run (pool: {2}):'.format(
+            before['created'], before.get('pool'), after['pool']))
+        old = dict(before['results']['views'], total=before['results']['total'])
+        new = dict(after['results']['views'], total=after['results']['total'])
+        for name in sorted(set(old) & set(new), key=lambda name: (name == 'total', name)):
+            changes = []
+            for percent in PERCENTILES:
+                key = 'p{0}_ms'.format(percent)
+                changes.append('p{0} {1:.1f} -> {2:.1f}ms'.format(percent, old[name][key], new[name][key]))
+            was, now = old[name]['p50_ms'], new[name]['p50_ms']
+            print (t.green if now <= was else t.red)('{0:<28} {1}'.format(name[:28], ', '.join(changes)))
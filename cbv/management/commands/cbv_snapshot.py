@@ -0,0 +1,31 @@
+import os
+from optparse import make_option
+
+from django.core.management.base import CommandError, LabelCommand
+
+from blessings import Terminal
+from cbv.snapshot import Snapshot
+
+t = Terminal()
+
+
+class Command(LabelCommand):
+    """Write a binary snapshot of one or more versions, to <version>.ccbv."""
+    args = '<version version ...>'
+    label = 'version'
+    option_list = LabelCommand.option_list + (
+        make_option('-d', '--directory',
+            dest='directory',
+            default='.',
+            help='Write the snapshots to this directory.'),
+    )
+
+    def handle_label(self, label, **options):
+        try:
+            snapshot = Snapshot.from_database(label)
+        except ValueError as e:
+            raise CommandError(e)
+        filename = os.path.join(options['directory'], label + '.ccbv')
+        snapshot.save(filename)
+        print t.blue('Django ' + label + ': ') + t.green('{0} ({1} bytes)'.format(
+            filename, os.path.getsize(filename)))
@@ -0,0 +1,32 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from blessings import Terminal
+from cbv.models import Source
+
+t = Terminal()
+
+
+class Command(NoArgsCommand):
+    help = ('Reports how much space storing the code of methods and functions '
+            'once per content hash saves.')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--prune',
+            action='store_true',
+            dest='prune',
+            default=False,
+            help='First delete the sources no method or function uses.'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['prune']:
+            Source.objects.delete_unused()
+        usage = Source.objects.get_usage()
+        saved = usage['used_bytes'] - usage['stored_bytes']
+        print t.blue('Methods and functions: ') + t.green(str(usage['uses']))
+        print t.blue('Sources: ') + t.green(str(usage['sources']))
+        print t.blue('Code: ') + t.green('{0} bytes, stored in {1}'.format(
+            usage['used_bytes'], usage['stored_bytes']))
+        print t.red('Saved {0} bytes ({1:.0f}%)'.format(
+            saved, 100.0 * saved / usage['used_bytes'] if usage['used_bytes'] else 0))
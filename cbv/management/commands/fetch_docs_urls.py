@@ -1,19 +1,92 @@
+import os
+import tempfile
+import urllib2
+from multiprocessing.pool import ThreadPool
+from optparse import make_option
+
 from blessings import Terminal
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from sphinx.ext.intersphinx import fetch_inventory
 
+from cbv.bundles import write_bundle
 from cbv.models import Klass, ProjectVersion
+from cbv.pagecache import bump_generation
+from cbv.surrogates import get_klass_key, purge
 
 t = Terminal()
 
 
+class InventoryApp(object):
+    """ Stands in for the Sphinx app that `fetch_inventory` reports to """
+    srcdir = ''
+
+    def __init__(self):
+        self.warnings = []
+
+    def warn(self, msg):
+        self.warnings.append(msg)
+
+
+def update_docs_urls(changes, batch_size=250):
+    """
+    Set the docs_url of many classes with one UPDATE ... CASE statement.
+
+    `changes` is a list of (pk, url). They are batched only to stay under
+    SQLite's limit on query parameters.
+    """
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {column} = CASE {pk} {whens} END WHERE {pk} IN ({pks})'
+    cursor = connection.cursor()
+    for start in xrange(0, len(changes), batch_size):
+        batch = changes[start:start + batch_size]
+        params = []
+        for pk, url in batch:
+            params += [pk, url]
+        params += [pk for pk, url in batch]
+        cursor.execute(sql.format(
+            table=qn(Klass._meta.db_table),
+            column=qn(Klass._meta.get_field('docs_url').column),
+            pk=qn(Klass._meta.pk.column),
+            whens=' '.join(['WHEN %s THEN %s'] * len(batch)),
+            pks=', '.join(['%s'] * len(batch)),
+        ), params)
+    transaction.set_dirty()
+
+
 class Command(BaseCommand):
-    args = ''
+    args = '[<version> <version> ...]'
     help = 'Fetches the docs urls for CBV Classes.'
-    django_doc_url = 'https://docs.djangoproject.com/en/{version}'
-    # versions of Django which are supported by CCBV
-    django_versions = ProjectVersion.objects.values_list('version_number',
-        flat=True)
+    option_list = BaseCommand.option_list + (
+        make_option('--inventory',
+            action='append',
+            dest='inventories',
+            default=[],
+            help='A local objects.inv for a version, as VERSION=PATH. May be given more than once.'),
+        make_option('--cache',
+            dest='cache',
+            default=None,
+            help='Read inventories from <version>.inv in this directory, and save the ones fetched there.'),
+        make_option('--offline',
+            action='store_true',
+            dest='offline',
+            default=False,
+            help="Don't fetch anything; skip versions without a local or cached inventory."),
+        make_option('--workers',
+            type='int',
+            dest='workers',
+            default=4,
+            help='How many inventories to fetch at the same time.'),
+        make_option('--docs-url',
+            dest='docs_url',
+            default='https://docs.djangoproject.com/en/{version}',
+            help='Where the docs are, with {version} in place of the version.'),
+        make_option('--timeout',
+            type='float',
+            dest='timeout',
+            default=10,
+            help='Seconds to wait for a docs host before giving up on its inventory.'),
+    )
     # Django has custom inventory file name
     inv_filename = '_objects'
 
@@ -23,43 +96,127 @@ class Command(BaseCommand):
         z = t.green(msg)
         print a + z
 
-    def handle(self, *args, **options):
+    def handle(self, *versions, **options):
         """
         Docs urls for Classes can differ between Django versions.
         This script sets correct urls for specific Classes using bits from
         `sphinx.ext.intersphinx` to fetch docs inventory data.
         """
+        self.options = options
+        self.inventories = {}
+        for inventory in options['inventories']:
+            version, sep, filename = inventory.partition('=')
+            if not sep:
+                raise CommandError('--inventory should look like 1.7=path/to/objects.inv')
+            self.inventories[version] = os.path.abspath(filename)
+
+        # versions of Django which are supported by CCBV
+        versions = versions or ProjectVersion.objects.values_list('version_number', flat=True)
+        versions = list(versions)
+        if not versions:
+            return
+
+        # Inventories are fetched in threads; the database is only touched here.
+        pool = ThreadPool(min(options['workers'], len(versions)))
+        updated = 0
+        self.purge_keys = []
+        try:
+            for version, invdata, warnings in pool.imap_unordered(self.get_inventory, versions):
+                for warning in warnings:
+                    self.bless_prints(version, t.red(warning))
+                if invdata is not None:
+                    changed = self.update(version, invdata)
+                    if changed:
+                        self.write_bundles(version)
+                    updated += changed
+        finally:
+            pool.close()
+            pool.join()
+            if updated:
+                bump_generation()
+                self.purge()
+
+    def write_bundles(self, version):
+        """ Bundles hold the docs urls too """
+        for project_version in ProjectVersion.objects.filter(version_number=version).select_related('project'):
+            self.bless_prints(version, 'Wrote ' + write_bundle(project_version))
+
+    def purge(self):
+        """ Purge the pages that changed from the CDN, if there is one """
+        try:
+            keys = purge(self.purge_keys)
+        except IOError as e:
+            print t.red('Could not purge the CDN: {0}'.format(e))
+        else:
+            print t.green('Purged {0} surrogate keys'.format(len(keys)))
+
+    def get_inventory(self, version):
+        """ Returns (version, inventory data or None, warnings) """
+        app = InventoryApp()
+        ver_url = self.options['docs_url'].format(version=version)
+        ver_inv_url = ver_url + '/' + self.inv_filename
+        cached = None
+        if self.options['cache']:
+            cached = os.path.join(self.options['cache'], version + '.inv')
+
+        temporary = None
+        if version in self.inventories:
+            inv = self.inventories[version]
+        elif cached and os.path.exists(cached):
+            inv = cached
+        elif self.options['offline']:
+            return version, None, ['No local inventory, skipping']
+        else:
+            # Fetched here rather than by fetch_inventory, which never times out.
+            if cached:
+                inv = cached
+            else:
+                handle, inv = tempfile.mkstemp(suffix='.inv')
+                os.close(handle)
+                temporary = inv
+            try:
+                self.download(ver_inv_url, inv)
+            except (IOError, urllib2.URLError) as e:
+                if temporary:
+                    os.remove(temporary)
+                return version, None, ['Could not fetch {0}: {1}'.format(ver_inv_url, e)]
+        try:
+            # the first arg should be a Sphinx instance object..
+            invdata = fetch_inventory(app, ver_url, inv)
+        finally:
+            if temporary:
+                os.remove(temporary)
+        return version, invdata, app.warnings
+
+    def download(self, url, filename):
+        data = urllib2.urlopen(url, timeout=self.options['timeout']).read()
+        # Written aside and moved, so a failed fetch doesn't leave a bad cache.
+        partial = filename + '.part'
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.rename(partial, filename)
+
+    @transaction.commit_on_success
+    def update(self, version, invdata):
+        # we only want classes which come from django.views, by name
+        urls = {}
+        for item, (project, item_version, url, display) in invdata.get(u'py:class', {}).iteritems():
+            if 'django.views.' in item:
+                urls[item.split('.')[-1]] = url
+
+        ver_classes = Klass.objects.filter(
+            module__project_version__version_number=version,
+        ).values_list('pk', 'name', 'docs_url', 'module__name', 'module__project_version__project__name')
+        self.bless_prints(version, 'Found {0} classes'.format(len(ver_classes)))
 
-        for v in self.django_versions:
-            cnt = 1
-
-            ver_url = self.django_doc_url.format(version=v)
-            ver_inv_url = ver_url + '/' + self.inv_filename
-
-            # get flat list of CBV classes per Django version
-            qs_lookups = {'module__project_version__version_number': v}
-            ver_classes = Klass.objects.filter(**qs_lookups).values_list(
-                'name', flat=True)
-            self.bless_prints(v, 'Found {0} classes'.format(len(ver_classes)))
-            self.bless_prints(v, 'Getting inventory @ {0}'.format(ver_inv_url))
-            # fetch some inventory dataz
-            # the arg `None` should be a Sphinx instance object..
-            invdata = fetch_inventory(None, ver_url, ver_inv_url)
-            # we only want classes..
-            for item in invdata[u'py:class']:
-                # ..which come from django.views
-                if 'django.views.' in item:
-                    # get class name
-                    inv_klass = item.split('.')[-1]
-                    # save hits to db and update only required classes
-                    for vc in ver_classes:
-                        if vc == inv_klass:
-                            url = invdata[u'py:class'][item][2]
-                            qs_lookups.update({
-                                'name': inv_klass
-                            })
-                            Klass.objects.filter(**qs_lookups).update(
-                                docs_url=url)
-                            cnt += 1
-                            continue
-            self.bless_prints(v, 'Updated {0} classes\n'.format(cnt))
+        matched = [(pk, urls[name], docs_url) for pk, name, docs_url, module, project in ver_classes if name in urls]
+        changes = [(pk, url) for pk, url, docs_url in matched if url != docs_url]
+        update_docs_urls(changes)
+        # A class's docs link is only on its own page.
+        changed = set(pk for pk, url in changes)
+        self.purge_keys += [
+            get_klass_key(project, version, module, name)
+            for pk, name, docs_url, module, project in ver_classes if pk in changed
+        ]
+        self.bless_prints(version, 'Matched {0} classes, updated {1}\n'.format(len(matched), len(changes)))
+        return len(changes)
@@ -0,0 +1,87 @@
+import glob
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blessings import Terminal
+from cbv.bundles import write_bundle
+from cbv.extraction import FIXTURE_SOURCES
+from cbv.loading import BulkLoader, read_fixture
+from cbv.models import Function, Method, ProjectVersion
+from cbv.pagecache import bump_generation
+from cbv.surrogates import get_locations, get_populate_keys, purge
+
+t = Terminal()
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'fixtures')
+
+
+class Command(BaseCommand):
+    args = '[<fixture> <fixture> ...]'
+    help = ('Loads cbv fixtures (dumped by cbv_dumpversion) or .ccbv snapshots '
+            '(written by cbv_snapshot) much faster than loaddata. Versions that '
+            'are already loaded are replaced. The sources.json beside the fixtures '
+            'is loaded with them. Defaults to every fixture in cbv/fixtures.')
+
+    def handle(self, *filenames, **options):
+        if not filenames:
+            filenames = sorted(glob.glob(os.path.join(os.path.normpath(FIXTURE_DIR), '*.json')))
+        filenames = self.add_sources(filenames)
+
+        start = time.time()
+        objects = []
+        for filename in filenames:
+            objects.extend(read_fixture(filename))
+        parsed = time.time() - start
+        befores = dict(
+            (key, get_locations(*key)) for key in set(
+                (obj['fields']['project'][0], obj['fields']['version_number'])
+                for obj in objects if obj['model'] == 'cbv.projectversion'))
+
+        loader = BulkLoader(using=options.get('database', 'default'))
+        try:
+            with transaction.commit_on_success(using=loader.using):
+                loader.load(objects)
+        except ValueError as e:
+            raise CommandError(e)
+        total = time.time() - start
+
+        print t.blue('Parsed {0} fixtures in {1:.2f}s'.format(len(filenames), parsed))
+        for model, count in loader.counts.items():
+            print t.blue(model.__name__ + ': ') + t.green(self.rate(count, loader.timings[model]))
+        print t.blue('Source: ') + t.green('{0} methods and functions share {1} sources'.format(
+            loader.counts[Method] + loader.counts[Function], len(loader.sources)))
+        print t.red('Loaded ' + self.rate(sum(loader.counts.values()), total))
+
+        purge_keys = []
+        for project_name, version_number in loader.versions:
+            project_version = ProjectVersion.objects.select_related('project').get(
+                project__name=project_name, version_number=version_number)
+            print t.blue(unicode(project_version) + ': ') + t.green('Wrote ' + write_bundle(project_version))
+            purge_keys += get_populate_keys(project_version, befores.get((project_name, version_number)))
+        bump_generation()
+        self.purge(purge_keys)
+
+    def purge(self, purge_keys):
+        """ Purge the pages of the versions from the CDN, if there is one """
+        try:
+            keys = purge(purge_keys)
+        except IOError as e:
+            print t.red('Could not purge the CDN: {0}'.format(e))
+        else:
+            print t.green('Purged {0} surrogate keys'.format(len(keys)))
+
+    def add_sources(self, filenames):
+        """ The fixtures, and the sources.json in each of their directories """
+        paths = [os.path.abspath(filename) for filename in filenames]
+        for directory in sorted(set(os.path.dirname(path) for path in paths)):
+            sources = os.path.join(directory, FIXTURE_SOURCES)
+            if os.path.exists(sources) and sources not in paths:
+                paths.append(sources)
+        return paths
+
+    def rate(self, count, elapsed):
+        return '{0} objects in {1:.2f}s ({2:.0f}/s)'.format(
+            count, elapsed, count / elapsed if elapsed else 0)
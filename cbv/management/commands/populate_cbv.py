@@ -1,12 +1,21 @@
 import inspect
+import os
 import sys
+import time
+from importlib import import_module
+from optparse import make_option
 
 import django
 from django.core.management.base import BaseCommand
 from django.views import generic
 
 from blessings import Terminal
-from cbv.models import Project, ProjectVersion, Module, Klass, Inheritance, KlassAttribute, ModuleAttribute, Method, Function
+from cbv.bundles import write_bundle
+from cbv.extraction import (Extraction, SourceExtractor, SourceIndex, SourceLookup,
+    compare_extractions, find_source_root, get_source_version, in_module, reset_project_version)
+from cbv.models import Module, Klass, Inheritance, KlassAttribute, ModuleAttribute, Method, Function, Source
+from cbv.pagecache import bump_generation
+from cbv.surrogates import get_locations, get_populate_keys, purge
 
 t = Terminal()
 
@@ -14,7 +23,32 @@ t = Terminal()
 class Command(BaseCommand):
     args = ''
     help = 'Wipes and populates the CBV inspection models.'
-    target = generic
+    option_list = BaseCommand.option_list + (
+        make_option('--source',
+            dest='source',
+            default=None,
+            help='Parse the package out of this source tree with `ast` rather than importing the installed version.'),
+        make_option('--compare',
+            dest='compare',
+            default=None,
+            help='With --source, compare the parsed data against this fixture rather than saving it.'),
+        make_option('--cross-check',
+            action='store_true',
+            dest='cross_check',
+            default=False,
+            help='After populating, check the result against the `ast` parser run over the installed source.'),
+        make_option('--no-source-index',
+            action='store_false',
+            dest='source_index',
+            default=True,
+            help='Look up source with plain `inspect` calls rather than indexing each file once.'),
+        make_option('--target',
+            action='append',
+            dest='targets',
+            default=None,
+            help='A package or module to populate from. May be given more than once. Defaults to django.views.generic.'),
+    )
+    targets = (generic.__name__,)
     banned_attr_names = (
         '__all__',
         '__builtins__',
@@ -30,41 +64,105 @@ class Command(BaseCommand):
     )
 
     def handle(self, *args, **options):
-        # Delete ALL of the things.
-        ProjectVersion.objects.filter(
-            project__name__iexact='Django',
-            version_number=django.get_version(),
-        ).delete()
-        Inheritance.objects.filter(
-            parent__module__project_version__project__name__iexact='Django',
-            parent__module__project_version__version_number=django.get_version(),
-        ).delete()
-
-        # Setup Project
-        self.project_version = ProjectVersion.objects.create(
-            project=Project.objects.get_or_create(name='Django')[0],
-            version_number=django.get_version(),
-        )
+        if options['targets']:
+            self.targets = tuple(options['targets'])
+        if options['source']:
+            return self.handle_source(options['source'], options['compare'])
+
+        start = time.time()
+        before = get_locations('Django', django.get_version())
+        self.project_version = reset_project_version(django.get_version())
 
+        self.source = SourceIndex() if options['source_index'] else SourceLookup()
         self.klasses = {}
         self.attributes = {}
         self.klass_imports = {}
+        self.visited = set()
         print t.red('Tree traversal')
-        self.process_member(self.target, self.target.__name__)
+        for target in self.targets:
+            self.traverse(import_module(target))
         self.create_inheritance()
         self.create_attributes()
+        self.save_bundle()
+        bump_generation()
+        self.purge(before)
+
+        print ''
+        print t.red('Timing')
+        print '{0} source lookups took {1:.3f}s of {2:.3f}s'.format(
+            self.source.lookups, self.source.elapsed, time.time() - start)
+
+        if options['cross_check']:
+            root = os.path.dirname(os.path.dirname(django.__file__))
+            extraction = SourceExtractor(root, self.targets).extract()
+            self.print_differences(
+                Extraction.from_project_version(self.project_version),
+                extraction,
+            )
+
+    def handle_source(self, source, compare=None):
+        """
+        Populate from a source tree without importing anything from it.
+
+        `source` may be the directory containing the `django` package or the
+        package directory itself.
+        """
+        root = find_source_root(source)
+        version_number = get_source_version(root)
+
+        print t.red('Parsing Django {0} at {1}'.format(version_number, root))
+        extraction = SourceExtractor(root, self.targets).extract(version_number)
+
+        if compare:
+            self.print_differences(Extraction.from_fixture(compare), extraction)
+            return
+
+        before = get_locations('Django', version_number)
+        self.project_version = reset_project_version(version_number)
+        extraction.save(self.project_version)
+        print t.green('Saved {0} classes and {1} methods'.format(
+            len(extraction.klasses), len(extraction.methods)))
+        self.save_bundle()
+        bump_generation()
+        self.purge(before)
+
+    def save_bundle(self):
+        print t.green('Wrote ' + write_bundle(self.project_version))
+
+    def purge(self, before):
+        """ Purge the pages that changed from the CDN, if there is one """
+        try:
+            keys = purge(get_populate_keys(self.project_version, before))
+        except IOError as e:
+            print t.red('Could not purge the CDN: {0}'.format(e))
+        else:
+            print t.green('Purged {0} surrogate keys'.format(len(keys)))
+
+    def print_differences(self, expected, actual):
+        print ''
+        print t.red('Cross check')
+        differences = compare_extractions(expected, actual)
+        for difference in differences:
+            print t.yellow(difference)
+        print '{0} differences'.format(len(differences))
+
+    def is_target(self, name):
+        return any(in_module(name, target) for target in self.targets)
 
     def ok_to_add_module(self, member, parent):
-        if member.__package__ is None or not member.__name__.startswith(self.target.__name__):
+        if parent is None:
+            # Always walk the targets themselves.
+            return True
+        if member.__package__ is None or not self.is_target(member.__name__):
             return False
         return True
 
     def ok_to_add_klass(self, member, parent):
-        if member.__name__.startswith(self.target.__name__):  # TODO: why?
+        if self.is_target(member.__name__):  # TODO: why?
             return False
         try:
-            if inspect.getsourcefile(member) != inspect.getsourcefile(parent):
-                if parent.__name__ in member.__module__:
+            if self.source.getsourcefile(member) != self.source.getsourcefile(parent):
+                if in_module(member.__module__, parent.__name__):
                     self.add_new_import_path(member, parent)
                 return False
         except TypeError:
@@ -72,19 +170,19 @@ class Command(BaseCommand):
         return True
 
     def ok_to_add_method(self, member, parent):
-        if inspect.getsourcefile(member) != inspect.getsourcefile(parent):
+        if self.source.getsourcefile(member) != self.source.getsourcefile(parent):
             return False
 
         # Use line inspection to work out whether the method is defined on this
         # klass. Possibly not the best way, but I can't think of another atm.
-        lines, start_line = inspect.getsourcelines(member)
-        parent_lines, parent_start_line = inspect.getsourcelines(parent)
+        lines, start_line = self.source.getsourcelines(member)
+        parent_lines, parent_start_line = self.source.getsourcelines(parent)
         if start_line < parent_start_line or start_line > parent_start_line + len(parent_lines):
             return False
         return True
 
     def ok_to_add_function(self, member, member_name, parent):
-        if inspect.getsourcefile(member) != inspect.getsourcefile(parent):
+        if self.source.getsourcefile(member) != self.source.getsourcefile(parent):
             return False
         return True
 
@@ -100,7 +198,7 @@ class Command(BaseCommand):
 
     def get_code(self, member):
             # Strip unneeded whitespace from beginning of code lines
-            lines, start_line = inspect.getsourcelines(member)
+            lines, start_line = self.source.getsourcelines(member)
             whitespace = len(lines[0]) - len(lines[0].lstrip())
             for i, line in enumerate(lines):
                 lines[i] = line[whitespace:]
@@ -137,7 +235,7 @@ class Command(BaseCommand):
 
     def get_line_number(self, member):
         try:
-            return inspect.getsourcelines(member)[1]
+            return self.source.getsourcelines(member)[1]
         except TypeError:
             return -1
 
@@ -154,6 +252,7 @@ class Command(BaseCommand):
             existing_member = Klass.objects.get(
                 module__project_version__project__name__iexact='Django',
                 module__project_version__version_number=django.get_version(),
+                module__name=member.__module__,
                 name=member.__name__)
         except Klass.DoesNotExist:
             return
@@ -170,7 +269,31 @@ class Command(BaseCommand):
             return True
         return False
 
+    def traverse(self, root):
+        """
+        Walk everything under root, depth first.
+
+        Pending members are kept on a stack rather than recursing, and each
+        module and class is only walked once however many parents it can be
+        reached from.
+        """
+        stack = [(root, root.__name__, None, None)]
+        while stack:
+            member, member_name, parent, parent_node = stack.pop()
+            this_node = self.process_member(member, member_name, parent, parent_node)
+            if this_node is None:
+                continue
+            # INSPECTION. We have to go deeper ;)
+            submembers = inspect.getmembers(member)
+            stack.extend(
+                (submember, submember_name, member, this_node)
+                for submember_name, submember in reversed(submembers)
+            )
+
     def process_member(self, member, member_name, parent=None, parent_node=None):
+        """
+        Save member, returning its node if its own members should be walked.
+        """
         # BUILTIN
         if inspect.isbuiltin(member):
             return
@@ -180,6 +303,9 @@ class Command(BaseCommand):
             # Only traverse under hierarchy
             if not self.ok_to_add_module(member, parent):
                 return
+            if member in self.visited:
+                return
+            self.visited.add(member)
 
             filename = self.get_filename(member)
             print t.yellow('module ' + member.__name__), filename
@@ -196,6 +322,9 @@ class Command(BaseCommand):
         elif inspect.isclass(member) and inspect.ismodule(parent):
             if not self.ok_to_add_klass(member, parent):
                 return
+            if member in self.visited:
+                return
+            self.visited.add(member)
 
             self.add_new_import_path(member, parent)
             import_path = self.klass_imports[member]
@@ -226,7 +355,7 @@ class Command(BaseCommand):
                 klass=parent_node,
                 name=member_name,
                 docstring=self.get_docstring(member),
-                code=code,
+                source=Source.objects.for_code(code),
                 kwargs=arguments[1:-1],
                 line_number=start_line,
             )
@@ -245,7 +374,7 @@ class Command(BaseCommand):
                 module=parent_node,
                 name=member_name,
                 docstring=self.get_docstring(member),
-                code=code,
+                source=Source.objects.for_code(code),
                 kwargs=arguments[1:-1],
                 line_number=start_line,
             )
@@ -283,16 +412,8 @@ class Command(BaseCommand):
             print '{key} = {val}'.format(key=this_node.name, val=this_node.value)
             go_deeper = False
 
-        # INSPECTION. We have to go deeper ;)
         if go_deeper:
-            # Go through members
-            for submember_name, submember_type in inspect.getmembers(member):
-                self.process_member(
-                    member=submember_type,
-                    member_name=submember_name,
-                    parent=member,
-                    parent_node=this_node
-                )
+            return this_node
 
     def create_inheritance(self):
         print ''
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import time
+from functools import partial
+from optparse import make_option
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blessings import Terminal
+from cbv.bundles import write_bundle
+from cbv.extraction import extract_source, reset_project_version
+from cbv.pagecache import bump_generation
+from cbv.surrogates import get_locations, get_populate_keys, purge
+
+t = Terminal()
+
+
+class Command(BaseCommand):
+    args = '<source> [<source> ...]'
+    help = ('Populates the CBV inspection models for several Django versions '
+            'at once, from source trees or sdist tarballs.')
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+            type='int',
+            dest='workers',
+            default=multiprocessing.cpu_count(),
+            help='How many versions to parse at the same time.'),
+        make_option('--short-versions',
+            action='store_true',
+            dest='short_versions',
+            default=False,
+            help='Save versions as major.minor (eg. 1.7 rather than 1.7.1), like the fixtures.'),
+        make_option('--fixtures',
+            dest='fixtures',
+            default=None,
+            help='Also dump each version to <version>.json in this directory.'),
+        make_option('--target',
+            action='append',
+            dest='targets',
+            default=None,
+            help='A package or module to populate from. May be given more than once. Defaults to django.views.generic.'),
+    )
+    targets = ('django.views.generic',)
+
+    def handle(self, *sources, **options):
+        if not sources:
+            raise CommandError('Give at least one source tree or tarball.')
+        for source in sources:
+            if not os.path.exists(source):
+                raise CommandError('{0} does not exist.'.format(source))
+
+        extract = partial(
+            extract_source,
+            target=tuple(options['targets'] or self.targets),
+            short_version=options['short_versions'],
+        )
+        # Every source gets a fresh process; parsing never touches the database,
+        # so only this process saves anything.
+        pool = multiprocessing.Pool(
+            processes=min(options['workers'], len(sources)),
+            maxtasksperchild=1,
+        )
+        start = time.time()
+        self.purge_keys = []
+        try:
+            for extraction in pool.imap_unordered(extract, sources):
+                project_version = self.save(extraction)
+                write_bundle(project_version)
+                if options['fixtures']:
+                    self.dump(extraction.version_number, options['fixtures'])
+        finally:
+            pool.terminate()
+            pool.join()
+            bump_generation()
+            self.purge()
+        print t.red('Populated {0} versions in {1:.2f}s'.format(len(sources), time.time() - start))
+
+    @transaction.commit_on_success
+    def save(self, extraction):
+        before = get_locations('Django', extraction.version_number)
+        project_version = reset_project_version(extraction.version_number)
+        extraction.save(project_version)
+        self.purge_keys += get_populate_keys(project_version, before)
+        print t.blue('Django ' + extraction.version_number + ': ') + t.green(
+            '{0} modules, {1} classes, {2} methods'.format(
+                len(extraction.modules),
+                len(extraction.klasses),
+                len(extraction.methods),
+            ))
+        return project_version
+
+    def purge(self):
+        """ Purge the pages that changed from the CDN, if there is one """
+        try:
+            keys = purge(self.purge_keys)
+        except IOError as e:
+            print t.red('Could not purge the CDN: {0}'.format(e))
+        else:
+            print t.green('Purged {0} surrogate keys'.format(len(keys)))
+
+    def dump(self, version_number, directory):
+        filename = os.path.join(directory, version_number + '.json')
+        call_command('cbv_dumpversion', version_number, output=filename, sources=True)
+        print t.blue('Django ' + version_number + ': ') + t.green('Dumped ' + filename)
@@ -0,0 +1,71 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blessings import Terminal
+from cbv.models import ProjectVersion
+from cbv.warming import get_urls, warm
+
+t = Terminal()
+
+
+class Command(BaseCommand):
+    args = '[<version> ...]'
+    help = ('Renders every canonical page of some or all versions into the '
+            'configured caches, so the first visitors (and crawlers) find '
+            'them warm. Only useful with a shared cache, such as memcached.')
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+            type='int',
+            dest='workers',
+            default=4,
+            help='How many pages to render at the same time.'),
+        make_option('--rate',
+            type='float',
+            dest='rate',
+            default=None,
+            help='Render at most this many pages a second, to spare the database.'),
+        make_option('--no-api',
+            action='store_false',
+            dest='api',
+            default=True,
+            help='Leave out the JSON API of each class.'),
+        make_option('--host',
+            dest='host',
+            default='localhost',
+            help='The Host header to send.'),
+    )
+
+    def handle(self, *versions, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        missing = set(versions) - set(ProjectVersion.objects.filter(
+            version_number__in=versions).values_list('version_number', flat=True))
+        if missing:
+            raise CommandError('No such versions: ' + ', '.join(sorted(missing)))
+
+        urls = get_urls(versions, api=options['api'])
+        print t.blue('Warming {0} pages with {1} workers{2}'.format(
+            len(urls), options['workers'],
+            ' at up to {0:g} a second'.format(options['rate']) if options['rate'] else ''))
+        results = warm(urls, options['workers'], options['rate'], options['host'],
+                       progress=self.progress(len(urls)))
+
+        for kind, summary in sorted(results['kinds'].items()):
+            print (t.red if summary['errors'] else t.green)(
+                '{0:<8} {1:>5} pages, {2} errors, {3:.1f}ms each'.format(
+                    kind, summary['pages'], summary['errors'], summary['seconds'] * 1000 / summary['pages']))
+        for url, error in results['failures']:
+            print t.red('    {0}: {1}'.format(url, error))
+        print t.blue('Cache: {0} entries ({1} writes), {2:.1f}KB'.format(
+            results['cache_entries'], results['cache_writes'], results['cache_bytes'] / 1024.0))
+        print t.red('Warmed {0} pages in {1:.2f}s'.format(len(urls), results['seconds']))
+
+    def progress(self, total):
+        step = max(total // 10, 1)
+
+        def progress(done, fill):
+            if done % step == 0 or done == total:
+                print t.blue('  {0}/{1} pages, {2} cache entries, {3:.1f}KB'.format(
+                    done, total, fill.entries, fill.bytes / 1024.0))
+        return progress
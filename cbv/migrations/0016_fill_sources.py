@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        "Move the code of every method and function into Source, once per content hash."
+        for model in (orm.Method, orm.Function):
+            for pk, code in model.objects.values_list('pk', 'code').iterator():
+                content_hash = hashlib.sha1(code.encode('utf-8')).hexdigest()
+                orm.Source.objects.get_or_create(content_hash=content_hash, defaults={'code': code})
+                model.objects.filter(pk=pk).update(source=content_hash)
+
+    def backwards(self, orm):
+        "Copy the code back out of Source."
+        for model in (orm.Method, orm.Function):
+            for pk, code in model.objects.values_list('pk', 'source__code').iterator():
+                model.objects.filter(pk=pk).update(code=code)
+        for pk, content_hash in orm.Method.objects.values_list('pk', 'source').iterator():
+            orm.Method.objects.filter(pk=pk).update(content_hash=content_hash)
+
+    models = {
+        u'cbv.function': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'Function'},
+            'code': ('django.db.models.fields.TextField', [], {}),
+            'docstring': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kwargs': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'line_number': ('django.db.models.fields.IntegerField', [], {}),
+            'module': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Module']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Source']", 'null': 'True'})
+        },
+        u'cbv.inheritance': {
+            'Meta': {'ordering': "('order',)", 'unique_together': "(('child', 'order'),)", 'object_name': 'Inheritance'},
+            'child': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'ancestor_relationships'", 'to': u"orm['cbv.Klass']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'order': ('django.db.models.fields.IntegerField', [], {}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Klass']"})
+        },
+        u'cbv.klass': {
+            'Meta': {'ordering': "('module__name', 'name')", 'unique_together': "(('module', 'name'),)", 'object_name': 'Klass'},
+            'docs_url': ('django.db.models.fields.URLField', [], {'default': "''", 'max_length': '255'}),
+            'docstring': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'import_path': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'line_number': ('django.db.models.fields.IntegerField', [], {}),
+            'module': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Module']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'cbv.klassattribute': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('klass', 'name'),)", 'object_name': 'KlassAttribute'},
+            'content_hash': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '40'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'klass': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'attribute_set'", 'to': u"orm['cbv.Klass']"}),
+            'line_number': ('django.db.models.fields.IntegerField', [], {}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'value': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'cbv.method': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'Method'},
+            'code': ('django.db.models.fields.TextField', [], {}),
+            'content_hash': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '40'}),
+            'docstring': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'klass': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Klass']"}),
+            'kwargs': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'line_number': ('django.db.models.fields.IntegerField', [], {}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Source']", 'null': 'True'})
+        },
+        u'cbv.module': {
+            'Meta': {'unique_together': "(('project_version', 'name'),)", 'object_name': 'Module'},
+            'docstring': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            'filename': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '511'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'project_version': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.ProjectVersion']"})
+        },
+        u'cbv.moduleattribute': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('module', 'name'),)", 'object_name': 'ModuleAttribute'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'line_number': ('django.db.models.fields.IntegerField', [], {}),
+            'module': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'attribute_set'", 'to': u"orm['cbv.Module']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'value': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'cbv.project': {
+            'Meta': {'object_name': 'Project'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '200'})
+        },
+        u'cbv.projectversion': {
+            'Meta': {'ordering': "('-version_number',)", 'unique_together': "(('project', 'version_number'),)", 'object_name': 'ProjectVersion'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'project': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['cbv.Project']"}),
+            'version_number': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        u'cbv.source': {
+            'Meta': {'object_name': 'Source'},
+            'code': ('django.db.models.fields.TextField', [], {}),
+            'content_hash': ('django.db.models.fields.CharField', [], {'max_length': '40', 'primary_key': 'True'}),
+            'html': ('django.db.models.fields.TextField', [], {'default': "''"})
+        }
+    }
+
+    complete_apps = ['cbv']
+    symmetrical = True
@@ -1,4 +1,16 @@
+import hashlib
+import json
+
 from django.db import models
+from django.db.models.signals import pre_save
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+
+
+def get_content_hash(content):
+    """ What Source and KlassAttribute rows are compared by, across versions """
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
 
 
 class ProjectManager(models.Manager):
@@ -34,7 +46,8 @@ class ProjectVersionManager(models.Manager):
             )
 
     def get_latest(self, name):
-        return self.order_by('-version_number')[0]
+        """ The latest version of the project called `name`; IndexError if there's none """
+        return self.filter(project__name__iexact=name).select_related('project').order_by('-version_number')[0]
 
 
 class ProjectVersion(models.Model):
@@ -227,7 +240,7 @@ class Klass(models.Model):
 
     def get_methods(self):
         if not hasattr(self, '_methods'):
-            methods = self.method_set.all().select_related('klass')
+            methods = self.method_set.all().select_related('klass', 'source')
             for ancestor in self.get_all_ancestors():
                 methods = methods | ancestor.get_methods()
             self._methods = methods
@@ -274,6 +287,27 @@ class Klass(models.Model):
                 a.overridden = True
         return attributes
 
+    def get_fingerprint(self):
+        """
+        A hash of what the attributes and methods on the class page are made
+        of: the MRO, and the attributes and methods along it with where (and
+        so at which URLs) they're defined. The page caches those parts by it,
+        so they're never stale, however the data got changed.
+        """
+        klasses = [self] + self.get_all_ancestors()
+        where = dict((k.pk, (k.module.name, k.name)) for k in klasses)
+        methods = sorted(
+            row[:-1] + where[row[-1]] for row in Method.objects.filter(klass__in=where).values_list(
+                'name', 'kwargs', 'docstring', 'source', 'line_number', 'klass')
+        )
+        attributes = sorted(
+            row[:-1] + where[row[-1]] for row in KlassAttribute.objects.filter(klass__in=where).values_list(
+                'name', 'value', 'line_number', 'klass')
+        )
+        version = self.module.project_version
+        data = [version.project.name, version.version_number, [where[k.pk] for k in klasses], methods, attributes]
+        return hashlib.sha1(json.dumps(data)).hexdigest()
+
     def basic_yuml_data(self, first=False):
         if hasattr(self, '_basic_yuml_data'):
             return self._basic_yuml_data
@@ -320,6 +354,8 @@ class KlassAttribute(models.Model):
     name = models.CharField(max_length=200)
     value = models.CharField(max_length=200)
     line_number = models.IntegerField()
+    # The hash of value, set before every save.
+    content_hash = models.CharField(max_length=40, default='', editable=False)
 
     class Meta:
         ordering = ('name',)
@@ -328,6 +364,16 @@ class KlassAttribute(models.Model):
     def __unicode__(self):
         return u'%s = %s' % (self.name, self.value)
 
+    def set_content_hash(self):
+        """ Called before each save; bulk_create callers have to call it themselves """
+        self.content_hash = get_content_hash(self.value)
+
+
+def set_attribute_content_hash(sender, instance, **kwargs):
+    # A signal rather than save(), as loaddata saves raw, skipping save().
+    instance.set_content_hash()
+pre_save.connect(set_attribute_content_hash, sender=KlassAttribute)
+
 
 class ModuleAttribute(models.Model):
     """ Represents an attribute on a Module """
@@ -345,13 +391,93 @@ class ModuleAttribute(models.Model):
         return u'%s = %s' % (self.name, self.value)
 
 
+class SourceManager(models.Manager):
+    def for_code(self, code):
+        return self.get_or_create(pk=get_content_hash(code), defaults={'code': code})[0]
+
+    def get_by_natural_key(self, code):
+        """
+        Fixtures dumped before sources.json knew a source by its code, so
+        loading one makes it if need be.
+        """
+        return self.for_code(code)
+
+    def get_existing(self, content_hashes, batch_size=500):
+        """ Those of `content_hashes` there's a Source for """
+        content_hashes = list(content_hashes)
+        existing = set()
+        for start in xrange(0, len(content_hashes), batch_size):
+            existing.update(self.filter(
+                pk__in=content_hashes[start:start + batch_size]).values_list('pk', flat=True))
+        return existing
+
+    def add(self, codes, batch_size=500):
+        """
+        Make sure there is a Source for each of `codes` and return
+        {code: content hash}. Only the new ones are inserted.
+        """
+        hashes = dict((code, get_content_hash(code)) for code in codes)
+        wanted = dict((content_hash, code) for code, content_hash in hashes.items())
+        for content_hash in self.get_existing(wanted, batch_size):
+            del wanted[content_hash]
+        self.bulk_create([
+            self.model(content_hash=content_hash, code=code) for content_hash, code in wanted.items()
+        ])
+        return hashes
+
+    def delete_unused(self):
+        """ Sources no method or function uses any more, as when a version is replaced """
+        self.filter(method=None, function=None).delete()
+
+    def get_usage(self):
+        """
+        How many methods and functions there are, how many sources they
+        share, and the bytes of code each way.
+        """
+        sizes = dict((content_hash, len(code.encode('utf-8')))
+                     for content_hash, code in self.values_list('pk', 'code').iterator())
+        uses = list(Method.objects.values_list('source', flat=True))
+        uses += Function.objects.values_list('source', flat=True)
+        return {
+            'uses': len(uses),
+            'sources': len(sizes),
+            'used_bytes': sum(sizes[content_hash] for content_hash in uses),
+            'stored_bytes': sum(sizes.values()),
+        }
+
+
+class Source(models.Model):
+    """
+    The code of a method or function. Most of it is the same from one version
+    to the next, so it is stored once, under the sha1 of its text. Fixtures
+    refer to it by that too, and keep the code in a sources.json of their own.
+    """
+
+    content_hash = models.CharField(max_length=40, primary_key=True)
+    code = models.TextField()
+    # Highlighted (without line numbers) the first time it's shown.
+    html = models.TextField(default='', editable=False)
+
+    objects = SourceManager()
+
+    def __unicode__(self):
+        return self.content_hash
+
+    def get_html(self):
+        if not self.html:
+            lexer = get_lexer_by_name('python', stripall=True)
+            self.html = highlight(self.code, lexer, HtmlFormatter())
+            Source.objects.filter(pk=self.pk).update(html=self.html)
+        return self.html
+
+
 class Method(models.Model):
     """ Represents a method on a Klass """
 
     klass = models.ForeignKey(Klass)
     name = models.CharField(max_length=200)
     docstring = models.TextField(blank=True, default='')
-    code = models.TextField()
+    source = models.ForeignKey(Source)
     kwargs = models.CharField(max_length=200)
     line_number = models.IntegerField()
 
@@ -361,6 +487,10 @@ class Method(models.Model):
     class Meta:
         ordering = ('name',)
 
+    @property
+    def code(self):
+        return self.source.code
+
 
 class Function(models.Model):
     """ Represents a function on a Module """
@@ -368,7 +498,7 @@ class Function(models.Model):
     module = models.ForeignKey(Module)
     name = models.CharField(max_length=200)
     docstring = models.TextField(blank=True, default='')
-    code = models.TextField()
+    source = models.ForeignKey(Source)
     kwargs = models.CharField(max_length=200)
     line_number = models.IntegerField()
 
@@ -377,3 +507,7 @@ class Function(models.Model):
 
     class Meta:
         ordering = ('name',)
+
+    @property
+    def code(self):
+        return self.source.code
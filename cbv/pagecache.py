@@ -0,0 +1,372 @@
+"""
+Whole pages of the cbv views, cached by path under a data generation.
+
+Every key carries the current generation, a number kept in the cache
+itself. The commands that change what pages show (populate_cbv,
+populate_cbv_versions, load_cbv_fixtures and fetch_docs_urls) bump it, which
+leaves every page cached before unreachable in one write; they expire in
+their own time. The pages depend on nothing but their path: none of these
+views read the query string, the user or the session.
+
+A page is only rendered once at a time in a process: requests for a page
+that's being rendered are served the copy of an earlier generation if there
+is one, or wait for the render (see SingleFlight). With CBV_PAGE_CACHE_LOCK,
+workers also take a lock in the cache before rendering, and the others
+serve the old copy or wait for the new one to turn up in the cache.
+
+A page is fresh for CBV_PAGE_CACHE_TIMEOUT seconds, then served stale for
+another CBV_PAGE_CACHE_STALE while a thread renders it again, at most
+CBV_PAGE_CACHE_REVALIDATIONS threads at a time in a process. Responses tell
+other caches as much, with max-age and stale-while-revalidate.
+
+Turned on by CBV_PAGE_CACHE_TIMEOUT. Each process counts hits and misses by
+URL name, which staff can read at /stats/cache.json.
+"""
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+from cbv import instrumentation
+
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'cbv-generation'
+# Long enough to never expire; memcached takes it as a date.
+GENERATION_TIMEOUT = 60 * 60 * 24 * 365
+PAGE_KEY = 'cbv-page:{generation}:{path}'
+# The generation a path was last cached under, to find an old copy by.
+LAST_GENERATION_KEY = 'cbv-page-generation:{path}'
+# How often to look for a page another worker is rendering.
+POLL_INTERVAL = 0.05
+CACHEABLE_STATUSES = (200, 301, 302)
+# The headers a cached page is served with.
+KEPT_HEADERS = ('Content-Type', 'Location', 'Surrogate-Key')
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Starting from the time rather than from 1 means the pages of a
+        # generation that was evicted are never found again.
+        generation = int(time.time())
+        cache.add(GENERATION_KEY, generation, GENERATION_TIMEOUT)
+        generation = cache.get(GENERATION_KEY) or generation
+    return generation
+
+
+def bump_generation():
+    """ Leave every cached page behind. Returns the new generation. """
+    # Not cache.incr, which would give the key the default timeout outside
+    # of memcached. Bumps are rare and only ever need to move forward.
+    generation = get_generation() + 1
+    cache.set(GENERATION_KEY, generation, GENERATION_TIMEOUT)
+    return generation
+
+
+def hash_path(path):
+    return hashlib.md5(path.encode('utf-8')).hexdigest()
+
+
+def get_page_key(path, generation=None):
+    return PAGE_KEY.format(generation=generation or get_generation(), path=hash_path(path))
+
+
+def store_page(path, generation, frozen, timeout):
+    cache.set(get_page_key(path, generation), frozen, timeout)
+    cache.set(LAST_GENERATION_KEY.format(path=hash_path(path)), generation, timeout)
+
+
+def get_stale_page(path, generation):
+    """ The page as cached under an earlier generation, if it's still there """
+    last = cache.get(LAST_GENERATION_KEY.format(path=hash_path(path)))
+    if last is None or last == generation:
+        return None
+    return cache.get(get_page_key(path, last))
+
+
+class Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+    def wait(self, timeout):
+        self.event.wait(timeout)
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    Lets one thread at a time work on a key. The first to join a key leads,
+    and lands the flight with its result; those joining meanwhile can wait
+    for that result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def join(self, key):
+        """ (flight, whether this thread leads it) """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self.flights[key] = Flight()
+            return flight, True
+
+    def land(self, key, flight, result):
+        with self.lock:
+            del self.flights[key]
+        flight.result = result
+        flight.event.set()
+
+
+flights = SingleFlight()
+
+
+@contextmanager
+def worker_lock(key, timeout):
+    """ Whether this worker may render a page, with CBV_PAGE_CACHE_LOCK on """
+    if not getattr(settings, 'CBV_PAGE_CACHE_LOCK', False):
+        yield True
+        return
+    lock = key + ':lock'
+    # The lock expires, in case its holder dies before deleting it.
+    if not cache.add(lock, os.getpid(), int(timeout) + 1):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        cache.delete(lock)
+
+
+def poll(key, timeout):
+    """ A page that's being cached by another worker, once it's there """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        frozen = cache.get(key)
+        if frozen is not None:
+            return frozen
+    return None
+
+
+# How a request was served: from the cache, rendered, a stale copy (expired,
+# or of an earlier generation) while the page was being rendered, or the
+# render of another request.
+OUTCOMES = ('hits', 'misses', 'stale', 'coalesced')
+HEADERS = {'hits': 'hit', 'misses': 'miss', 'stale': 'stale', 'coalesced': 'coalesced'}
+
+
+def get_hit_rate(counts):
+    """ The share of requests served without rendering """
+    requests = sum(counts[outcome] for outcome in OUTCOMES)
+    return float(requests - counts['misses']) / requests if requests else None
+
+
+class PageCacheStats(object):
+    """ Hits and misses of this process, by view """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = datetime.utcnow()
+            self.views = {}
+
+    def add(self, name, outcome):
+        with self.lock:
+            view = self.views.get(name)
+            if view is None:
+                view = self.views[name] = dict.fromkeys(OUTCOMES + ('stored', 'revalidated'), 0)
+            view[outcome] += 1
+
+    def as_dict(self):
+        with self.lock:
+            views = {}
+            for name, view in self.views.iteritems():
+                views[name] = dict(view, hit_rate=get_hit_rate(view))
+            totals = dict((outcome, sum(view[outcome] for view in views.values())) for outcome in OUTCOMES)
+            return dict(
+                totals,
+                pid=os.getpid(),
+                since=self.since.isoformat(),
+                hit_rate=get_hit_rate(totals),
+                views=views,
+            )
+
+
+stats = PageCacheStats()
+
+
+def freeze(response, timeout):
+    """ What's kept of a response in the cache, fresh for `timeout` seconds """
+    headers = [(header, response[header]) for header in KEPT_HEADERS if response.has_header(header)]
+    return response.status_code, headers, response.content, time.time() + timeout
+
+
+def thaw(frozen):
+    status, headers, content, fresh_until = frozen
+    response = HttpResponse(content, status=status)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+def patch_page_cache_control(response, max_age, stale):
+    """ Lets shared caches keep the page as long as this cache does """
+    patch_cache_control(response, public=True, max_age=max(int(max_age), 0), stale_while_revalidate=stale)
+
+
+def serve(name, outcome, frozen, stale):
+    stats.add(name, outcome)
+    response = thaw(frozen)
+    response['X-Page-Cache'] = HEADERS[outcome]
+    patch_page_cache_control(response, frozen[3] - time.time() if outcome == 'hits' else 0, stale)
+    return response
+
+
+class BackgroundLimit(object):
+    """ How many revalidations a process runs at once """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+
+    def acquire(self, limit):
+        with self.lock:
+            if self.running >= limit:
+                return False
+            self.running += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.running -= 1
+
+
+revalidations = BackgroundLimit()
+
+
+class CachedPageMixin(object):
+    """
+    Serves a view's whole response from the cache if it's there, and caches
+    it if it's a page or a redirect. Goes first among the bases, so that a
+    hit skips all of their dispatch.
+
+    A page is fresh for CBV_PAGE_CACHE_TIMEOUT seconds, and for another
+    CBV_PAGE_CACHE_STALE it's still served while a thread renders it again.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        timeout = getattr(settings, 'CBV_PAGE_CACHE_TIMEOUT', 0)
+        if not timeout or request.method not in ('GET', 'HEAD'):
+            return super(CachedPageMixin, self).dispatch(request, *args, **kwargs)
+        stale = getattr(settings, 'CBV_PAGE_CACHE_STALE', 0)
+
+        name = instrumentation.get_view_name(request)
+        generation = get_generation()
+        key = get_page_key(request.path, generation)
+        frozen = cache.get(key)
+        if frozen is not None:
+            now = time.time()
+            if now < frozen[3]:
+                return serve(name, 'hits', frozen, stale)
+            if now < frozen[3] + stale:
+                self.revalidate(request, name, generation, key, *args, **kwargs)
+                return serve(name, 'stale', frozen, stale)
+
+        old = get_stale_page(request.path, generation)
+        wait = getattr(settings, 'CBV_PAGE_CACHE_WAIT', 10)
+        flight, leader = flights.join(key)
+        if not leader:
+            # Another thread is rendering it.
+            if old is not None:
+                return serve(name, 'stale', old, stale)
+            frozen = flight.wait(wait)
+            if frozen is not None:
+                return serve(name, 'coalesced', frozen, stale)
+            # It wasn't cacheable, or took too long.
+            stats.add(name, 'misses')
+            return self.render_page(request, generation, *args, **kwargs)[0]
+
+        frozen = None
+        try:
+            with worker_lock(key, wait) as locked:
+                if not locked:
+                    # Another worker is rendering it.
+                    if old is not None:
+                        frozen = old
+                        return serve(name, 'stale', old, stale)
+                    frozen = poll(key, wait)
+                    if frozen is not None:
+                        return serve(name, 'coalesced', frozen, stale)
+                stats.add(name, 'misses')
+                response, frozen = self.render_page(request, generation, *args, **kwargs)
+                return response
+        finally:
+            flights.land(key, flight, frozen)
+
+    def render_page(self, request, generation, *args, **kwargs):
+        """ (response, what was cached of it, if anything) """
+        timeout = settings.CBV_PAGE_CACHE_TIMEOUT
+        stale = getattr(settings, 'CBV_PAGE_CACHE_STALE', 0)
+        response = super(CachedPageMixin, self).dispatch(request, *args, **kwargs)
+        response['X-Page-Cache'] = 'miss'
+        if response.status_code not in CACHEABLE_STATUSES or getattr(response, 'streaming', False):
+            return response, None
+        if hasattr(response, 'render'):
+            response.render()
+        frozen = freeze(response, timeout)
+        # Kept for as long as it may be served stale.
+        store_page(request.path, generation, frozen, timeout + stale)
+        stats.add(instrumentation.get_view_name(request), 'stored')
+        patch_page_cache_control(response, timeout, stale)
+        return response, frozen
+
+    def revalidate(self, request, name, generation, key, *args, **kwargs):
+        """ Render the page again in a thread, unless that's in hand or too many are """
+        flight, leader = flights.join(key)
+        if not leader:
+            return
+        if not revalidations.acquire(getattr(settings, 'CBV_PAGE_CACHE_REVALIDATIONS', 2)):
+            flights.land(key, flight, None)
+            return
+        # A view instance is only meant to handle one request.
+        view = copy.copy(self)
+        thread = threading.Thread(
+            target=view.render_in_background,
+            args=(flight, key, name, copy.copy(request), generation) + args,
+            kwargs=kwargs,
+        )
+        thread.daemon = True
+        thread.start()
+
+    def render_in_background(self, flight, key, name, request, generation, *args, **kwargs):
+        frozen = None
+        try:
+            frozen = self.render_page(request, generation, *args, **kwargs)[1]
+            stats.add(name, 'revalidated')
+        except Exception:
+            logger.exception('Revalidating %s', request.path)
+        finally:
+            # Nothing closes the connections of this thread otherwise.
+            for connection in connections.all():
+                connection.close()
+            revalidations.release()
+            flights.land(key, flight, frozen)
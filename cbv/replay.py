@@ -0,0 +1,190 @@
+"""
+Replaying a mix of page requests against the WSGI application in process,
+with no server or network in between, to see how each kind of page holds up.
+
+The URLs come from the sitemap (every class page, and the home page) or from
+access logs. Each request goes through the whole stack, middleware and all,
+as a GET from a pool of threads or processes. Its time, status and query
+count are kept and summed up by URL name: percentiles of latency, throughput,
+errors and queries per request.
+"""
+import collections
+import math
+import re
+import sys
+import time
+import urlparse
+from StringIO import StringIO
+from wsgiref.util import setup_testing_defaults
+from xml.etree import ElementTree
+
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import connections
+
+from cbv import instrumentation
+
+
+SITEMAP_NAMESPACE = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+PERCENTILES = (50, 90, 99)
+
+# The request line of a common or combined format access log.
+LOG_REQUEST = re.compile(r'"GET (?P<url>\S+) HTTP/[\d.]+"')
+
+
+def get_application():
+    from inspector.wsgi import application
+    return application
+
+
+def call(application, url, host='localhost'):
+    """ (status, body) of a GET through a WSGI application """
+    path, sep, query = url.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': urlparse.unquote(path),
+        'QUERY_STRING': query,
+        'HTTP_HOST': host,
+        'wsgi.input': StringIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    setup_testing_defaults(environ)
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split(' ', 1)[0]))
+
+    result = application(environ, start_response)
+    try:
+        body = ''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return statuses[0], body
+
+
+def sitemap_urls(application=None, host='localhost'):
+    """ The paths of every page in the sitemap """
+    status, body = call(application or get_application(), '/sitemap.xml', host)
+    if status != 200:
+        raise ValueError('The sitemap returned {0}.'.format(status))
+    return [
+        urlparse.urlsplit(loc.text.strip()).path
+        for loc in ElementTree.fromstring(body).iter(SITEMAP_NAMESPACE + 'loc')
+    ]
+
+
+def log_urls(lines):
+    """ The URLs of the GET requests in access log lines, in order """
+    urls = []
+    for line in lines:
+        match = LOG_REQUEST.search(line)
+        if match:
+            url = urlparse.urlsplit(match.group('url'))
+            urls.append(url.path + ('?' + url.query if url.query else ''))
+    return urls
+
+
+def get_url_name(url):
+    try:
+        match = resolve(url.partition('?')[0])
+    except Resolver404:
+        match = None
+    return instrumentation.get_match_name(match)
+
+
+def replay_url(url, host='localhost'):
+    """ (url, status, seconds, queries, error) of one request """
+    application = get_application()
+    with instrumentation.recording() as recorder:
+        start = time.time()
+        try:
+            status, body = call(application, url, host)
+            error = None
+        except Exception as e:
+            status, error = None, '{0}: {1}'.format(type(e).__name__, e)
+        elapsed = time.time() - start
+    return url, status, elapsed, recorder.queries, error
+
+
+def _replay_url(args):
+    # Pools only map functions of one argument.
+    return replay_url(*args)
+
+
+def close_connections():
+    """ So that no connection is shared with a forked worker """
+    for connection in connections.all():
+        connection.close()
+
+
+def percentile(ordered, percent):
+    """ The nearest-rank percentile of a sorted list """
+    if not ordered:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+def summarise(times, queries, statuses, errors, seconds):
+    times = sorted(times)
+    summary = {
+        'requests': len(times),
+        'errors': errors,
+        'error_rate': float(errors) / len(times) if times else 0.0,
+        'statuses': dict((str(status), count) for status, count in statuses.items()),
+        'requests_per_second': len(times) / seconds if seconds else None,
+        'mean_ms': sum(times) * 1000 / len(times) if times else None,
+        'max_ms': times[-1] * 1000 if times else None,
+        'mean_queries': float(sum(queries)) / len(queries) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+    for percent in PERCENTILES:
+        value = percentile(times, percent)
+        summary['p{0}_ms'.format(percent)] = value * 1000 if value is not None else None
+    return summary
+
+
+def replay(urls, pool=None, host='localhost', progress=None):
+    """
+    Request every URL, through a pool's imap_unordered if given or one after
+    another here if not, and sum up the results overall and by URL name.
+    A request counts as an error if it raised or returned a 5xx.
+    """
+    names = {}
+    results = collections.defaultdict(lambda: {
+        'times': [],
+        'queries': [],
+        'statuses': collections.Counter(),
+        'errors': 0,
+        'messages': collections.Counter(),
+    })
+    mapper = pool.imap_unordered if pool is not None else map
+    start = time.time()
+    for done, (url, status, elapsed, queries, error) in enumerate(
+            mapper(_replay_url, [(url, host) for url in urls]), 1):
+        if url not in names:
+            names[url] = get_url_name(url)
+        result = results[names[url]]
+        result['times'].append(elapsed)
+        result['queries'].append(queries)
+        result['statuses'][status or 'exception'] += 1
+        if error or status >= 500:
+            result['errors'] += 1
+            result['messages'][error or str(status)] += 1
+        if progress:
+            progress(done)
+    seconds = time.time() - start
+
+    views = {}
+    for name, result in results.items():
+        views[name] = summarise(result['times'], result['queries'], result['statuses'], result['errors'], seconds)
+        views[name]['error_messages'] = dict(result['messages'])
+    times, queries, statuses, errors = [], [], collections.Counter(), 0
+    for result in results.values():
+        times += result['times']
+        queries += result['queries']
+        statuses.update(result['statuses'])
+        errors += result['errors']
+    total = summarise(times, queries, statuses, errors, seconds)
+    total['seconds'] = seconds
+    return {'total': total, 'views': views}
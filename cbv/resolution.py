@@ -0,0 +1,119 @@
+"""
+Everything the class detail page shows about a Klass, worked out in one pass.
+
+The page asks each ancestor for its own ancestors, methods and attributes,
+one query at a time. Here the version's inheritance graph is read once, and
+the methods and attributes of the whole MRO with one query each.
+"""
+import collections
+
+from django.core.urlresolvers import reverse
+
+from cbv.models import Inheritance, Klass, KlassAttribute, Method
+
+
+def get_mro(klass_id, parents):
+    """ Ancestors in the order of Klass.get_all_ancestors """
+    tree = []
+    for parent in parents.get(klass_id, ()):
+        tree.append(parent)
+        tree += get_mro(parent, parents)
+    cleaned = []
+    for ancestor in reversed(tree):
+        if ancestor not in cleaned:
+            cleaned.insert(0, ancestor)
+    return cleaned
+
+
+def get_graph(project_version):
+    """
+    ({pk: {'name', 'module'}}, parents, children) for every class in a
+    version, where parents and children map a pk to a list of pks.
+    """
+    klasses = dict(
+        (pk, {'name': name, 'module': module})
+        for pk, name, module in Klass.objects.filter(
+            module__project_version=project_version,
+        ).values_list('pk', 'name', 'module__name')
+    )
+    parents = collections.defaultdict(list)
+    children = collections.defaultdict(list)
+    for child, parent in Inheritance.objects.filter(
+            child__module__project_version=project_version,
+    ).order_by('order').values_list('child', 'parent'):
+        parents[child].append(parent)
+        children[parent].append(child)
+    return klasses, parents, children
+
+
+def resolve_klass(klass):
+    """
+    The class, its MRO, descendants, attributes (flagged when overridden) and
+    methods (grouped by name, in MRO order) as plain data.
+    """
+    project_version = klass.module.project_version
+    klasses, parents, children = get_graph(project_version)
+
+    mro = get_mro(klass.pk, parents)
+    # Where each class comes in the MRO; the class itself is first.
+    position = dict((pk, i) for i, pk in enumerate([klass.pk] + mro))
+
+    descendants = set()
+    stack = list(children[klass.pk])
+    while stack:
+        child = stack.pop()
+        if child not in descendants:
+            descendants.add(child)
+            stack.extend(children[child])
+
+    def klass_data(pk):
+        data = dict(klasses[pk])
+        data['url'] = reverse('klass-detail', kwargs={
+            'package': project_version.project.name,
+            'version': project_version.version_number,
+            'module': data['module'],
+            'klass': data['name'],
+        })
+        return data
+
+    def defined_in(row):
+        pk = row.pop('klass')
+        row['klass'] = klasses[pk]['name']
+        row['module'] = klasses[pk]['module']
+        return row
+
+    attributes = sorted(
+        KlassAttribute.objects.filter(klass__in=list(position)).values(
+            'name', 'value', 'line_number', 'klass'),
+        key=lambda a: (a['name'], position[a['klass']]),
+    )
+    seen = set()
+    for attribute in attributes:
+        attribute['overridden'] = attribute['name'] in seen
+        seen.add(attribute['name'])
+        defined_in(attribute)
+
+    methods = collections.OrderedDict()
+    for method in sorted(
+        Method.objects.filter(klass__in=list(position)).values(
+            'name', 'kwargs', 'docstring', 'source__code', 'line_number', 'klass'),
+        key=lambda m: (m['name'], position[m['klass']]),
+    ):
+        method['code'] = method.pop('source__code')
+        methods.setdefault(method['name'], []).append(defined_in(method))
+
+    return {
+        'name': klass.name,
+        'module': klass.module.name,
+        'import_path': klass.import_path,
+        'docstring': klass.docstring,
+        'line_number': klass.line_number,
+        'url': klass.get_absolute_url(),
+        'source_url': klass.get_source_url(),
+        'docs_url': klass.docs_url,
+        'parents': [klass_data(pk) for pk in parents[klass.pk]],
+        'ancestors': [klass_data(pk) for pk in mro],
+        'descendants': sorted((klass_data(pk) for pk in descendants), key=lambda k: k['name']),
+        'attributes': attributes,
+        'methods': [{'name': name, 'definitions': definitions} for name, definitions in methods.items()],
+    }
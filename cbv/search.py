@@ -0,0 +1,198 @@
+"""
+An in-memory inverted index over the classes, methods and attributes of a
+version, and their docstrings.
+
+Names are split into words ("TemplateResponseMixin" is found by "template",
+"response", "mixin" and "templateresponsemixin"). A query word matches a
+term exactly, as a prefix of one, or (for typos and fragments) by sharing
+enough trigrams with one. Every word of a query has to match.
+
+For completion, the names of classes and methods are also kept in a sorted
+array, so the names starting with a prefix are one contiguous slice of it.
+"""
+import bisect
+import collections
+import heapq
+import re
+import threading
+
+from django.db.models.signals import post_delete, post_save
+
+from cbv.models import Klass, KlassAttribute, Method, ProjectVersion
+
+
+CLASS, METHOD, ATTRIBUTE = 'class', 'method', 'attribute'
+KIND_ORDER = {CLASS: 0, METHOD: 1, ATTRIBUTE: 2}
+
+# How much a match in each place counts for.
+WHOLE_NAME, NAME_PART, DOCSTRING = 4, 2, 1
+# ... and how much each kind of match is worth.
+EXACT, PREFIX, TRIGRAM = 1.0, 0.6, 0.5
+
+MIN_SIMILARITY = 0.35
+MAX_EXPANSIONS = 100
+
+WORD_RE = re.compile(r'[A-Za-z0-9]+')
+NAME_PART_RE = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+STOP_WORDS = frozenset('a an and are as be by for if in is it of on or that the this to with'.split())
+
+Document = collections.namedtuple('Document', 'kind name klass module docstring')
+
+
+def name_terms(name):
+    """ The whole of a name, and the words in it """
+    terms = set(part.lower() for part in NAME_PART_RE.findall(name))
+    terms.discard(name.lower())
+    return name.lower(), terms
+
+
+def text_terms(text):
+    return set(word for word in WORD_RE.findall(text.lower())
+               if len(word) > 1 and word not in STOP_WORDS)
+
+
+def query_terms(query):
+    return [word for word in WORD_RE.findall(query.lower()) if word not in STOP_WORDS]
+
+
+def trigrams(term):
+    padded = '  ' + term + ' '
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+class SearchIndex(object):
+    def __init__(self, documents):
+        self.documents = documents
+        postings = collections.defaultdict(dict)
+
+        def add(term, doc_id, weight):
+            if postings[term].get(doc_id, 0) < weight:
+                postings[term][doc_id] = weight
+
+        for doc_id, document in enumerate(documents):
+            whole, parts = name_terms(document.name)
+            add(whole, doc_id, WHOLE_NAME)
+            for term in parts:
+                add(term, doc_id, NAME_PART)
+            for term in text_terms(document.docstring):
+                add(term, doc_id, DOCSTRING)
+
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+        self.trigrams = collections.defaultdict(set)
+        for term in self.terms:
+            for trigram in trigrams(term):
+                self.trigrams[trigram].add(term)
+
+        names = sorted(
+            (document.name.lower(), doc_id)
+            for doc_id, document in enumerate(documents) if document.kind != ATTRIBUTE
+        )
+        self.names = [name for name, doc_id in names]
+        self.name_ids = [doc_id for name, doc_id in names]
+
+    @classmethod
+    def for_version(cls, project_version):
+        """ Build the index of a version: one query per model """
+        documents = []
+        for name, docstring, module in Klass.objects.filter(
+                module__project_version=project_version,
+        ).values_list('name', 'docstring', 'module__name'):
+            documents.append(Document(CLASS, name, name, module, docstring))
+        for name, docstring, klass, module in Method.objects.filter(
+                klass__module__project_version=project_version,
+        ).values_list('name', 'docstring', 'klass__name', 'klass__module__name'):
+            documents.append(Document(METHOD, name, klass, module, docstring))
+        for name, klass, module in KlassAttribute.objects.filter(
+                klass__module__project_version=project_version,
+        ).values_list('name', 'klass__name', 'klass__module__name'):
+            documents.append(Document(ATTRIBUTE, name, klass, module, ''))
+        return cls(documents)
+
+    def expand(self, word):
+        """ {term: how well it matches} for the terms a query word matches """
+        matches = {}
+        if word in self.postings:
+            matches[word] = EXACT
+
+        start = bisect.bisect_left(self.terms, word)
+        for term in self.terms[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(word):
+                break
+            matches.setdefault(term, PREFIX)
+
+        if len(word) >= 3:
+            word_trigrams = trigrams(word)
+            shared = collections.Counter()
+            for trigram in word_trigrams:
+                shared.update(self.trigrams.get(trigram, ()))
+            for term, count in shared.most_common(MAX_EXPANSIONS):
+                similarity = float(count) / (len(word_trigrams) + len(trigrams(term)) - count)
+                if similarity >= MIN_SIMILARITY and term not in matches:
+                    matches[term] = TRIGRAM * similarity
+        return matches
+
+    def search(self, query, limit=50):
+        """ [(score, Document)], best first """
+        scores = None
+        for word in query_terms(query):
+            word_scores = {}
+            for term, quality in self.expand(word).iteritems():
+                for doc_id, weight in self.postings[term].iteritems():
+                    score = quality * weight
+                    if word_scores.get(doc_id, 0) < score:
+                        word_scores[doc_id] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = dict((doc_id, score + word_scores[doc_id])
+                              for doc_id, score in scores.iteritems() if doc_id in word_scores)
+            if not scores:
+                break
+        if not scores:
+            return []
+
+        def key(doc_id):
+            document = self.documents[doc_id]
+            return -scores[doc_id], KIND_ORDER[document.kind], document.name, document.klass
+        ranked = sorted(scores, key=key)[:limit]
+        return [(scores[doc_id], self.documents[doc_id]) for doc_id in ranked]
+
+    def complete(self, prefix, limit=10):
+        """ Classes, then methods, whose names start with prefix; shortest first """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.names, prefix)
+        end = bisect.bisect_left(self.names, prefix + u'\uffff', start)
+
+        def key(doc_id):
+            document = self.documents[doc_id]
+            return KIND_ORDER[document.kind], len(document.name), document.name, document.klass
+        return [self.documents[doc_id] for doc_id in heapq.nsmallest(limit, self.name_ids[start:end], key=key)]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(project_version):
+    """
+    The index of a version, built on first use and kept for the life of the
+    process. Populating or loading a version replaces its ProjectVersion, so
+    a changed version gets a new key and a fresh index.
+    """
+    with _lock:
+        index = _indexes.get(project_version.pk)
+    if index is None:
+        index = SearchIndex.for_version(project_version)
+        with _lock:
+            _indexes[project_version.pk] = index
+    return index
+
+
+def forget_index(sender, instance, **kwargs):
+    """ In case a database reuses the pk of a deleted version """
+    with _lock:
+        _indexes.pop(instance.pk, None)
+
+post_save.connect(forget_index, sender=ProjectVersion)
+post_delete.connect(forget_index, sender=ProjectVersion)
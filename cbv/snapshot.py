@@ -0,0 +1,324 @@
+"""
+A compact binary snapshot of a ProjectVersion.
+
+Every string is stored once, in a table, and every other value is an integer:
+a string id, a plain number, or the row index of the object a foreign key
+points at. Each model is stored as columns of `array`s, with its rows sorted
+by the object that owns them, so the classes of a module, the methods of a
+class and the parents of a class (inheritance rows are sorted by child, then
+order) are each one contiguous run of rows.
+
+The layout, after a header of magic and format version, zlib compressed:
+
+    number of strings, their lengths, then the strings as one utf-8 blob
+    for each model in VERSION_MODELS:
+        number of rows, number of columns
+        the string id of each column's name
+        each column, as an array of signed 32 bit ints
+"""
+import bisect
+import collections
+import struct
+import sys
+import zlib
+from array import array
+from contextlib import closing
+
+from cbv.management.commands.cbv_dumpversion import VERSION_MODELS
+from cbv.models import (Inheritance, Klass, KlassAttribute, Method, Module,
+    Project, ProjectVersion, Source)
+
+
+MAGIC = 'CCBV'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sH')
+COUNT = struct.Struct('<I')
+
+# The foreign key that owns each model's rows, and what to sort by within it.
+OWNERS = {
+    ProjectVersion: (None, 'pk'),
+    Module: ('project_version', 'pk'),
+    Klass: ('module', 'pk'),
+    Inheritance: ('child', 'order'),
+}
+DEFAULT_OWNER = {'module': ('module', 'pk'), 'klass': ('klass', 'pk')}
+
+STRING, INTEGER, REFERENCE = 'string', 'integer', 'reference'
+
+# Foreign keys to objects outside a version, stored as one of their fields.
+# Projects are shared between versions, and so is the code of a Source.
+STRING_RELATIONS = {Project: 'name', Source: 'code'}
+
+
+def get_columns(model):
+    """ (name, kind) of each column stored for a model """
+    columns = []
+    for field in model._meta.fields:
+        if field.primary_key:
+            continue
+        if field.rel is None:
+            kind = INTEGER if field.get_internal_type() == 'IntegerField' else STRING
+        else:
+            kind = STRING if field.rel.to in STRING_RELATIONS else REFERENCE
+        columns.append((field.name, kind))
+    return columns
+
+
+def get_string_relation(model, name):
+    """ The field a foreign key is stored as, if it's in STRING_RELATIONS """
+    rel = model._meta.get_field(name).rel
+    return STRING_RELATIONS.get(rel.to) if rel is not None else None
+
+
+def get_lookup(model, name):
+    relation = get_string_relation(model, name)
+    return name + '__' + relation if relation else name
+
+
+def get_owner(model):
+    if model in OWNERS:
+        return OWNERS[model]
+    names = [name for name, kind in get_columns(model) if kind == REFERENCE]
+    return DEFAULT_OWNER[names[0]]
+
+
+def int_array(values=()):
+    a = array('i', values)
+    assert a.itemsize == 4
+    return a
+
+
+class Table(object):
+    """ The rows of one model, as columns """
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+        self.kinds = dict(get_columns(model))
+        self.owner = get_owner(model)[0]
+
+    def __len__(self):
+        return len(self.columns.values()[0]) if self.columns else 0
+
+    def owned_by(self, index):
+        """ The indexes of the rows whose owner is the given row """
+        column = self.columns[self.owner]
+        return xrange(bisect.bisect_left(column, index), bisect.bisect_right(column, index))
+
+
+class Snapshot(object):
+    """
+    A ProjectVersion and everything in it. Also usable as a read model,
+    without a database.
+    """
+
+    def __init__(self, strings, tables):
+        self.strings = strings
+        self.tables = tables
+        self._klass_index = None
+
+    @property
+    def project_name(self):
+        return self.value(ProjectVersion, 0, 'project')
+
+    @property
+    def version_number(self):
+        return self.value(ProjectVersion, 0, 'version_number')
+
+    # Building and writing.
+
+    @classmethod
+    def from_database(cls, version_number):
+        strings = []
+        string_ids = {}
+
+        def intern(value):
+            try:
+                return string_ids[value]
+            except KeyError:
+                string_ids[value] = len(strings)
+                strings.append(value)
+                return string_ids[value]
+
+        tables = collections.OrderedDict()
+        row_indexes = {}
+        for model, version_lookup, related in VERSION_MODELS:
+            columns = get_columns(model)
+            lookups = ['pk'] + [get_lookup(model, name) for name, kind in columns]
+            owner, order = get_owner(model)
+            rows = model.objects.filter(**{version_lookup: version_number}).order_by(order).values_list(*lookups)
+
+            encoded = []
+            for row in rows:
+                values = [row[0]]
+                for (name, kind), value in zip(columns, row[1:]):
+                    if kind == STRING:
+                        value = intern(value)
+                    elif kind == REFERENCE:
+                        value = row_indexes[model._meta.get_field(name).rel.to][value]
+                    values.append(value)
+                encoded.append(values)
+            if owner is not None:
+                position = [name for name, kind in columns].index(owner) + 1
+                encoded.sort(key=lambda values: values[position])  # Stable, so the order stays.
+
+            row_indexes[model] = dict((values[0], i) for i, values in enumerate(encoded))
+            tables[model] = Table(model, collections.OrderedDict(
+                (name, int_array(values[i + 1] for values in encoded))
+                for i, (name, kind) in enumerate(columns)
+            ))
+        if len(tables[ProjectVersion]) != 1:
+            raise ValueError('Version {0} is not in the database.'.format(version_number))
+        return cls(strings, tables)
+
+    def write(self, f):
+        names = dict((value, i) for i, value in enumerate(self.strings))
+        strings = list(self.strings)
+        for table in self.tables.values():
+            for name in table.columns:
+                if name not in names:
+                    names[name] = len(strings)
+                    strings.append(name)
+
+        parts = [COUNT.pack(len(strings)), self._to_bytes(int_array(len(s) for s in strings))]
+        blob = u''.join(strings).encode('utf-8')
+        parts += [COUNT.pack(len(blob)), blob]
+        for table in self.tables.values():
+            parts.append(COUNT.pack(len(table)) + COUNT.pack(len(table.columns)))
+            parts.append(self._to_bytes(int_array(names[name] for name in table.columns)))
+            parts.extend(self._to_bytes(column) for column in table.columns.values())
+
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        f.write(zlib.compress(''.join(parts)))
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            self.write(f)
+
+    # Reading.
+
+    @classmethod
+    def read(cls, f):
+        magic, format_version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError('Not a version {0} cbv snapshot.'.format(FORMAT_VERSION))
+        data = zlib.decompress(f.read())
+        offset = [0]
+
+        def count():
+            value, = COUNT.unpack_from(data, offset[0])
+            offset[0] += COUNT.size
+            return value
+
+        def ints(length):
+            a = int_array()
+            a.fromstring(data[offset[0]:offset[0] + length * a.itemsize])
+            if sys.byteorder == 'big':
+                a.byteswap()
+            offset[0] += length * a.itemsize
+            return a
+
+        lengths = ints(count())
+        blob_length = count()
+        blob = data[offset[0]:offset[0] + blob_length].decode('utf-8')
+        offset[0] += blob_length
+        strings = []
+        start = 0
+        for length in lengths:
+            strings.append(blob[start:start + length])
+            start += length
+
+        tables = collections.OrderedDict()
+        for model, version_lookup, related in VERSION_MODELS:
+            rows, width = count(), count()
+            names = [strings[i] for i in ints(width)]
+            if names != [name for name, kind in get_columns(model)]:
+                raise ValueError('The snapshot has different {0} fields to the database.'.format(
+                    model._meta.object_name))
+            tables[model] = Table(model, collections.OrderedDict((name, ints(rows)) for name in names))
+        return cls(strings, tables)
+
+    @classmethod
+    def load(cls, filename):
+        with closing(open(filename, 'rb')) as f:
+            return cls.read(f)
+
+    @staticmethod
+    def _to_bytes(a):
+        if sys.byteorder == 'big':
+            a = array(a.typecode, a)
+            a.byteswap()
+        return a.tostring()
+
+    # The read model.
+
+    def value(self, model, index, name):
+        table = self.tables[model]
+        value = table.columns[name][index]
+        return self.strings[value] if table.kinds[name] == STRING else value
+
+    def row(self, model, index):
+        """ A row as a dict; foreign keys are row indexes """
+        return dict((name, self.value(model, index, name)) for name in self.tables[model].columns)
+
+    def rows(self, model):
+        return (self.row(model, i) for i in xrange(len(self.tables[model])))
+
+    def natural_key(self, model, index):
+        if model is ProjectVersion:
+            return (self.project_name, self.version_number)
+        owner = get_owner(model)[0]
+        return (self.value(model, index, 'name'),) + self.natural_key(
+            model._meta.get_field(owner).rel.to, self.value(model, index, owner))
+
+    def get_klass(self, module_name, klass_name):
+        """ The row index of a class """
+        if self._klass_index is None:
+            self._klass_index = dict(
+                (self.natural_key(Klass, i)[:2], i) for i in xrange(len(self.tables[Klass])))
+        return self._klass_index[(klass_name, module_name)]
+
+    def get_ancestors(self, klass):
+        """ A class's parents, in order """
+        parents = self.tables[Inheritance].columns['parent']
+        return [parents[i] for i in self.tables[Inheritance].owned_by(klass)]
+
+    def get_all_ancestors(self, klass):
+        """ Every ancestor of a class, in the order of Klass.get_all_ancestors """
+        tree = []
+        for ancestor in self.get_ancestors(klass):
+            tree.append(ancestor)
+            tree += self.get_all_ancestors(ancestor)
+        cleaned = []
+        for ancestor in reversed(tree):
+            if ancestor not in cleaned:
+                cleaned.insert(0, ancestor)
+        return cleaned
+
+    def get_methods(self, klass):
+        """ The rows of a class's own methods """
+        return self.tables[Method].owned_by(klass)
+
+    def get_attributes(self, klass):
+        """ The rows of a class's own attributes """
+        return self.tables[KlassAttribute].owned_by(klass)
+
+    # Back into the database.
+
+    def fixture_objects(self):
+        """ The snapshot in the form of a loaded JSON fixture, for BulkLoader """
+        for model in self.tables:
+            label = model._meta.app_label + '.' + model._meta.object_name.lower()
+            table = self.tables[model]
+            for index in xrange(len(table)):
+                fields = {}
+                for name, kind in get_columns(model):
+                    if kind == REFERENCE:
+                        value = self.natural_key(
+                            model._meta.get_field(name).rel.to, table.columns[name][index])
+                    elif get_string_relation(model, name):
+                        value = [self.value(model, index, name)]
+                    else:
+                        value = self.value(model, index, name)
+                    fields[name] = value
+                yield {'pk': None, 'model': label, 'fields': fields}
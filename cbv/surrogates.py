@@ -0,0 +1,193 @@
+"""
+Surrogate keys: tags on the responses of the cbv views, so that a CDN in
+front of the site can purge just the pages some data is shown on.
+
+Every page of a version has the nav, which lists the modules and classes of
+the version and the other versions of its project, so it's tagged with its
+project and version. Module pages are also tagged with their module, and
+class pages (and the JSON of a class) with their module, their class and
+each of its ancestors: what a class defines is shown on the page of every
+class that inherits from it.
+
+After changing what pages show, populate_cbv, populate_cbv_versions,
+load_cbv_fixtures and fetch_docs_urls work out the fewest keys that cover every page that changed,
+and hand them to the purger set up by CBV_PURGER.
+"""
+import urllib2
+from importlib import import_module
+
+from django.conf import settings
+
+from cbv.models import Klass, ProjectVersion
+
+
+HEADER = 'Surrogate-Key'
+
+
+def get_project_key(project):
+    return 'project:{0}'.format(project)
+
+
+def get_version_key(project, version):
+    return 'version:{0}/{1}'.format(project, version)
+
+
+def get_module_key(project, version, module):
+    return 'module:{0}/{1}/{2}'.format(project, version, module)
+
+
+def get_klass_key(project, version, module, klass):
+    return 'klass:{0}/{1}/{2}/{3}'.format(project, version, module, klass)
+
+
+def get_version_keys(project_version):
+    """ Of every page of a version """
+    project = project_version.project.name
+    return [get_project_key(project), get_version_key(project, project_version.version_number)]
+
+
+def get_module_keys(module, project_version):
+    return get_version_keys(project_version) + [
+        get_module_key(project_version.project.name, project_version.version_number, module.name),
+    ]
+
+
+def get_klass_keys(klass, ancestors=None):
+    """
+    Of the page of a class, which shows what it inherits. `ancestors` is the
+    (module, name) of each, if they're at hand.
+    """
+    project_version = klass.module.project_version
+    if ancestors is None:
+        ancestors = [(ancestor.module.name, ancestor.name) for ancestor in klass.get_all_ancestors()]
+    keys = get_module_keys(klass.module, project_version)
+    for module, name in [(klass.module.name, klass.name)] + list(ancestors):
+        keys.append(get_klass_key(project_version.project.name, project_version.version_number, module, name))
+    return keys
+
+
+def minimise(keys):
+    """
+    The keys, without duplicates or those another of them covers: every page
+    tagged with a version's key (or a class's in it) is tagged with its
+    project's too, and the same goes for a version and its modules and classes.
+    """
+    covering = set(key.partition(':')[2] for key in keys if key.startswith(('project:', 'version:')))
+    minimal = []
+    for key in keys:
+        path = key.partition(':')[2]
+        parts = path.split('/')
+        if any('/'.join(parts[:i]) in covering for i in range(1, len(parts))):
+            continue
+        if key not in minimal:
+            minimal.append(key)
+    return minimal
+
+
+def get_locations(project_name, version_number):
+    """ (module, class) of every class of a version, or None if there's no such version """
+    if not ProjectVersion.objects.filter(project__name=project_name, version_number=version_number).exists():
+        return None
+    return set(Klass.objects.filter(
+        module__project_version__project__name=project_name,
+        module__project_version__version_number=version_number,
+    ).values_list('module__name', 'name'))
+
+
+def get_populate_keys(project_version, before):
+    """
+    The keys of the pages that (re)populating a version changed, given where
+    its classes were before (see get_locations).
+
+    A new version is in the nav of every page of its project. Otherwise, the
+    pages of the version change, and so do those of the namesakes in other
+    versions of any class that was added, removed or moved, which link to it.
+    """
+    project = project_version.project.name
+    if before is None:
+        return [get_project_key(project)]
+    keys = [get_version_key(project, project_version.version_number)]
+    after = get_locations(project, project_version.version_number)
+    changed = set(name for module, name in before ^ after)
+    if changed:
+        namesakes = Klass.objects.filter(
+            name__in=changed,
+            module__project_version__project__name=project,
+        ).exclude(module__project_version=project_version).values_list(
+            'module__project_version__version_number', 'module__name', 'name')
+        keys += [get_klass_key(project, version, module, name) for version, module, name in namesakes]
+    return keys
+
+
+class SurrogateKeysMixin(object):
+    """ Tags the responses of a view with the keys of what they show """
+
+    def get_surrogate_keys(self):
+        return []
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super(SurrogateKeysMixin, self).dispatch(request, *args, **kwargs)
+        keys = self.get_surrogate_keys()
+        if keys:
+            response[HEADER] = ' '.join(keys)
+        return response
+
+
+class NullPurger(object):
+    """
+    Tells a CDN to drop every page tagged with any of some keys. This one is
+    for when there's no CDN; the others override `purge`.
+    """
+
+    def purge(self, keys):
+        pass
+
+
+class PurgeRequest(urllib2.Request):
+    def __init__(self, url, method, **kwargs):
+        urllib2.Request.__init__(self, url, **kwargs)
+        self.method = method
+
+    def get_method(self):
+        return self.method
+
+
+class HTTPPurger(NullPurger):
+    """
+    Sends the keys to URL, up to BATCH_SIZE at a time, space separated in the
+    Surrogate-Key header of an empty request. With the defaults, that's
+    Fastly's purge API: https://api.fastly.com/service/<id>/purge, with the
+    API token in a Fastly-Key header of HEADERS.
+    """
+
+    def __init__(self, URL, METHOD='POST', HEADERS=None, BATCH_SIZE=256, TIMEOUT=10):
+        self.url = URL
+        self.method = METHOD
+        self.headers = HEADERS or {}
+        self.batch_size = BATCH_SIZE
+        self.timeout = TIMEOUT
+
+    def purge(self, keys):
+        for start in xrange(0, len(keys), self.batch_size):
+            headers = dict(self.headers)
+            headers[HEADER] = ' '.join(keys[start:start + self.batch_size])
+            request = PurgeRequest(self.url, self.method, data='', headers=headers)
+            urllib2.urlopen(request, timeout=self.timeout).close()
+
+
+def get_purger():
+    """ The purger CBV_PURGER sets up: a dict of BACKEND and its arguments """
+    options = dict(getattr(settings, 'CBV_PURGER', {}))
+    module, sep, name = options.pop('BACKEND', 'cbv.surrogates.NullPurger').rpartition('.')
+    return getattr(import_module(module), name)(**options)
+
+
+def purge(keys):
+    """
+    Purge the fewest of the keys that cover them all, and return those.
+    Raises IOError if the purger couldn't reach the CDN.
+    """
+    keys = minimise(keys)
+    if keys:
+        get_purger().purge(keys)
+    return keys
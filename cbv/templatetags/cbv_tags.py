@@ -1,5 +1,9 @@
+import hashlib
+import json
+
 from django import template
 from django.core.urlresolvers import reverse
+from django.utils.safestring import mark_safe
 from cbv.models import Klass, ProjectVersion
 
 register = template.Library()
@@ -27,6 +31,18 @@ def namesake_methods(parent_klass, name):
     return result
 
 
+@register.filter
+def namesakes_fingerprint(namesakes, method):
+    """
+    For keying the cached accordion of a method, which shows `method` (the
+    first of the class's methods by that name) and its namesakes, in order.
+    """
+    data = [(method.kwargs, method.klass.name)] + [
+        (m.name, m.kwargs, m.docstring, m.source_id, m.line_number, m.klass.name) for m in namesakes
+    ]
+    return hashlib.sha1(json.dumps(data)).hexdigest()
+
+
 @register.inclusion_tag('cbv/includes/nav.html')
 def nav(version, module=None, klass=None):
     other_versions = ProjectVersion.objects.filter(project=version.project).exclude(pk=version.pk)
@@ -56,3 +72,18 @@ def nav(version, module=None, klass=None):
 @register.filter
 def is_final(obj, last):
     return obj == last
+
+
+@register.simple_tag
+def highlighted_source(obj):
+    """
+    What `{% pygmy obj.code linenos='True' linenostart=obj.line_number %}`
+    makes, from the highlighting cached on the object's Source.
+    """
+    count = len(obj.code.strip().splitlines())
+    last = obj.line_number + count - 1
+    numbers = u'\n'.join(u'%*d' % (len(str(last)), i) for i in xrange(obj.line_number, last + 1))
+    return mark_safe(
+        u'<table class="highlighttable"><tr><td class="linenos"><div class="linenodiv"><pre>{0}</pre></div>'
+        u'</td><td class="code">{1}</td></tr></table>'.format(numbers, obj.source.get_html())
+    )
@@ -1,19 +1,59 @@
+import BaseHTTPServer
+import gzip
+import inspect
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import closing
+from StringIO import StringIO
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.urlresolvers import reverse
+from django.http import HttpResponse
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.views.generic import View
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
 
-from .factories import InheritanceFactory, KlassFactory, ProjectVersionFactory
+from .backends import pool as backend_pool
+from .backends.sqlite3 import base as sqlite3_backend
+from .bundles import get_bundles, write_bundle
+from . import benchmarks, instrumentation, pagecache, replay, surrogates, warming
+from .diff import diff_klasses
+from .extraction import Extraction, SourceExtractor, SourceIndex, compare_extractions
+from .factories import (InheritanceFactory, KlassAttributeFactory, KlassFactory, MethodFactory,
+                        ProjectVersionFactory)
+from .management.commands import populate_cbv
+from .models import Function, Klass, KlassAttribute, Method, Module, ProjectVersion, Source, get_content_hash
+from .resolution import resolve_klass
+from .search import Document, SearchIndex
+from .snapshot import Snapshot
+from .templatetags.cbv_tags import highlighted_source, namesake_methods
 from .views import Sitemap
 
 
 class SitemapTest(TestCase):
     def test_200(self):
-        ProjectVersionFactory.create()
+        ProjectVersionFactory.create(project__name='Django')
         response = self.client.get(reverse('sitemap'))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/xml')
 
     def test_queryset(self):
-        klass = KlassFactory.create()
+        klass = KlassFactory.create(module__project_version__project__name='Django')
         with self.assertNumQueries(2):  # Get ProjectVersion, get Klasses.
             url_list = Sitemap().get_queryset()
         self.assertEqual(len(url_list), 2)  # 2 because 1 Klass + homepage.
@@ -64,3 +104,1442 @@ class KlassAncestorMROTest(TestCase):
 
         mro = d.get_all_ancestors()
         self.assertSequenceEqual(mro, [b, c, a])
+
+
+def write_source(root, path, source):
+    filename = os.path.join(root, *path.split('/'))
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, 'w') as f:
+        f.write(source)
+
+
+def silent_call_command(*args, **kwargs):
+    """ The populate commands print progress straight to stdout (or stderr) """
+    stdout, sys.stdout = sys.stdout, StringIO()
+    stderr, sys.stderr = sys.stderr, StringIO()
+    try:
+        call_command(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+        sys.stderr = stderr
+
+
+class TemporaryBundleRootMixin(object):
+    """ Writes any bundles to a directory that's removed afterwards """
+    def setUp(self):
+        super(TemporaryBundleRootMixin, self).setUp()
+        self.bundle_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bundle_root)
+        settings = override_settings(CBV_BUNDLE_ROOT=self.bundle_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class SourceExtractorTest(TemporaryBundleRootMixin, TestCase):
+    def setUp(self):
+        super(SourceExtractorTest, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write_module(self, path, source):
+        write_source(self.root, path, source)
+
+    def test_package(self):
+        self.write_module('pkg/__init__.py', 'from pkg.views import B\n')
+        self.write_module('pkg/views.py', (
+            'class A(object):\n'
+            '    """Docs."""\n'
+            "    name = 'a'\n"
+            '\n'
+            '    def get(self, request, *args, **kwargs):\n'
+            '        return name\n'
+            '\n'
+            '    @property\n'
+            '    def prop(self):\n'
+            '        pass\n'
+            '\n'
+            '\n'
+            'class B(A):\n'
+            "    name = 'a'\n"
+            '    extra = None\n'
+            '\n'
+            '    def post(self, request, kw=1):\n'
+            '        pass\n'
+        ))
+        extraction = SourceExtractor(self.root, 'pkg').extract()
+
+        self.assertEqual([m.name for m in extraction.modules], ['pkg', 'pkg.views'])
+        klasses = dict((k.name, k) for k in extraction.klasses)
+        self.assertEqual(klasses['A'].import_path, 'pkg.views')
+        self.assertEqual(klasses['B'].import_path, 'pkg')
+        self.assertEqual(klasses['A'].docstring, 'Docs.')
+        self.assertEqual(klasses['B'].line_number, 13)
+
+        methods = dict((m.name, m) for m in extraction.methods)
+        self.assertEqual(methods['get'].kwargs, 'self, request, *args, **kwargs')
+        self.assertEqual(methods['get'].code, 'def get(self, request, *args, **kwargs):\n    return name\n')
+        self.assertEqual(methods['post'].kwargs, 'self, request, kw=1')
+        self.assertNotIn('prop', methods)
+
+        attributes = sorted((a.klass, a.name, a.value) for a in extraction.klass_attributes)
+        self.assertEqual(attributes, [
+            ('A', 'name', "'a'"),
+            ('A', 'prop', '<property object>'),
+            ('B', 'extra', 'None'),
+        ])
+        self.assertEqual(
+            [(i.parent, i.child, i.order) for i in extraction.inheritance],
+            [('A', 'B', 0)],
+        )
+
+    def test_sibling_module(self):
+        """ pkg.views_foo isn't part of pkg.views, though its name starts the same """
+        self.write_module('pkg/__init__.py', 'from pkg import views, views_foo\n')
+        self.write_module('pkg/views/__init__.py', (
+            'from pkg.views_foo.base import Foo\n'
+            '\n'
+            '\n'
+            'class Bar(object):\n'
+            '    pass\n'
+        ))
+        self.write_module('pkg/views_foo/__init__.py', 'from pkg.views_foo import base\n')
+        self.write_module('pkg/views_foo/base.py', 'class Foo(object):\n    pass\n')
+        extraction = SourceExtractor(self.root, 'pkg.views').extract()
+        self.assertEqual([k.name for k in extraction.klasses], ['Bar'])
+
+        # pkg.views re-exports Foo, but isn't a parent package of it.
+        extraction = SourceExtractor(self.root, 'pkg').extract()
+        klasses = dict((k.name, k) for k in extraction.klasses)
+        self.assertEqual(klasses['Foo'].import_path, 'pkg.views_foo.base')
+
+    def test_matches_inspect(self):
+        """ The parser should find what populate_cbv finds by importing """
+        silent_call_command('populate_cbv')
+        project_version = ProjectVersion.objects.get(version_number=django.get_version())
+
+        root = os.path.dirname(os.path.dirname(django.__file__))
+        differences = compare_extractions(
+            Extraction.from_project_version(project_version),
+            SourceExtractor(root).extract(),
+        )
+        # Some attribute values only exist at runtime.
+        self.assertEqual([d for d in differences if 'attribute' not in d], [])
+
+
+class PopulateTest(TemporaryBundleRootMixin, TestCase):
+    def test_overlapping_targets(self):
+        """ Modules reachable from more than one target are only added once """
+        silent_call_command('populate_cbv', targets=[
+            'django.views.generic',
+            'django.views.generic.base',
+            'django.views.decorators',
+        ])
+        modules = Module.objects.values_list('name', flat=True)
+        self.assertEqual(len(modules), len(set(modules)))
+        self.assertIn('django.views.generic.base', modules)
+        self.assertIn('django.views.decorators', modules)
+        self.assertEqual(Klass.objects.filter(name='View').count(), 1)
+
+    def test_sibling_module(self):
+        """ The classes of pkg.views_foo aren't added when the target is pkg.views """
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        write_source(root, 'cbvsibling/__init__.py', '')
+        write_source(root, 'cbvsibling/views/__init__.py', (
+            'from cbvsibling import views_foo\n'
+            'from cbvsibling.views_foo import Foo\n'
+            '\n'
+            '\n'
+            'class Bar(object):\n'
+            '    pass\n'
+        ))
+        write_source(root, 'cbvsibling/views_foo.py', 'class Foo(object):\n    pass\n')
+        sys.path.insert(0, root)
+        self.addCleanup(sys.path.remove, root)
+        for name in ('cbvsibling', 'cbvsibling.views', 'cbvsibling.views_foo'):
+            self.addCleanup(sys.modules.pop, name, None)
+        silent_call_command('populate_cbv', targets=['cbvsibling.views'])
+        self.assertEqual(list(Klass.objects.values_list('name', flat=True)), ['Bar'])
+
+    def test_is_target(self):
+        command = populate_cbv.Command()
+        command.targets = ('django.views.generic',)
+        self.assertTrue(command.is_target('django.views.generic'))
+        self.assertTrue(command.is_target('django.views.generic.base'))
+        self.assertFalse(command.is_target('django.views.generic_foo'))
+
+    def test_import_path_by_module(self):
+        """ A namesake in another module doesn't get a class's import path """
+        silent_call_command('populate_cbv')
+        version = ProjectVersion.objects.get()
+        other = KlassFactory.create(
+            name='View', module__name='other.views', module__project_version=version, import_path='other.views')
+        command = populate_cbv.Command()
+        command.klass_imports = {}
+        from django.views import generic
+        command.add_new_import_path(generic.View, generic)
+        self.assertEqual(Klass.objects.get(pk=other.pk).import_path, 'other.views')
+        self.assertEqual(
+            Klass.objects.get(name='View', module__name='django.views.generic.base').import_path,
+            'django.views.generic')
+
+
+class SourceIndexTest(TestCase):
+    def test_matches_inspect(self):
+        from django.views.generic import base, dates, edit
+
+        index = SourceIndex()
+        for module in (base, dates, edit):
+            for name, klass in inspect.getmembers(module, inspect.isclass):
+                if inspect.getsourcefile(klass) != inspect.getsourcefile(module):
+                    continue
+                self.assertEqual(index.getsourcelines(klass), inspect.getsourcelines(klass))
+                for name, method in inspect.getmembers(klass, inspect.ismethod):
+                    self.assertEqual(index.getsourcelines(method), inspect.getsourcelines(method))
+
+
+class PopulateVersionsTest(TemporaryBundleRootMixin, TestCase):
+    def write_django(self, root, version):
+        write_source(root, 'django/__init__.py', 'VERSION = {0!r}\n'.format(version))
+        write_source(root, 'django/views/__init__.py', '')
+        write_source(root, 'django/views/generic/__init__.py', 'class View(object):\n    pass\n')
+
+    def test_directories_and_tarballs(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.write_django(os.path.join(root, 'Django-1.0'), (1, 0, 0, 'final', 0))
+        self.write_django(os.path.join(root, 'Django-2.0.1'), (2, 0, 1, 'final', 0))
+        tarball = os.path.join(root, 'Django-2.0.1.tar.gz')
+        with tarfile.open(tarball, 'w:gz') as tar:
+            tar.add(os.path.join(root, 'Django-2.0.1'), arcname='Django-2.0.1')
+
+        silent_call_command(
+            'populate_cbv_versions',
+            os.path.join(root, 'Django-1.0'),
+            tarball,
+            workers=2,
+            short_versions=True,
+        )
+
+        versions = ProjectVersion.objects.filter(project__name='Django')
+        self.assertEqual(sorted(v.version_number for v in versions), ['1.0', '2.0'])
+        for version in versions:
+            klass = Klass.objects.get(module__project_version=version)
+            self.assertEqual(klass.import_path, 'django.views.generic')
+
+
+class DumpVersionTest(TestCase):
+    def test_several_versions_gzipped(self):
+        klasses = [KlassFactory.create(), KlassFactory.create()]
+        InheritanceFactory.create(
+            parent=klasses[0],
+            child__module=klasses[0].module,
+        )
+        handle, filename = tempfile.mkstemp(suffix='.json.gz')
+        os.close(handle)
+        self.addCleanup(os.remove, filename)
+
+        versions = [k.module.project_version.version_number for k in klasses]
+        with self.assertNumQueries(16):  # One per model per version.
+            call_command('cbv_dumpversion', *versions, output=filename)
+
+        with closing(gzip.open(filename)) as f:
+            objects = json.load(f)
+        self.assertEqual(
+            [o['model'] for o in objects],
+            ['cbv.projectversion', 'cbv.module', 'cbv.klass', 'cbv.klass', 'cbv.inheritance'] +
+            ['cbv.projectversion', 'cbv.module', 'cbv.klass'],
+        )
+        self.assertEqual(set(o['pk'] for o in objects), set([None]))
+        self.assertEqual(objects[4]['fields']['parent'], list(klasses[0].natural_key()))
+
+
+class LoadFixturesTest(TemporaryBundleRootMixin, TestCase):
+    fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+    def test_matches_fixture(self):
+        project = os.path.join(self.fixtures, 'project.json')
+        fixture = os.path.join(self.fixtures, '1.7.json')
+        with self.assertRaises(CommandError):
+            silent_call_command('load_cbv_fixtures', fixture)
+        silent_call_command('load_cbv_fixtures', project, fixture)
+        # Loading again replaces the version rather than adding to it.
+        silent_call_command('load_cbv_fixtures', fixture)
+
+        handle, filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, filename)
+        call_command('cbv_dumpversion', '1.7', output=filename)
+
+        with open(fixture) as f:
+            expected = json.load(f)
+        with open(filename) as f:
+            actual = json.load(f)
+        key = lambda o: json.dumps(o, sort_keys=True)
+        self.assertEqual(sorted(actual, key=key), sorted(expected, key=key))
+
+        klass = Klass.objects.get(name='UpdateView', module__project_version__version_number='1.7')
+        self.assertEqual(klass.get_all_ancestors()[0].name, 'SingleObjectTemplateResponseMixin')
+
+    def test_sources(self):
+        project = os.path.join(self.fixtures, 'project.json')
+        silent_call_command('load_cbv_fixtures', project, os.path.join(self.fixtures, '1.7.json'))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        fixture = os.path.join(directory, '1.7.json')
+        call_command('cbv_dumpversion', '1.7', output=fixture, sources=True)
+
+        # Each method and function refers to its code, which is written once.
+        with open(fixture) as f:
+            used = set(o['fields']['source'] for o in json.load(f) if o['model'] in ('cbv.method', 'cbv.function'))
+        with open(os.path.join(directory, 'sources.json')) as f:
+            sources = json.load(f)
+        self.assertEqual(set(o['pk'] for o in sources), used)
+        self.assertEqual(len(sources), Source.objects.count())
+        for o in sources:
+            self.assertEqual(get_content_hash(o['fields']['code']), o['pk'])
+
+        # The version loads again from there, and not without its code.
+        silent_call_command('load_cbv_fixtures', fixture)
+        self.assertEqual(set(Source.objects.values_list('pk', flat=True)), used)
+        os.remove(os.path.join(directory, 'sources.json'))
+        ProjectVersion.objects.all().delete()
+        Source.objects.delete_unused()
+        with self.assertRaises(CommandError):
+            silent_call_command('load_cbv_fixtures', fixture)
+
+    def test_sources_gzipped(self):
+        """ A gzipped dump's code is written too, and other files are left be """
+        project = os.path.join(self.fixtures, 'project.json')
+        silent_call_command('load_cbv_fixtures', project, os.path.join(self.fixtures, '1.7.json'))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'package.json'), 'w') as f:
+            json.dump({'name': 'not-a-fixture'}, f)
+        with open(os.path.join(directory, 'notes.json'), 'w') as f:
+            f.write('not even JSON')
+        call_command('cbv_dumpversion', '1.7', output=os.path.join(directory, '1.7.json.gz'), sources=True)
+        with open(os.path.join(directory, 'sources.json')) as f:
+            sources = json.load(f)
+        self.assertEqual(len(sources), Source.objects.count())
+
+
+class SnapshotTest(TemporaryBundleRootMixin, TestCase):
+    def test_round_trip(self):
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        silent_call_command(
+            'load_cbv_fixtures',
+            os.path.join(fixtures, 'project.json'),
+            os.path.join(fixtures, '1.7.json'),
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        silent_call_command('cbv_snapshot', '1.7', directory=directory)
+        filename = os.path.join(directory, '1.7.ccbv')
+
+        # As a read model.
+        snapshot = Snapshot.load(filename)
+        self.assertEqual(snapshot.version_number, '1.7')
+        index = snapshot.get_klass('django.views.generic.edit', 'UpdateView')
+        klass = Klass.objects.get(name='UpdateView', module__project_version__version_number='1.7')
+        self.assertEqual(
+            [snapshot.value(Klass, i, 'name') for i in snapshot.get_all_ancestors(index)],
+            [k.name for k in klass.get_all_ancestors()],
+        )
+        self.assertEqual(
+            sorted(snapshot.row(Method, i)['name'] for i in snapshot.get_methods(index)),
+            sorted(klass.method_set.values_list('name', flat=True)),
+        )
+
+        # Back into the database.
+        expected = self.dump()
+        silent_call_command('load_cbv_fixtures', filename)
+        self.assertEqual(self.dump(), expected)
+
+    def dump(self):
+        stdout = StringIO()
+        call_command('cbv_dumpversion', '1.7', stdout=stdout)
+        return sorted(json.dumps(o, sort_keys=True) for o in json.loads(stdout.getvalue()))
+
+
+def make_inventory(*names):
+    """ A Sphinx objects.inv listing the given classes """
+    header = (
+        '# Sphinx inventory version 2\n'
+        '# Project: Django\n'
+        '# Version: 1.7\n'
+        '# The remainder of this file is compressed using zlib.\n'
+    )
+    lines = ''.join('{0} py:class 1 ref/cbv/#$ -\n'.format(name) for name in names)
+    return header + zlib.compress(lines)
+
+
+class InventoryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    inventories = {}
+    delay = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if self.path not in self.inventories:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(self.inventories[self.path])
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchDocsUrlsTest(TemporaryBundleRootMixin, TestCase):
+    def setUp(self):
+        super(FetchDocsUrlsTest, self).setUp()
+        self.klass = KlassFactory.create(
+            name='View',
+            module__name='django.views.generic.base',
+            module__project_version__version_number='1.7',
+        )
+        InventoryHandler.inventories = {
+            '/1.7/_objects': make_inventory('django.views.generic.base.View', 'django.views.Other'),
+        }
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), InventoryHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.docs_url = 'http://127.0.0.1:{0}/{{version}}'.format(self.server.server_port)
+
+    def get_docs_url(self):
+        return Klass.objects.get(pk=self.klass.pk).docs_url
+
+    def test_fetch_and_cache(self):
+        cache = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache)
+        silent_call_command('fetch_docs_urls', docs_url=self.docs_url, cache=cache)
+        url = self.docs_url.format(version='1.7') + '/ref/cbv/#django.views.generic.base.View'
+        self.assertEqual(self.get_docs_url(), url)
+        self.assertTrue(os.path.exists(os.path.join(cache, '1.7.inv')))
+
+        # Offline, the cached inventory is used.
+        Klass.objects.update(docs_url='')
+        InventoryHandler.inventories = {}
+        silent_call_command('fetch_docs_urls', '1.7', docs_url=self.docs_url, cache=cache, offline=True)
+        self.assertEqual(self.get_docs_url(), url)
+
+    def test_fetch_without_cache(self):
+        """ The inventory is downloaded to a temporary file, which is removed """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(setattr, tempfile, 'tempdir', tempfile.tempdir)
+        tempfile.tempdir = directory
+        silent_call_command('fetch_docs_urls', docs_url=self.docs_url)
+        self.assertEqual(self.get_docs_url(), self.docs_url.format(version='1.7') + '/ref/cbv/#django.views.generic.base.View')
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_timeout(self):
+        InventoryHandler.delay = 0.5
+        self.addCleanup(setattr, InventoryHandler, 'delay', 0)
+        # The handler finds the command gone by the time it answers.
+        self.server.handle_error = lambda request, client_address: None
+        start = time.time()
+        silent_call_command('fetch_docs_urls', docs_url=self.docs_url, timeout=0.05)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(self.get_docs_url(), '')
+
+    def test_local_inventory(self):
+        handle, filename = tempfile.mkstemp(suffix='.inv')
+        os.close(handle)
+        self.addCleanup(os.remove, filename)
+        with open(filename, 'wb') as f:
+            f.write(make_inventory('django.views.generic.base.View'))
+        version = self.klass.module.project_version
+        before = write_bundle(version)
+        # Versions, classes, one update; then the version and its bundle's five.
+        with self.assertNumQueries(9):
+            silent_call_command(
+                'fetch_docs_urls',
+                inventories=['1.7=' + filename],
+                docs_url='https://docs.example.com/{version}',
+                offline=True,
+            )
+        self.assertEqual(self.get_docs_url(), 'https://docs.example.com/1.7/ref/cbv/#django.views.generic.base.View')
+
+        # The bundle has the new url, so it has a new name, and the old one is gone.
+        bundles = get_bundles(version)
+        self.assertEqual(len(bundles), 1)
+        self.assertNotEqual(bundles[0], before)
+        with gzip.open(bundles[0]) as f:
+            self.assertIn('https://docs.example.com/1.7/ref/cbv/', f.read())
+
+        # Nothing changes the second time, so nothing is written.
+        with self.assertNumQueries(2):
+            silent_call_command(
+                'fetch_docs_urls',
+                inventories=['1.7=' + filename],
+                docs_url='https://docs.example.com/{version}',
+                offline=True,
+            )
+
+
+class SearchTest(TestCase):
+    def test_index(self):
+        index = SearchIndex([
+            Document('class', 'TemplateResponseMixin', 'TemplateResponseMixin', 'base', 'Renders a template.'),
+            Document('method', 'get_template_names', 'TemplateResponseMixin', 'base', ''),
+            Document('attribute', 'success_url', 'FormMixin', 'edit', ''),
+        ])
+        names = lambda query: [document.name for score, document in index.search(query)]
+        self.assertEqual(names('TemplateResponseMixin'), ['TemplateResponseMixin'])
+        self.assertEqual(names('templ'), ['TemplateResponseMixin', 'get_template_names'])
+        self.assertEqual(names('renders'), ['TemplateResponseMixin'])
+        self.assertEqual(names('respnse mixin'), ['TemplateResponseMixin'])
+        self.assertEqual(names('succes url'), ['success_url'])
+        self.assertEqual(names('template url'), [])
+
+    def test_views(self):
+        klass = KlassFactory.create(name='RedirectView', docstring='A view that provides a redirect.')
+        version = klass.module.project_version
+        MethodFactory.create(klass=klass, name='get_redirect_url')
+        params = {'q': 'redirect', 'version': version.version_number, 'package': version.project.name}
+
+        response = self.client.get(reverse('search-api'), params)
+        data = json.loads(response.content)
+        self.assertEqual([r['name'] for r in data['results']], ['RedirectView', 'get_redirect_url'])
+        self.assertEqual(data['results'][0]['url'], klass.get_absolute_url())
+        self.assertEqual(data['results'][1]['url'], klass.get_absolute_url() + '#get_redirect_url')
+
+        response = self.client.get(reverse('search'), params)
+        self.assertContains(response, klass.get_absolute_url() + '#get_redirect_url')
+
+    def test_package(self):
+        """ Without a version, the latest of the given package's is searched """
+        django_klass = KlassFactory.create(name='RedirectView', module__project_version__project__name='Django')
+        other = KlassFactory.create(name='RedirectViewMixin', module__project_version__version_number='9.9')
+        response = self.client.get(reverse('search-api'), {'q': 'redirect'})
+        self.assertEqual([r['name'] for r in json.loads(response.content)['results']], [django_klass.name])
+        package = other.module.project_version.project.name
+        response = self.client.get(reverse('search-api'), {'q': 'redirect', 'package': package})
+        self.assertEqual([r['name'] for r in json.loads(response.content)['results']], [other.name])
+        response = self.client.get(reverse('search-api'), {'q': 'redirect', 'package': 'nothing'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_complete(self):
+        klass = KlassFactory.create(name='RedirectView')
+        KlassFactory.create(name='RedirectViewWithALongerName', module=klass.module)
+        MethodFactory.create(klass=klass, name='get_redirect_url')
+        MethodFactory.create(klass=klass, name='render')
+        version = klass.module.project_version
+        url = reverse('complete', kwargs={'package': version.project.name, 'version': version.version_number})
+
+        response = self.client.get(url, {'prefix': 'RED'})
+        self.assertEqual(
+            [r['name'] for r in json.loads(response.content)['results']],
+            ['RedirectView', 'RedirectViewWithALongerName'],
+        )
+        self.assertEqual(
+            set(response['Cache-Control'].split(', ')), set(['public', 'max-age=300', 's-maxage=604800']))
+
+        response = self.client.get(url, {'prefix': 'get_', 'limit': '1'})
+        results = json.loads(response.content)['results']
+        self.assertEqual([r['url'] for r in results], [klass.get_absolute_url() + '#get_redirect_url'])
+
+
+class KlassAPITest(TemporaryBundleRootMixin, TestCase):
+    def test_matches_models(self):
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        silent_call_command(
+            'load_cbv_fixtures',
+            os.path.join(fixtures, 'project.json'),
+            os.path.join(fixtures, '1.7.json'),
+        )
+        for klass in Klass.objects.select_related('module__project_version__project'):
+            data = resolve_klass(klass)
+            self.assertEqual(
+                [a['name'] for a in data['ancestors']],
+                [k.name for k in klass.get_all_ancestors()],
+            )
+            self.assertEqual(
+                [d['name'] for d in data['descendants']],
+                sorted(set(k.name for k in klass.get_all_children())),
+            )
+            self.assertEqual(
+                sorted((a['name'], a['klass'], a.get('overridden', False)) for a in data['attributes']),
+                sorted((a.name, a.klass.name, getattr(a, 'overridden', False))
+                       for a in klass.get_prepared_attributes()),
+            )
+            self.assertEqual(
+                [(m['name'], [d['klass'] for d in m['definitions']]) for m in data['methods']],
+                [(name, [m.klass.name for m in namesake_methods(klass, name)])
+                 for name in sorted(set(m.name for m in klass.get_methods()))],
+            )
+
+    def test_etag(self):
+        klass = KlassFactory.create()
+        InheritanceFactory.create(child=klass, parent__module=klass.module)
+        version = klass.module.project_version
+        url = reverse('klass-api', kwargs={
+            'package': version.project.name,
+            'version': version.version_number,
+            'module': klass.module.name,
+            'klass': klass.name,
+        })
+        response = self.client.get(url)
+        data = json.loads(response.content)
+        self.assertEqual(data['name'], klass.name)
+        self.assertEqual(len(data['parents']), 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Once the data changes and the generation moves on, so does the ETag.
+        Klass.objects.filter(pk=klass.pk).update(docs_url='https://docs.example.com/')
+        pagecache.bump_generation()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(json.loads(changed.content)['docs_url'], 'https://docs.example.com/')
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+
+class BundleTest(TemporaryBundleRootMixin, TestCase):
+    def test_download(self):
+        klass = KlassFactory.create()
+        InheritanceFactory.create(child=klass, parent__module=klass.module)
+        MethodFactory.create(klass=klass, name='get')
+        version = klass.module.project_version
+        response = self.client.get(reverse('bundle', kwargs={
+            'package': version.project.name,
+            'version': version.version_number,
+        }))
+        self.assertEqual(response.status_code, 302)
+        url = response['Location'].replace('http://testserver', '')
+
+        response = self.client.get(url)
+        self.assertIn('immutable', response['Cache-Control'])
+        content = ''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        with closing(gzip.GzipFile(fileobj=StringIO(content))) as f:
+            bundle = json.load(f)
+        [module] = bundle['modules']
+        data = [k for k in module['classes'] if k['name'] == klass.name][0]
+        self.assertEqual(data['mro'], [klass.module.name + '.' + klass.get_ancestors()[0].name])
+        self.assertEqual([m['name'] for m in data['methods']], ['get'])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(''.join(response.streaming_content), content[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/{0}'.format(len(content)))
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(''.join(response.streaming_content), content[-5:])
+        response = self.client.get(url, HTTP_RANGE='bytes={0}-'.format(len(content)))
+        self.assertEqual(response.status_code, 416)
+
+        # The same data makes the same file; changed data replaces it.
+        self.assertEqual(write_bundle(version), os.path.join(self.bundle_root, url.split('/')[-1]))
+        MethodFactory.create(klass=klass, name='post')
+        write_bundle(version)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class KlassDiffTest(TestCase):
+    def make_klass(self, version, methods, attributes, parents=()):
+        klass = KlassFactory.create(name='View', module__name='base', module__project_version=version)
+        for order, name in enumerate(parents):
+            InheritanceFactory.create(child=klass, parent__name=name, parent__module=klass.module, order=order)
+        for name, code in methods:
+            MethodFactory.create(klass=klass, name=name, code=code)
+        for name, value in attributes:
+            KlassAttributeFactory.create(klass=klass, name=name, value=value)
+        return klass
+
+    def setUp(self):
+        old = ProjectVersionFactory.create(version_number='1.0')
+        new = ProjectVersionFactory.create(version_number='1.1', project=old.project)
+        self.old = self.make_klass(
+            old,
+            [('get', 'def get(self):\n    pass\n'), ('post', 'def post(self):\n    pass\n')],
+            [('template_name', 'None'), ('extra', 'None')],
+        )
+        self.new = self.make_klass(
+            new,
+            [('get', 'def get(self):\n    return 1\n'), ('put', 'def put(self):\n    pass\n')],
+            [('template_name', "'base.html'"), ('extra', 'None')],
+            parents=['ContextMixin'],
+        )
+
+    def test_content_hash(self):
+        method = Method.objects.get(klass=self.old, name='get')
+        self.assertEqual(method.source_id, get_content_hash(method.code))
+        attribute = KlassAttribute.objects.get(klass=self.old, name='extra')
+        self.assertEqual(attribute.content_hash, get_content_hash('None'))
+
+    def test_loaddata(self):
+        """ loaddata saves raw, and the hashes are still set """
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        call_command('loaddata', *[os.path.join(fixtures, name) for name in (
+            'project.json', 'sources.json', '1.3.json', '1.5.json')], verbosity=0)
+        self.assertFalse(KlassAttribute.objects.filter(content_hash='').exists())
+        old, new = [Klass.objects.get(
+            name='View', module__project_version__version_number=version) for version in ('1.3', '1.5')]
+        changed = diff_klasses(old, new)['attributes']['changed']
+        self.assertIn('http_method_names', [a['name'] for a in changed])
+
+    def test_diff(self):
+        diff = diff_klasses(self.old, self.new)
+        self.assertEqual(diff['mro']['added'], ['ContextMixin'])
+        self.assertEqual(diff['mro']['removed'], [])
+        methods = diff['methods']
+        self.assertEqual([m['name'] for m in methods['added']], ['put'])
+        self.assertEqual([m['name'] for m in methods['removed']], ['post'])
+        [changed] = methods['changed']
+        self.assertEqual(changed['name'], 'get')
+        self.assertIn('+    return 1', changed['diff'])
+        attributes = diff['attributes']
+        self.assertEqual([a['name'] for a in attributes['changed']], ['template_name'])
+        self.assertEqual(attributes['unchanged'], 1)
+
+    def test_views(self):
+        kwargs = {'package': self.old.module.project_version.project.name, 'old': '1.0', 'new': '1.1', 'klass': 'View'}
+        response = self.client.get(reverse('klass-diff-api', kwargs=kwargs))
+        self.assertEqual(json.loads(response.content)['methods']['added'][0]['name'], 'put')
+        response = self.client.get(reverse('klass-diff', kwargs=kwargs))
+        self.assertContains(response, 'ContextMixin')
+        response = self.client.get(reverse('klass-diff', kwargs=kwargs), {'module': 'other'})
+        self.assertEqual(response.status_code, 404)
+
+
+class SourceTest(TemporaryBundleRootMixin, TestCase):
+    def test_shared_between_versions(self):
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        project = os.path.join(fixtures, 'project.json')
+        silent_call_command('load_cbv_fixtures', project, os.path.join(fixtures, '1.6.json'))
+        only_16 = Source.objects.count()
+        silent_call_command('load_cbv_fixtures', os.path.join(fixtures, '1.7.json'))
+        usage = Source.objects.get_usage()
+        self.assertEqual(usage['uses'], Method.objects.count() + Function.objects.count())
+        self.assertEqual(usage['sources'], Source.objects.count())
+        self.assertLess(usage['sources'], usage['uses'])
+        self.assertLess(usage['stored_bytes'], usage['used_bytes'])
+
+        # Reloading a version keeps the code it shares, and drops the rest.
+        silent_call_command('load_cbv_fixtures', os.path.join(fixtures, '1.7.json'))
+        self.assertEqual(Source.objects.count(), usage['sources'])
+        ProjectVersion.objects.filter(version_number='1.7').delete()
+        Source.objects.delete_unused()
+        self.assertEqual(Source.objects.count(), only_16)
+
+    def test_highlighted_source(self):
+        method = MethodFactory.create(
+            line_number=98, code='def get(self):\n    x = 1\n    return x\n')
+        expected = highlight(
+            method.code,
+            get_lexer_by_name('python', stripall=True),
+            HtmlFormatter(linenos='True', linenostart=98),
+        )
+        self.assertEqual(highlighted_source(method), expected)
+        method = Method.objects.select_related('source').get(pk=method.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(highlighted_source(method), expected)
+
+
+class SQLInstrumentationTest(TestCase):
+    def setUp(self):
+        instrumentation.stats.reset()
+        self.klass = KlassFactory.create()
+        InheritanceFactory.create(child=self.klass, parent__module=self.klass.module)
+        MethodFactory.create(klass=self.klass)
+
+    @override_settings(CBV_SQL_INSTRUMENTATION=True, CBV_SQL_HEADERS=True)
+    def test_counts(self):
+        response = self.client.get(self.klass.get_absolute_url())
+        queries = int(response['X-SQL-Queries'])
+        self.assertGreater(queries, 0)
+        # The class page asks each ancestor for its methods, one at a time.
+        self.assertGreater(int(response['X-SQL-Repeats']), 0)
+        self.client.get(self.klass.get_absolute_url())
+
+        view = instrumentation.stats.as_dict()['views']['klass-detail']
+        self.assertEqual(view['requests'], 2)
+        self.assertEqual(view['max_queries'], queries)
+        self.assertLessEqual(sum(s['count'] for s in view['top_statements']), view['queries'])
+
+    def test_statements_bounded(self):
+        recorder = instrumentation.QueryRecorder()
+        recorder.record('SELECT 1', (), 0)
+        recorder.record('SELECT 1', (), 0)
+        instrumentation.stats.add('view', recorder)
+        for i in range(instrumentation.MAX_STATEMENTS * 2):
+            recorder = instrumentation.QueryRecorder()
+            recorder.record('SELECT {0}'.format(i + 2), (), 0)
+            instrumentation.stats.add('view', recorder)
+        statements = instrumentation.stats.views['view']['statements']
+        self.assertEqual(len(statements), instrumentation.MAX_STATEMENTS)
+        # The most run is still there.
+        self.assertEqual(instrumentation.stats.as_dict()['views']['view']['top_statements'][0],
+                         {'sql': 'SELECT 1', 'count': 2})
+
+    def test_disabled(self):
+        response = self.client.get(self.klass.get_absolute_url())
+        self.assertNotIn('X-SQL-Queries', response)
+        self.assertEqual(instrumentation.stats.as_dict()['views'], {})
+
+    @override_settings(CBV_SQL_INSTRUMENTATION=True)
+    def test_staff_only(self):
+        self.client.get(self.klass.get_absolute_url())
+        url = reverse('sql-stats')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        user = User.objects.create_user('staff', password='staff')
+        user.is_staff = True
+        user.save()
+        self.client.login(username='staff', password='staff')
+        data = json.loads(self.client.get(url).content)
+        self.assertTrue(data['enabled'])
+        self.assertIn('klass-detail', data['views'])
+
+
+class BenchmarkTest(TestCase):
+    def test_results(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        before = os.path.join(directory, 'before.json')
+        silent_call_command('cbv_benchmark', 'chain=3', 'diamonds=1', repeat=1, output=before)
+        with open(before) as f:
+            results = json.load(f)['results']
+        self.assertEqual([(r['shape'], r['size'], r['klasses']) for r in results],
+                         [('chain', 3, 3), ('diamonds', 1, 4)])
+        chain = results[0]['operations']
+        self.assertEqual(chain['get_all_ancestors']['queries'], 3)
+        self.assertEqual(len(chain), len(benchmarks.OPERATIONS))
+
+        after = os.path.join(directory, 'after.json')
+        silent_call_command('cbv_benchmark', 'chain=3', operations=['get_methods'],
+                            repeat=1, output=after, compare=before)
+        with open(after) as f:
+            self.assertEqual(list(json.load(f)['results'][0]['operations']), ['get_methods'])
+        with self.assertRaises(CommandError):
+            silent_call_command('cbv_benchmark', 'spiral=3')
+
+
+class ReplayTest(TestCase):
+    def test_sitemap_and_log(self):
+        klass = KlassFactory.create(module__project_version__project__name='Django')
+        MethodFactory.create(klass=klass)
+        urls = replay.sitemap_urls()
+        self.assertEqual(urls, [reverse('home'), klass.get_absolute_url()])
+
+        log = [
+            '1.2.3.4 - - [19/Oct/2026:10:00:00 +0000] "GET {0} HTTP/1.1" 200 512 "-" "curl"'.format(urls[1]),
+            '1.2.3.4 - - [19/Oct/2026:10:00:01 +0000] "POST /search/ HTTP/1.1" 200 512',
+            '1.2.3.4 - - [19/Oct/2026:10:00:02 +0000] "GET /search/?q=get HTTP/1.1" 200 512',
+        ]
+        self.assertEqual(replay.log_urls(log), [urls[1], '/search/?q=get'])
+
+        # Without a pool, requests are made one after another in this thread.
+        results = replay.replay(urls * 3 + ['/search/?q=get'])
+        self.assertEqual(sorted(results['views']), ['home', 'klass-detail', 'search'])
+        view = results['views']['klass-detail']
+        self.assertEqual((view['requests'], view['errors'], view['statuses']), (3, 0, {'200': 3}))
+        self.assertGreater(view['mean_queries'], 0)
+        self.assertLessEqual(view['p50_ms'], view['p99_ms'])
+        self.assertEqual(results['total']['requests'], 7)
+
+    def test_percentile(self):
+        ordered = range(1, 101)
+        self.assertEqual([replay.percentile(ordered, p) for p in (50, 90, 99, 100)], [50, 90, 99, 100])
+        self.assertEqual(replay.percentile([7], 99), 7)
+        self.assertIsNone(replay.percentile([], 50))
+
+
+# What each kind of page may cost, measured on the real fixtures:
+# (URL name or path, class, queries, milliseconds). Pages of a class are
+# measured on View, UpdateView and DateDetailView in 1.7, and the version
+# pages on 1.7. Lower a budget when a page gets cheaper.
+PAGE_BUDGETS = (
+    ('home', None, 153, 1000),
+    ('sitemap', None, 2, 1000),
+    ('/projects/', None, 0, 100),
+    ('/projects/Django/', None, 1, 100),
+    ('latest-version-detail', None, 1, 100),
+    ('version-detail', None, 152, 1000),
+    ('complete', None, 1, 100),
+    ('bundle', None, 1, 1000),
+    ('latest-module-detail', 'UpdateView', 1, 100),
+    ('module-detail', 'View', 17, 500),
+    ('module-detail', 'UpdateView', 17, 500),
+    ('module-detail', 'DateDetailView', 17, 500),
+    ('latest-klass-detail', 'UpdateView', 1, 100),
+    ('klass-detail', 'View', 62, 1000),
+    ('klass-detail', 'UpdateView', 51, 1000),
+    ('klass-detail', 'DateDetailView', 53, 1000),
+    ('klass-detail-shortcut', 'View', 66, 1000),
+    ('klass-detail-shortcut', 'UpdateView', 55, 1000),
+    ('klass-detail-shortcut', 'DateDetailView', 57, 1000),
+    ('klass-diff', 'UpdateView', 11, 500),
+    ('klass-diff-api', 'UpdateView', 11, 500),
+)
+BUDGET_KLASSES = {
+    'View': 'django.views.generic.base',
+    'UpdateView': 'django.views.generic.edit',
+    'DateDetailView': 'django.views.generic.dates',
+}
+# Which arguments each URL takes.
+BUDGET_KWARGS = {
+    'latest-version-detail': ('package',),
+    'version-detail': ('package', 'version'),
+    'complete': ('package', 'version'),
+    'bundle': ('package', 'version'),
+    'latest-module-detail': ('package', 'module'),
+    'module-detail': ('package', 'version', 'module'),
+    'latest-klass-detail': ('package', 'module', 'klass'),
+    'klass-detail': ('package', 'version', 'module', 'klass'),
+    'klass-detail-shortcut': ('klass',),
+    'klass-diff': ('package', 'old', 'new', 'klass'),
+    'klass-diff-api': ('package', 'old', 'new', 'klass'),
+}
+# Slower machines can loosen the time ceilings, eg. CBV_BUDGET_TIME_FACTOR=3.
+BUDGET_TIME_FACTOR = float(os.environ.get('CBV_BUDGET_TIME_FACTOR', 1))
+
+
+@override_settings(CBV_PAGE_CACHE_TIMEOUT=0)
+class PageBudgetTest(TemporaryBundleRootMixin, TestCase):
+    """
+    Every page stays within its query budget and time ceiling. Each page is
+    requested once beforehand, to fill the highlighting and fragment caches;
+    the page cache is off, so the page is still rendered.
+    """
+    def setUp(self):
+        super(PageBudgetTest, self).setUp()
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        silent_call_command('load_cbv_fixtures', *[
+            os.path.join(fixtures, name)
+            for name in ('project.json', '1.3.json', '1.4.json', '1.5.json', '1.6.json', '1.7.json')
+        ])
+
+    def get_url(self, name, klass):
+        if name.startswith('/'):
+            return name
+        values = {'package': 'Django', 'version': '1.7', 'old': '1.6', 'new': '1.7'}
+        if klass:
+            values.update(klass=klass, module=BUDGET_KLASSES[klass])
+        url = reverse(name, kwargs=dict((key, values[key]) for key in BUDGET_KWARGS.get(name, ())))
+        return url + '?q=Update' if name == 'complete' else url
+
+    def test_budgets(self):
+        report = []
+        for name, klass, budget, ceiling in PAGE_BUDGETS:
+            url = self.get_url(name, klass)
+            self.client.get(url)
+            with instrumentation.recording() as recorder:
+                start = time.time()
+                response = self.client.get(url)
+                elapsed = (time.time() - start) * 1000
+            self.assertIn(response.status_code, (200, 301, 302), url)
+
+            ceiling *= BUDGET_TIME_FACTOR
+            if recorder.queries <= budget and elapsed <= ceiling:
+                continue
+            report.append('{0} ({1}): {2} queries, budget {3}; {4:.0f}ms, ceiling {5:.0f}ms'.format(
+                url, name, recorder.queries, budget, elapsed, ceiling))
+            if recorder.queries > budget:
+                for sql, count in recorder.statements.most_common(instrumentation.TOP_STATEMENTS):
+                    report.append('    {0} x {1}'.format(count, sql))
+        if report:
+            self.fail('Pages over budget:\n' + '\n'.join(report))
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        view = KlassFactory.create(name='View', module__name='base')
+        self.dispatch = MethodFactory.create(klass=view, name='dispatch')
+        KlassAttributeFactory.create(klass=view, name='http_method_names', value="['get']")
+        self.klass = KlassFactory.create(name='RedirectView', module=view.module)
+        InheritanceFactory.create(child=self.klass, parent=view)
+        MethodFactory.create(klass=self.klass, name='get')
+
+    def test_fingerprint(self):
+        fingerprint = self.klass.get_fingerprint()
+        self.assertEqual(Klass.objects.get(pk=self.klass.pk).get_fingerprint(), fingerprint)
+        # A change anywhere along the MRO shows.
+        self.dispatch.source = Source.objects.for_code('def dispatch(self):\n    return 4242\n')
+        self.dispatch.save()
+        self.assertNotEqual(Klass.objects.get(pk=self.klass.pk).get_fingerprint(), fingerprint)
+
+    @override_settings(CBV_PAGE_CACHE_TIMEOUT=0)
+    def test_page(self):
+        url = self.klass.get_absolute_url()
+        first = self.client.get(url)
+        self.assertContains(first, 'http_method_names')
+        self.assertEqual(self.client.get(url).content, first.content)
+
+        self.dispatch.source = Source.objects.for_code('def dispatch(self):\n    return 4242\n')
+        self.dispatch.save()
+        self.assertContains(self.client.get(url), '4242')
+
+
+class WarmCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.klass = KlassFactory.create(module__project_version__project__name='Django')
+        InheritanceFactory.create(child=self.klass, parent__module=self.klass.module)
+        MethodFactory.create(klass=self.klass)
+
+    def test_warm(self):
+        urls = warming.get_urls()
+        self.assertEqual(sorted(set(kind for kind, url in urls)), ['api', 'home', 'klass', 'module', 'sitemap', 'version'])
+        self.assertIn(('klass', self.klass.get_absolute_url()), urls)
+        self.assertNotIn('api', [kind for kind, url in warming.get_urls(api=False)])
+
+        results = warming.warm(urls, workers=1)
+        self.assertEqual(results['failures'], [])
+        self.assertEqual(results['kinds']['klass']['pages'], 2)
+        self.assertGreater(results['cache_entries'], 0)
+        self.assertGreater(results['cache_bytes'], 0)
+        # Everything is cached now.
+        self.assertEqual(warming.warm(urls, workers=1)['cache_writes'], 0)
+
+        with self.assertRaises(CommandError):
+            silent_call_command('warm_cbv_cache', '9.9')
+
+    def test_rate(self):
+        limiter = warming.RateLimiter(rate=100)
+        start = time.time()
+        for i in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+
+@override_settings(CBV_PAGE_CACHE_TIMEOUT=60)
+class PageCacheTest(TemporaryBundleRootMixin, TestCase):
+    def setUp(self):
+        super(PageCacheTest, self).setUp()
+        cache.clear()
+        pagecache.stats.reset()
+        self.klass = KlassFactory.create()
+        MethodFactory.create(klass=self.klass)
+
+    def test_hit_and_bump(self):
+        url = self.klass.get_absolute_url()
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+        # Nothing is invalidated until the generation moves on.
+        Klass.objects.filter(pk=self.klass.pk).update(docstring='Changed in place.')
+        self.assertNotContains(self.client.get(url), 'Changed in place.')
+        generation = pagecache.get_generation()
+        self.assertEqual(pagecache.bump_generation(), generation + 1)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Changed in place.')
+
+        view = pagecache.stats.as_dict()['views']['klass-detail']
+        self.assertEqual((view['hits'], view['misses'], view['stored']), (2, 2, 2))
+
+    def test_redirect(self):
+        version = self.klass.module.project_version
+        url = reverse('latest-version-detail', kwargs={'package': version.project.name})
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertRedirects(response, version.get_absolute_url())
+        # Only to a version of that package.
+        response = self.client.get(reverse('latest-version-detail', kwargs={'package': 'nothing'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_commands_bump(self):
+        generation = pagecache.get_generation()
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        silent_call_command('load_cbv_fixtures', os.path.join(fixtures, 'project.json'), os.path.join(fixtures, '1.7.json'))
+        self.assertGreater(pagecache.get_generation(), generation)
+
+    def test_stats_for_staff(self):
+        url = reverse('cache-stats')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.get(self.klass.get_absolute_url())
+        user = User.objects.create_user('staff', password='staff')
+        user.is_staff = True
+        user.save()
+        self.client.login(username='staff', password='staff')
+        data = json.loads(self.client.get(url).content)
+        self.assertTrue(data['enabled'])
+        self.assertEqual(data['misses'], 1)
+        self.assertEqual(data['generation'], pagecache.get_generation())
+
+
+class SingleFlightTest(TestCase):
+    def test_one_leader(self):
+        flights = pagecache.SingleFlight()
+        flight, leader = flights.join('page')
+        self.assertTrue(leader)
+        joined, results = [], []
+
+        def follow():
+            other, leads = flights.join('page')
+            joined.append(leads)
+            results.append((leads, other.wait(5)))
+
+        followers = [threading.Thread(target=follow) for i in range(4)]
+        for follower in followers:
+            follower.start()
+        while len(joined) < len(followers):
+            time.sleep(0.01)
+        flights.land('page', flight, 'rendered')
+        for follower in followers:
+            follower.join()
+        self.assertEqual(results, [(False, 'rendered')] * 4)
+        # Landed flights are forgotten.
+        self.assertTrue(flights.join('page')[1])
+
+
+@override_settings(CBV_PAGE_CACHE_TIMEOUT=60, CBV_PAGE_CACHE_WAIT=0.1)
+class CoalescingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        pagecache.stats.reset()
+        self.klass = KlassFactory.create()
+        self.url = self.klass.get_absolute_url()
+
+    def render_elsewhere(self):
+        """ As if another thread had started rendering the page """
+        key = pagecache.get_page_key(self.url)
+        flight, leader = pagecache.flights.join(key)
+        self.addCleanup(pagecache.flights.land, key, flight, None)
+
+    def test_stale_while_rendering(self):
+        old = self.client.get(self.url).content
+        pagecache.bump_generation()
+        self.render_elsewhere()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertEqual(response.content, old)
+
+    def test_wait_then_render(self):
+        self.render_elsewhere()
+        # Nothing older to serve, and the other render never lands.
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CBV_PAGE_CACHE_LOCK=True)
+    def test_worker_lock(self):
+        self.client.get(self.url)
+        pagecache.bump_generation()
+        key = pagecache.get_page_key(self.url)
+        cache.add(key + ':lock', 1)
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'stale')
+        cache.delete(key + ':lock')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        self.assertIsNone(cache.get(key + ':lock'))
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'hit')
+
+        data = pagecache.stats.as_dict()
+        self.assertEqual((data['hits'], data['misses'], data['stale']), (1, 2, 1))
+        self.assertEqual(data['hit_rate'], 0.5)
+
+
+class CountingView(pagecache.CachedPageMixin, View):
+    """ A cached page that needs no database, so it can be rendered in a thread """
+    renders = 0
+
+    def get(self, request):
+        CountingView.renders += 1
+        return HttpResponse(str(CountingView.renders))
+
+
+@override_settings(CBV_PAGE_CACHE_TIMEOUT=60, CBV_PAGE_CACHE_STALE=3600, CBV_PAGE_CACHE_REVALIDATIONS=2)
+class RevalidationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        pagecache.stats.reset()
+        CountingView.renders = 0
+        self.view = CountingView.as_view()
+        self.request = RequestFactory().get('/counted/')
+        self.key = pagecache.get_page_key('/counted/')
+
+    def expire(self, seconds):
+        """ Make the cached page `seconds` past its freshness """
+        status, headers, content, fresh_until = cache.get(self.key)
+        cache.set(self.key, (status, headers, content, time.time() - seconds))
+
+    def assertCacheControl(self, response, max_age):
+        directives = set(response['Cache-Control'].split(', '))
+        self.assertEqual(directives, set([max_age, 'public', 'stale-while-revalidate=3600']))
+
+    def wait_for_render(self):
+        deadline = time.time() + 5
+        while CountingView.renders < 2 or self.key in pagecache.flights.flights:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_stale_while_revalidate(self):
+        response = self.view(self.request)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertCacheControl(response, 'max-age=60')
+        self.assertEqual(self.view(self.request)['X-Page-Cache'], 'hit')
+
+        self.expire(10)
+        response = self.view(self.request)
+        self.assertEqual((response['X-Page-Cache'], response.content), ('stale', '1'))
+        self.assertCacheControl(response, 'max-age=0')
+        self.wait_for_render()
+        response = self.view(self.request)
+        self.assertEqual((response['X-Page-Cache'], response.content), ('hit', '2'))
+
+        view = pagecache.stats.as_dict()['views']['<unresolved>']
+        self.assertEqual((view['misses'], view['stale'], view['revalidated']), (1, 1, 1))
+
+    @override_settings(CBV_PAGE_CACHE_REVALIDATIONS=0)
+    def test_limit(self):
+        self.view(self.request)
+        self.expire(10)
+        self.assertEqual(self.view(self.request)['X-Page-Cache'], 'stale')
+        self.assertEqual(CountingView.renders, 1)
+        # The flight was landed, for the next request to try again.
+        self.assertNotIn(self.key, pagecache.flights.flights)
+
+    def test_too_stale(self):
+        self.view(self.request)
+        self.expire(3601)
+        response = self.view(self.request)
+        self.assertEqual((response['X-Page-Cache'], response.content), ('miss', '2'))
+
+
+class PurgeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Stands in for a CDN's purge API """
+    requests = []
+    status = 200
+
+    def do_POST(self):
+        self.requests.append((self.path, dict(self.headers)))
+        self.send_response(self.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SurrogateKeysTest(TemporaryBundleRootMixin, TestCase):
+    def setUp(self):
+        super(SurrogateKeysTest, self).setUp()
+        cache.clear()
+        self.parent = KlassFactory.create(
+            name='View',
+            module__name='django.views.generic.base',
+            module__project_version__version_number='1.7',
+            module__project_version__project__name='Django',
+        )
+        self.klass = KlassFactory.create(name='RedirectView', module=self.parent.module)
+        InheritanceFactory.create(parent=self.parent, child=self.klass)
+
+        PurgeHandler.requests = []
+        PurgeHandler.status = 200
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), PurgeHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.purger = {
+            'BACKEND': 'cbv.surrogates.HTTPPurger',
+            'URL': 'http://127.0.0.1:{0}/purge'.format(self.server.server_port),
+            'HEADERS': {'Fastly-Key': 'secret'},
+            'BATCH_SIZE': 2,
+        }
+
+    def get_keys(self, url):
+        return self.client.get(url)['Surrogate-Key'].split(' ')
+
+    @override_settings(CBV_PAGE_CACHE_TIMEOUT=60)
+    def test_headers(self):
+        version = ['project:Django', 'version:Django/1.7']
+        module = version + ['module:Django/1.7/django.views.generic.base']
+        klass = module + [
+            'klass:Django/1.7/django.views.generic.base/RedirectView',
+            'klass:Django/1.7/django.views.generic.base/View',
+        ]
+        url = self.klass.get_absolute_url()
+        self.assertEqual(self.get_keys(url), klass)
+        # Cached pages keep them.
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+        self.assertEqual(self.get_keys(url), klass)
+        self.assertEqual(self.get_keys(self.parent.get_absolute_url()), module + [klass[-1]])
+        self.assertEqual(self.get_keys(self.klass.module.get_absolute_url()), module)
+        self.assertEqual(self.get_keys(self.klass.module.project_version.get_absolute_url()), version)
+        self.assertEqual(self.get_keys(reverse('latest-version-detail', kwargs={'package': 'Django'})), version[:1])
+        api = reverse('klass-api', kwargs={
+            'package': 'Django', 'version': '1.7', 'module': 'django.views.generic.base', 'klass': 'RedirectView'})
+        self.assertEqual(self.get_keys(api), klass)
+        self.assertEqual(self.get_keys(api), klass)
+
+    def test_minimise(self):
+        self.assertEqual(surrogates.minimise([
+            'klass:Django/1.7/base/View',
+            'version:Django/1.7',
+            'klass:Django/1.6/base/View',
+            'module:Django/1.7/base',
+            'klass:Django/1.6/base/View',
+        ]), ['version:Django/1.7', 'klass:Django/1.6/base/View'])
+        self.assertEqual(surrogates.minimise(['version:Django/1.7', 'project:Django']), ['project:Django'])
+
+    def test_populate_keys(self):
+        version = self.klass.module.project_version
+        namesake = KlassFactory.create(
+            name='RedirectView',
+            module__name='django.views.generic.base',
+            module__project_version__version_number='1.6',
+            module__project_version__project=version.project,
+        )
+        before = surrogates.get_locations('Django', '1.7')
+        self.assertEqual(surrogates.get_populate_keys(version, before), ['version:Django/1.7'])
+        # Its namesake in 1.6 links to where the class is in 1.7.
+        self.klass.delete()
+        self.assertEqual(surrogates.get_populate_keys(version, before), [
+            'version:Django/1.7',
+            'klass:Django/1.6/django.views.generic.base/RedirectView',
+        ])
+        # A new version is in the nav of every page.
+        self.assertIsNone(surrogates.get_locations('Django', '1.8'))
+        self.assertEqual(surrogates.get_populate_keys(namesake.module.project_version, None), ['project:Django'])
+
+    def test_http_purger(self):
+        with self.settings(CBV_PURGER=self.purger):
+            keys = surrogates.purge(['version:Django/1.7', 'project:Django', 'klass:A/1/a/A', 'klass:B/1/b/B'])
+        self.assertEqual(keys, ['project:Django', 'klass:A/1/a/A', 'klass:B/1/b/B'])
+        self.assertEqual([path for path, headers in PurgeHandler.requests], ['/purge', '/purge'])
+        self.assertEqual([headers['surrogate-key'] for path, headers in PurgeHandler.requests], [
+            'project:Django klass:A/1/a/A', 'klass:B/1/b/B'])
+        self.assertEqual(PurgeHandler.requests[0][1]['fastly-key'], 'secret')
+
+        PurgeHandler.status = 503
+        with self.settings(CBV_PURGER=self.purger):
+            with self.assertRaises(IOError):
+                surrogates.purge(['project:Django'])
+
+    def test_fetch_docs_urls(self):
+        handle, filename = tempfile.mkstemp(suffix='.inv')
+        os.close(handle)
+        self.addCleanup(os.remove, filename)
+        with open(filename, 'wb') as f:
+            f.write(make_inventory('django.views.generic.base.View'))
+        with self.settings(CBV_PURGER=self.purger):
+            silent_call_command(
+                'fetch_docs_urls',
+                inventories=['1.7=' + filename],
+                docs_url='https://docs.example.com/{version}',
+                offline=True,
+            )
+        self.assertEqual([headers['surrogate-key'] for path, headers in PurgeHandler.requests], [
+            'klass:Django/1.7/django.views.generic.base/View'])
+
+    def test_load_cbv_fixtures(self):
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+        project = os.path.join(fixtures, 'project.json')
+        fixture = os.path.join(fixtures, '1.6.json')
+        with self.settings(CBV_PURGER=self.purger):
+            silent_call_command('load_cbv_fixtures', project, fixture)
+            # Loaded again, only that version's pages change.
+            silent_call_command('load_cbv_fixtures', fixture)
+        self.assertEqual([headers['surrogate-key'] for path, headers in PurgeHandler.requests], [
+            'project:Django', 'version:Django/1.6'])
+
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, self.filename)
+        self.settings_dict = {
+            'ENGINE': 'cbv.backends.sqlite3',
+            'NAME': self.filename,
+            'OPTIONS': {},
+            'POOL': {'SIZE': 1, 'MAX_AGE': 600, 'CHECK_AFTER': 600},
+        }
+
+    def connect(self):
+        """ As a request's connection to the database would be """
+        wrapper = sqlite3_backend.DatabaseWrapper(self.settings_dict, alias='pool-test')
+        wrapper.cursor().execute('SELECT 1')
+        return wrapper
+
+    def get_pool(self):
+        pool = backend_pool.get_pool('pool-test', self.settings_dict)
+        self.addCleanup(pool.clear)
+        return pool
+
+    def test_reuse(self):
+        pool = self.get_pool()
+        first = self.connect()
+        raw = first.connection
+        first.close()
+        self.assertIsNone(first.connection)
+        second = self.connect()
+        self.assertIs(second.connection, raw)
+        # Only one is kept.
+        third = self.connect()
+        self.assertIsNot(third.connection, raw)
+        second.close()
+        third.close()
+        self.assertEqual(pool.as_dict(), {
+            'size': 1, 'idle': 1, 'created': 2, 'reused': 1, 'expired': 0, 'failed': 0, 'overflowed': 1,
+        })
+
+    def test_close_cleans(self):
+        self.get_pool()
+        wrapper = self.connect()
+        wrapper.cursor().execute('CREATE TABLE pool_test (id integer)')
+        wrapper.enter_transaction_management()
+        wrapper.managed(True)
+        wrapper.cursor().execute('INSERT INTO pool_test VALUES (1)')
+        wrapper.set_dirty()
+        wrapper.close()
+        # Rolled back and clean, so leaving transaction management doesn't
+        # raise about a pending commit.
+        self.assertFalse(wrapper.is_dirty())
+        wrapper.leave_transaction_management()
+        self.assertEqual(self.connect().cursor().execute('SELECT count(*) FROM pool_test').fetchone(), (0,))
+
+    def test_max_age(self):
+        pool = self.get_pool()
+        first = self.connect()
+        raw = first.connection
+        first.close()
+        pool.idle[-1].created -= 600
+        self.assertIsNot(self.connect().connection, raw)
+        self.assertEqual(pool.as_dict()['expired'], 1)
+
+    def test_health_check(self):
+        self.settings_dict['POOL']['CHECK_AFTER'] = 0
+        pool = self.get_pool()
+        first = self.connect()
+        raw = first.connection
+        first.close()
+        # Reused while it works.
+        second = self.connect()
+        self.assertIs(second.connection, raw)
+        second.close()
+        # As if the database had gone away meanwhile.
+        raw.close()
+        third = self.connect()
+        self.assertIsNot(third.connection, raw)
+        third.cursor().execute('SELECT 1')
+        self.assertEqual(pool.as_dict()['failed'], 1)
+
+    def test_fork(self):
+        pool = self.get_pool()
+        first = self.connect()
+        raw = first.connection
+        first.close()
+        pool.pid = -1
+        self.assertIsNot(self.connect().connection, raw)
+        self.assertEqual([pooled.connection for pooled in pool.inherited], [raw])
+
+    def test_not_pooled(self):
+        self.assertIsNone(backend_pool.get_pool('pool-test', dict(self.settings_dict, NAME=':memory:')))
+        self.assertIsNone(backend_pool.get_pool('pool-test', dict(self.settings_dict, POOL={'SIZE': 0})))
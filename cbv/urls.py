@@ -22,8 +22,13 @@ urlpatterns = patterns('',
     url(r'^$', RedirectView.as_view(url=reverse_lazy('home'))),
 
     url(r'^(?P<package>[\w-]+)/$', views.RedirectToLatestVersionView.as_view(), {'url_name': 'version-detail'}),
+    url(r'^(?P<package>[\w-]+)/diff/(?P<old>[^/]+)/(?P<new>[^/]+)/(?P<klass>\w+)/$', views.KlassDiffView.as_view(), name='klass-diff'),
+    url(r'^(?P<package>[\w-]+)/diff/(?P<old>[^/]+)/(?P<new>[^/]+)/(?P<klass>\w+)\.json$', views.KlassDiffAPIView.as_view(), name='klass-diff-api'),
+
     url(r'^(?P<package>[\w-]+)/latest/$', views.RedirectToLatestVersionView.as_view(), {'url_name': 'version-detail'}, name='latest-version-detail'),
     url(r'^(?P<package>[\w-]+)/(?P<version>[^/]+)/$', views.VersionDetailView.as_view(), name='version-detail'),
+    url(r'^(?P<package>[\w-]+)/(?P<version>[^/]+)/complete/$', views.CompleteView.as_view(), name='complete'),
+    url(r'^(?P<package>[\w-]+)/(?P<version>[^/]+)/bundle\.json\.gz$', views.BundleView.as_view(), name='bundle'),
 
     url(r'^(?P<package>[\w-]+)/latest/(?P<module>[\w\.]+)/$', views.RedirectToLatestVersionView.as_view(), {'url_name': 'module-detail'}, name='latest-module-detail'),
     url(r'^(?P<package>[\w-]+)/(?P<version>[^/]+)/(?P<module>[\w\.]+)/$', views.ModuleDetailView.as_view(), name='module-detail'),
@@ -1,20 +1,43 @@
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse, reverse_lazy
-from django.http import Http404
-from django.views.generic import DetailView, ListView, RedirectView
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.generic import DetailView, ListView, RedirectView, TemplateView, View
 from django.views.generic.detail import SingleObjectMixin
 
+from cbv import bundles, instrumentation, pagecache, surrogates
+from cbv.backends import pool
+from cbv.diff import diff_klasses
 from cbv.models import Klass, Module, ProjectVersion
+from cbv.ranges import serve_file
+from cbv.resolution import resolve_klass
+from cbv.search import METHOD, get_index
 
 
-class RedirectToLatestVersionView(RedirectView):
+class RedirectToLatestVersionView(pagecache.CachedPageMixin, surrogates.SurrogateKeysMixin, RedirectView):
     permanent = False
 
     def get_redirect_url(self, **kwargs):
         url_name = kwargs.pop('url_name')
-        kwargs['version'] = ProjectVersion.objects.get_latest(kwargs.get('package')).version_number
+        try:
+            self.project_version = ProjectVersion.objects.get_latest(kwargs.get('package'))
+        except IndexError:
+            raise Http404
+        kwargs['version'] = self.project_version.version_number
         self.url = reverse_lazy(url_name, kwargs=kwargs)
         return super(RedirectToLatestVersionView, self).get_redirect_url(**kwargs)
 
+    def get_surrogate_keys(self):
+        # Which version is the latest is up to the project.
+        return [surrogates.get_project_key(self.project_version.project.name)]
+
 
 class FuzzySingleObjectMixin(SingleObjectMixin):
     push_state_url = None
@@ -36,7 +59,21 @@ class FuzzySingleObjectMixin(SingleObjectMixin):
         return context
 
 
-class KlassDetailView(FuzzySingleObjectMixin, DetailView):
+class KlassFragmentsMixin(object):
+    """ For klass_detail.html, which caches its attributes and methods """
+    def get_context_data(self, **kwargs):
+        context = super(KlassFragmentsMixin, self).get_context_data(**kwargs)
+        context['fragment_cache_timeout'] = settings.CBV_FRAGMENT_CACHE_TIMEOUT
+        return context
+
+
+class KlassSurrogateKeysMixin(surrogates.SurrogateKeysMixin):
+    def get_surrogate_keys(self):
+        return surrogates.get_klass_keys(self.object)
+
+
+class KlassDetailView(pagecache.CachedPageMixin, KlassSurrogateKeysMixin, KlassFragmentsMixin,
+                      FuzzySingleObjectMixin, DetailView):
     model = Klass
 
     def get_queryset(self):
@@ -59,7 +96,62 @@ class KlassDetailView(FuzzySingleObjectMixin, DetailView):
         ).select_related('module__project_version__project').get()
 
 
-class LatestKlassDetailView(FuzzySingleObjectMixin, DetailView):
+class KlassAPIView(surrogates.SurrogateKeysMixin, View):
+    """
+    What KlassDetailView shows, as JSON.
+
+    The body is cached along with its sha1, which is also its ETag, and its
+    surrogate keys, under the page cache's generation, so the commands that
+    change the data move it on too. A client that sends the ETag back gets a
+    304 without the class being resolved.
+    """
+    cache_key = 'cbv-klass-api-v2:{generation}:{pk}:{module}:{klass}'
+
+    def get(self, request, package, version, module, klass):
+        try:
+            project_version = ProjectVersion.objects.filter(
+                version_number=version,
+                project__name=package,
+            ).select_related('project').get()
+        except ProjectVersion.DoesNotExist:
+            raise Http404
+        key = self.cache_key.format(
+            generation=pagecache.get_generation(), pk=project_version.pk, module=module, klass=klass)
+        cached = cache.get(key)
+        if cached is None:
+            cached = self.render(project_version, module, klass)
+            cache.set(key, cached)
+        etag, body, self.surrogate_keys = cached
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = quote_etag(etag)
+        patch_cache_control(response, public=True, max_age=0)
+        return response
+
+    def get_surrogate_keys(self):
+        return self.surrogate_keys
+
+    def render(self, project_version, module, klass):
+        """ (etag, body, surrogate keys) """
+        try:
+            obj = Klass.objects.filter(
+                name=klass,
+                module__name=module,
+                module__project_version=project_version,
+            ).select_related('module__project_version__project').get()
+        except Klass.DoesNotExist:
+            raise Http404
+        data = resolve_klass(obj)
+        body = json.dumps(data, sort_keys=True)
+        keys = surrogates.get_klass_keys(obj, [(k['module'], k['name']) for k in data['ancestors']])
+        return hashlib.sha1(body).hexdigest(), body, keys
+
+
+class LatestKlassDetailView(pagecache.CachedPageMixin, KlassSurrogateKeysMixin, KlassFragmentsMixin,
+                            FuzzySingleObjectMixin, DetailView):
     model = Klass
 
     def get_queryset(self):
@@ -78,7 +170,7 @@ class LatestKlassDetailView(FuzzySingleObjectMixin, DetailView):
         )
 
 
-class ModuleDetailView(FuzzySingleObjectMixin, DetailView):
+class ModuleDetailView(pagecache.CachedPageMixin, surrogates.SurrogateKeysMixin, FuzzySingleObjectMixin, DetailView):
     model = Module
 
     def dispatch(self, request, *args, **kwargs):
@@ -111,8 +203,11 @@ class ModuleDetailView(FuzzySingleObjectMixin, DetailView):
         })
         return super(ModuleDetailView, self).get_context_data(**kwargs)
 
+    def get_surrogate_keys(self):
+        return surrogates.get_module_keys(self.object, self.project_version)
+
 
-class VersionDetailView(ListView):
+class VersionDetailView(pagecache.CachedPageMixin, surrogates.SurrogateKeysMixin, ListView):
     model = Klass
     template_name = 'cbv/version_detail.html'
 
@@ -139,6 +234,9 @@ class VersionDetailView(ListView):
             raise Http404
         return super(VersionDetailView, self).dispatch(request, *args, **kwargs)
 
+    def get_surrogate_keys(self):
+        return surrogates.get_version_keys(self.project_version)
+
 
 class HomeView(VersionDetailView):
     template_name = 'home.html'
@@ -147,6 +245,236 @@ class HomeView(VersionDetailView):
         return ProjectVersion.objects.get_latest('Django')
 
 
+def get_document_url(project_version, document):
+    """ Where a search or completion result lives """
+    url = reverse('klass-detail', kwargs={
+        'package': project_version.project.name,
+        'version': project_version.version_number,
+        'module': document.module,
+        'klass': document.klass,
+    })
+    if document.kind == METHOD:
+        url += '#' + document.name
+    return url
+
+
+class SearchView(TemplateView):
+    template_name = 'cbv/search.html'
+    max_results = 100
+
+    def get_project_version(self):
+        package = self.request.GET.get('package', 'Django')
+        version = self.request.GET.get('version')
+        if not version:
+            return ProjectVersion.objects.get_latest(package)
+        return ProjectVersion.objects.filter(
+            version_number__iexact=version,
+            project__name__iexact=package,
+        ).select_related('project').get()
+
+    def get_results(self):
+        try:
+            limit = min(int(self.request.GET.get('limit', 50)), self.max_results)
+        except ValueError:
+            limit = 50
+        results = []
+        for score, document in get_index(self.project_version).search(self.query, limit):
+            results.append({
+                'kind': document.kind,
+                'name': document.name,
+                'klass': document.klass,
+                'module': document.module,
+                'summary': document.docstring.strip().split('\n')[0],
+                'url': get_document_url(self.project_version, document),
+                'score': round(score, 3),
+            })
+        return results
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.project_version = self.get_project_version()
+        except (ProjectVersion.DoesNotExist, IndexError):
+            raise Http404
+        self.query = request.GET.get('q', '').strip()
+        return super(SearchView, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(SearchView, self).get_context_data(**kwargs)
+        context.update({
+            'projectversion': self.project_version,
+            'query': self.query,
+            'results': self.get_results() if self.query else [],
+        })
+        return context
+
+
+class SearchAPIView(SearchView):
+    def render_to_response(self, context, **response_kwargs):
+        data = {
+            'project': self.project_version.project.name,
+            'version': self.project_version.version_number,
+            'query': context['query'],
+            'results': context['results'],
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+class CompleteView(surrogates.SurrogateKeysMixin, View):
+    """
+    Classes and methods of a version starting with ?prefix=, as JSON.
+
+    A version's classes only change when it's loaded again. A CDN, which is
+    purged then, can keep responses for a week; browsers, which aren't, only
+    for a few minutes.
+    """
+    limit = 10
+    max_limit = 50
+    max_age = 60 * 5
+    s_maxage = 60 * 60 * 24 * 7
+
+    def get(self, request, package, version):
+        try:
+            project_version = ProjectVersion.objects.filter(
+                version_number__iexact=version,
+                project__name__iexact=package,
+            ).select_related('project').get()
+        except ProjectVersion.DoesNotExist:
+            raise Http404
+        try:
+            limit = min(int(request.GET.get('limit', self.limit)), self.max_limit)
+        except ValueError:
+            limit = self.limit
+        prefix = request.GET.get('prefix', '')
+
+        results = [{
+            'kind': document.kind,
+            'name': document.name,
+            'klass': document.klass,
+            'module': document.module,
+            'url': get_document_url(project_version, document),
+        } for document in get_index(project_version).complete(prefix, limit)]
+        response = HttpResponse(json.dumps({
+            'prefix': prefix,
+            'results': results,
+        }), content_type='application/json')
+        patch_cache_control(response, public=True, max_age=self.max_age, s_maxage=self.s_maxage)
+        self.project_version = project_version
+        return response
+
+    def get_surrogate_keys(self):
+        return surrogates.get_version_keys(self.project_version)
+
+
+class BundleView(surrogates.SurrogateKeysMixin, View):
+    """ Redirects to the current bundle of a version """
+
+    def get(self, request, package, version):
+        try:
+            project_version = ProjectVersion.objects.filter(
+                version_number=version,
+                project__name=package,
+            ).select_related('project').get()
+        except ProjectVersion.DoesNotExist:
+            raise Http404
+        filename = os.path.basename(bundles.get_bundle(project_version))
+        response = HttpResponseRedirect(reverse('bundle-file', kwargs={'filename': filename}))
+        patch_cache_control(response, public=True, max_age=60 * 5)
+        self.project_version = project_version
+        return response
+
+    def get_surrogate_keys(self):
+        return surrogates.get_version_keys(self.project_version)
+
+
+class BundleFileView(View):
+    """ A bundle; its name changes with its contents, so it never expires """
+    max_age = 60 * 60 * 24 * 365
+
+    def get(self, request, filename):
+        path = os.path.join(bundles.get_root(), filename)
+        if not bundles.FILENAME_RE.match(filename) or not os.path.isfile(path):
+            raise Http404
+        response = serve_file(request, path, 'application/gzip', etag=filename.split('-')[-1].split('.')[0])
+        response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+        response['Cache-Control'] = 'public, max-age={0}, immutable'.format(self.max_age)
+        return response
+
+
+class KlassDiffView(surrogates.SurrogateKeysMixin, TemplateView):
+    """ What changed in a class between two versions """
+    template_name = 'cbv/klass_diff.html'
+
+    def get_klass(self, package, version, name):
+        klasses = Klass.objects.filter(
+            name=name,
+            module__project_version__version_number=version,
+            module__project_version__project__name=package,
+        ).select_related('module__project_version__project').order_by('module__name')
+        # A name can be in more than one module; ?module= picks one.
+        module = self.request.GET.get('module')
+        for klass in klasses:
+            if module is None or klass.module.name == module:
+                return klass
+        raise Http404
+
+    def get(self, request, package, old, new, klass):
+        self.klasses = self.get_klass(package, old, klass), self.get_klass(package, new, klass)
+        self.diff = diff_klasses(*self.klasses)
+        return super(KlassDiffView, self).get(request, package=package)
+
+    def get_surrogate_keys(self):
+        # Only populating a version changes what's inherited, and that purges
+        # the whole version, so the ancestors aren't worth looking up here.
+        keys = []
+        for klass in self.klasses:
+            keys += [key for key in surrogates.get_klass_keys(klass, ancestors=()) if key not in keys]
+        return keys
+
+    def get_context_data(self, **kwargs):
+        context = super(KlassDiffView, self).get_context_data(**kwargs)
+        context['diff'] = self.diff
+        return context
+
+
+class KlassDiffAPIView(KlassDiffView):
+    def render_to_response(self, context, **response_kwargs):
+        return HttpResponse(json.dumps(context['diff']), content_type='application/json')
+
+
+class StaffStatsView(View):
+    """ Counters of this process, as JSON, for staff """
+
+    def get_data(self):
+        return {}
+
+    def get(self, request):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        response = HttpResponse(json.dumps(self.get_data(), indent=1), content_type='application/json')
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class SQLStatsView(StaffStatsView):
+    """ The queries each view has run, and the connections they've used """
+
+    def get_data(self):
+        data = instrumentation.stats.as_dict()
+        data['enabled'] = getattr(settings, 'CBV_SQL_INSTRUMENTATION', False)
+        data['pools'] = pool.get_stats()
+        return data
+
+
+class PageCacheStatsView(StaffStatsView):
+    """ The page cache hits and misses of each view """
+
+    def get_data(self):
+        data = pagecache.stats.as_dict()
+        data['enabled'] = bool(getattr(settings, 'CBV_PAGE_CACHE_TIMEOUT', 0))
+        data['generation'] = pagecache.get_generation()
+        return data
+
+
 class Sitemap(ListView):
     template_name = 'sitemap.xml'
     context_object_name = 'urlset'
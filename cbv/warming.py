@@ -0,0 +1,146 @@
+"""
+Filling the caches ahead of visitors, by requesting every canonical page
+through the WSGI application (see cbv.replay) from a pool of threads.
+
+Whatever the pages cache on the way (fragments of class pages, the JSON of
+the class API) is written to the configured cache, so this only helps other
+processes when that cache is shared, as memcached is. What got written is
+counted by wrapping the cache's `set` while warming.
+"""
+import cPickle as pickle
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+
+from cbv import replay
+from cbv.models import Klass, Module, ProjectVersion
+
+
+def get_urls(version_numbers=None, api=True):
+    """ (kind, url) of every canonical page, for some or all versions """
+    versions = ProjectVersion.objects.select_related('project').order_by('version_number')
+    if version_numbers:
+        versions = versions.filter(version_number__in=version_numbers)
+    urls = [('home', reverse('home')), ('sitemap', reverse('sitemap'))]
+    for version in versions:
+        urls.append(('version', version.get_absolute_url()))
+        modules = Module.objects.filter(project_version=version).select_related('project_version__project')
+        urls += [('module', module.get_absolute_url()) for module in modules.order_by('name')]
+        klasses = Klass.objects.filter(module__project_version=version).select_related(
+            'module__project_version__project').order_by('module__name', 'name')
+        for klass in klasses:
+            urls.append(('klass', klass.get_absolute_url()))
+            if api:
+                urls.append(('api', reverse('klass-api', kwargs={
+                    'package': version.project.name,
+                    'version': version.version_number,
+                    'module': klass.module.name,
+                    'klass': klass.name,
+                })))
+    return urls
+
+
+class RateLimiter(object):
+    """ Spaces out calls to `wait` from any thread to at most `rate` a second """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next = time.time()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            at = max(self.next, now)
+            self.next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class CacheFill(object):
+    """ The entries written to a cache, and their pickled sizes, while in use """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.sizes = {}
+        self.writes = 0
+
+    def __enter__(self):
+        set = self.cache.set
+
+        def record_set(key, value, *args, **kwargs):
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            with self.lock:
+                self.sizes[key] = size
+                self.writes += 1
+            return set(key, value, *args, **kwargs)
+
+        # Shadow the method on this instance only.
+        self.cache.set = record_set
+        return self
+
+    def __exit__(self, *exc_info):
+        del self.cache.set
+
+    @property
+    def entries(self):
+        return len(self.sizes)
+
+    @property
+    def bytes(self):
+        return sum(self.sizes.values())
+
+
+def warm(urls, workers=4, rate=None, host='localhost', progress=None):
+    """
+    Request every (kind, url), at most `rate` a second, and sum up by kind.
+    With one worker, requests are made one after another in this thread.
+    """
+    application = replay.get_application()
+    limiter = RateLimiter(rate)
+
+    def fetch(item):
+        kind, url = item
+        limiter.wait()
+        start = time.time()
+        try:
+            status, body = replay.call(application, url, host)
+            error = None if status == 200 else str(status)
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+        return kind, url, time.time() - start, error
+
+    pool = ThreadPool(workers) if workers > 1 else None
+    kinds = {}
+    failures = []
+    start = time.time()
+    try:
+        with CacheFill(cache) as fill:
+            mapper = pool.imap_unordered if pool is not None else map
+            for done, (kind, url, elapsed, error) in enumerate(mapper(fetch, urls), 1):
+                summary = kinds.setdefault(kind, {'pages': 0, 'errors': 0, 'seconds': 0.0})
+                summary['pages'] += 1
+                summary['seconds'] += elapsed
+                if error:
+                    summary['errors'] += 1
+                    failures.append((url, error))
+                if progress:
+                    progress(done, fill)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return {
+        'seconds': time.time() - start,
+        'kinds': kinds,
+        'failures': failures,
+        'cache_entries': fill.entries,
+        'cache_writes': fill.writes,
+        'cache_bytes': fill.bytes,
+    }
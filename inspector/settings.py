@@ -1,5 +1,6 @@
 # Django settings for inspector project.
 
+import json
 import os
 import sys
 
@@ -17,10 +18,31 @@ ADMINS = (
 MANAGERS = ADMINS
 
 DATABASES = {'default': dj_database_url.config(default='postgres://localhost/ccbv')}
+# Set CBV_DB_POOL_SIZE to keep connections open between requests, up to that
+# many idle ones a process (one per thread of a worker) and for at most
+# CBV_DB_MAX_AGE seconds. Off by default: every process holds its connections
+# open, which a small database plan may not have room for. See cbv.backends.pool.
+POOLED_ENGINES = {
+    'django.db.backends.postgresql_psycopg2': 'cbv.backends.postgresql_psycopg2',
+    'django.db.backends.sqlite3': 'cbv.backends.sqlite3',
+}
+CBV_DB_POOL_SIZE = int(os.environ.get('CBV_DB_POOL_SIZE', 0))
+if CBV_DB_POOL_SIZE and DATABASES['default']['ENGINE'] in POOLED_ENGINES:
+    # South knows its adapters by the engine they're for.
+    SOUTH_DATABASE_ADAPTERS = {'default': 'south.db.' + DATABASES['default']['ENGINE'].split('.')[-1]}
+    DATABASES['default']['ENGINE'] = POOLED_ENGINES[DATABASES['default']['ENGINE']]
+    DATABASES['default']['POOL'] = {
+        'SIZE': CBV_DB_POOL_SIZE,
+        'MAX_AGE': int(os.environ.get('CBV_DB_MAX_AGE', 600)),
+        'CHECK_AFTER': float(os.environ.get('CBV_DB_CHECK_AFTER', 10)),
+    }
 ALLOWED_HOSTS = ('*',)
 
 
 CACHES = memcacheify()
+# Whether the web processes share the cache: without memcached, memcacheify
+# gives each its own, in memory.
+CBV_SHARED_CACHE = 'LocMemCache' not in CACHES['default']['BACKEND']
 
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
@@ -60,6 +82,50 @@ S3_URL = 'https://{0}.s3.amazonaws.com/'.format(AWS_STORAGE_BUCKET_NAME)
 # Example: "/home/media/media.lawrence.com/media/"
 MEDIA_ROOT = os.path.join(DIRNAME, 'client_media')
 
+# Where the downloadable bundle of each version is written.
+CBV_BUNDLE_ROOT = os.environ.get('CBV_BUNDLE_ROOT', os.path.join(DIRNAME, 'bundles'))
+
+# Count the queries each view runs (see cbv.instrumentation), and with
+# CBV_SQL_HEADERS also report them in X-SQL-* response headers.
+CBV_SQL_INSTRUMENTATION = bool(os.environ.get('CBV_SQL_INSTRUMENTATION', False))
+CBV_SQL_HEADERS = bool(os.environ.get('CBV_SQL_HEADERS', False))
+
+# How long the attributes and methods of class pages stay cached, in seconds.
+# Their keys are hashes of the content, so a new deploy or version never
+# sees a stale fragment; this only bounds how long unused ones linger.
+CBV_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('CBV_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24 * 30))
+
+# How long whole pages stay cached, in seconds; 0 turns the page cache off.
+# Populating or loading versions moves every page to a new key, but only in
+# a cache the web processes share, so it's off by default without one, and
+# when debugging.
+CBV_PAGE_CACHE_TIMEOUT = int(os.environ.get(
+    'CBV_PAGE_CACHE_TIMEOUT', 60 * 60 * 24 if CBV_SHARED_CACHE and not DEBUG else 0))
+# A page is rendered once at a time in each process; other requests for it get
+# an older copy or wait up to CBV_PAGE_CACHE_WAIT seconds for the render. With
+# CBV_PAGE_CACHE_LOCK, only one worker of all those sharing the cache renders.
+CBV_PAGE_CACHE_WAIT = float(os.environ.get('CBV_PAGE_CACHE_WAIT', 10))
+CBV_PAGE_CACHE_LOCK = bool(os.environ.get('CBV_PAGE_CACHE_LOCK', False))
+# After CBV_PAGE_CACHE_TIMEOUT, a page is still served for CBV_PAGE_CACHE_STALE
+# seconds while it's rendered again in the background, by at most
+# CBV_PAGE_CACHE_REVALIDATIONS threads at once in each process. Off by default
+# without a shared cache too, where a process would serve its stale pages past
+# a generation bump it never saw.
+CBV_PAGE_CACHE_STALE = int(os.environ.get('CBV_PAGE_CACHE_STALE', 60 * 60 if CBV_SHARED_CACHE else 0))
+CBV_PAGE_CACHE_REVALIDATIONS = int(os.environ.get('CBV_PAGE_CACHE_REVALIDATIONS', 2))
+
+# Where to purge pages from when populate_cbv, populate_cbv_versions or
+# fetch_docs_urls change them (see cbv.surrogates): nowhere, unless
+# CBV_PURGE_URL is set, eg. to https://api.fastly.com/service/<id>/purge with
+# {"Fastly-Key": "<token>"} as CBV_PURGE_HEADERS.
+CBV_PURGER = {'BACKEND': 'cbv.surrogates.NullPurger'}
+if os.environ.get('CBV_PURGE_URL'):
+    CBV_PURGER = {
+        'BACKEND': 'cbv.surrogates.HTTPPurger',
+        'URL': os.environ['CBV_PURGE_URL'],
+        'HEADERS': json.loads(os.environ.get('CBV_PURGE_HEADERS', '{}')),
+    }
+
 # URL that handles the media served from MEDIA_ROOT. Make sure to use a
 # trailing slash.
 # Examples: "http://media.lawrence.com/media/", "http://example.com/media/"
@@ -103,6 +169,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'cbv.instrumentation.SQLInstrumentationMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -5,7 +5,8 @@ from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.views.generic import TemplateView
 
-from cbv.views import HomeView, Sitemap
+from cbv.views import (BundleFileView, HomeView, KlassAPIView, PageCacheStatsView, SearchAPIView,
+    SearchView, Sitemap, SQLStatsView)
 
 
 admin.autodiscover()
@@ -16,6 +17,12 @@ urlpatterns = patterns('',
     url(r'^projects/', include('cbv.urls')),
     url(r'^admin/', include(admin.site.urls)),
     url(r'^sitemap\.xml$', Sitemap.as_view(), name='sitemap'),
+    url(r'^search/$', SearchView.as_view(), name='search'),
+    url(r'^search\.json$', SearchAPIView.as_view(), name='search-api'),
+    url(r'^stats/sql\.json$', SQLStatsView.as_view(), name='sql-stats'),
+    url(r'^stats/cache\.json$', PageCacheStatsView.as_view(), name='cache-stats'),
+    url(r'^bundles/(?P<filename>[\w.-]+)$', BundleFileView.as_view(), name='bundle-file'),
+    url(r'^api/(?P<package>[\w-]+)/(?P<version>[^/]+)/(?P<module>[\w\.]+)/(?P<klass>\w+)\.json$', KlassAPIView.as_view(), name='klass-api'),
     url(r'^', include('cbv.shortcut_urls'), {'package': 'Django'}),
 ) + staticfiles_urlpatterns() + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 